@@ -1,13 +1,55 @@
 from django.contrib import admin
-from .models import ContentGenre, ContentType, Post, Tag, Comments, Subscriber, Profile, WebsiteMeta
+from django.utils.html import format_html, format_html_join
+from .models import AuthorStats, AuthorVisitorSketch, ContentGenre, ContentType, Post, PostViewRollup, Tag, Comments, Subscriber, Profile, WebsiteMeta, SteamSyncJob, VisitorSketch
+from .view_events import views_over_time
+from .visitors import daily_visitors, unique_visitors
+
+
+def render_bar_chart(caption, series, date_format):
+    """Small inline bar chart of [(datetime or date, value)]"""
+    peak = max(value for _, value in series) or 1
+    bars = format_html_join(
+        '',
+        '<span title="{}: {}" style="flex:1;background:#79aec8;height:{}%;min-height:1px"></span>',
+        ((start.strftime(date_format), value, round(value * 100 / peak)) for start, value in series),
+    )
+    return format_html(
+        '<div><strong>{}</strong>'
+        '<div style="display:flex;align-items:flex-end;gap:1px;height:60px;width:480px">{}</div></div>',
+        caption, bars,
+    )
+
+
+def render_views_over_time(**filters):
+    """Bar charts of the last 48 hours and 30 days of views, read from the rollups"""
+    charts = []
+    for period, count, label, date_format in (
+        (PostViewRollup.HOUR, 48, 'Last 48 hours', '%b %d %H:00'),
+        (PostViewRollup.DAY, 30, 'Last 30 days', '%b %d'),
+    ):
+        series = views_over_time(period, count, **filters)
+        caption = f"{label} ({sum(views for _, views in series)} views, peak {max(views for _, views in series)})"
+        charts.append(render_bar_chart(caption, series, date_format))
+    return format_html_join('', '{}', ((chart,) for chart in charts))
+
+
+def render_unique_visitors(sketches):
+    """Estimated distinct visitors from a queryset of sketches, with a daily chart"""
+    series = daily_visitors(sketches, 30)
+    caption = (
+        f"~{unique_visitors(sketches)} all time, ~{unique_visitors(sketches, since=series[0][0])} "
+        f"in the last 30 days (daily below)"
+    )
+    return render_bar_chart(caption, series, '%b %d')
+
 
 # Register your models here.
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'get_content_type', 'get_content_genre', 'created_at', 'view_count', 'is_featured']
+    list_display = ['title', 'author', 'get_content_type', 'get_content_genre', 'created_at', 'view_count', 'unique_viewers', 'like_count', 'comment_count', 'is_featured']
     list_filter = ['created_at', 'is_featured', 'content_type', 'content_genre']
     search_fields = ['title', 'content', 'author__username']
-    readonly_fields = ['slug', 'created_at', 'last_modified', 'view_count']
+    readonly_fields = ['slug', 'created_at', 'last_modified', 'view_count', 'like_count', 'bookmark_count', 'comment_count', 'trending_score', 'unique_viewers', 'views_over_time', 'unique_visitors']
     filter_horizontal = ['tags', 'likes', 'bookmarks']
     
     fieldsets = (
@@ -25,10 +67,25 @@ class PostAdmin(admin.ModelAdmin):
             'fields': ('tags', 'likes', 'bookmarks')
         }),
         ('Statistics', {
-            'fields': ('view_count', 'created_at', 'last_modified'),
+            'fields': ('view_count', 'like_count', 'bookmark_count', 'comment_count', 'trending_score', 'unique_viewers', 'created_at', 'last_modified'),
             'classes': ('collapse',)
         }),
+        ('Traffic', {
+            'fields': ('views_over_time', 'unique_visitors'),
+        }),
     )
+
+    def views_over_time(self, obj):
+        if obj.pk is None:
+            return '-'
+        return render_views_over_time(post_id=obj.pk)
+    views_over_time.short_description = 'Views over time'
+
+    def unique_visitors(self, obj):
+        if obj.pk is None:
+            return '-'
+        return render_unique_visitors(VisitorSketch.objects.filter(post_id=obj.pk))
+    unique_visitors.short_description = 'Unique visitors'
     
     def get_content_type(self, obj):
         return obj.content_type.display_name if obj.content_type else '-'
@@ -114,4 +171,31 @@ class ContentGenreAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not change:  # Creating new genre
             obj.created_by = request.user
-        super().save_model(request, obj, form, change)
\ No newline at end of file
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(SteamSyncJob)
+class SteamSyncJobAdmin(admin.ModelAdmin):
+    list_display = ['user', 'steam_id', 'status', 'attempts', 'run_after', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username', 'steam_id']
+    readonly_fields = ['created_at', 'started_at', 'finished_at',
+                       'games_inserted', 'games_updated', 'games_removed']
+
+
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(admin.ModelAdmin):
+    # Maintained by app/author_stats.py; `manage.py rebuild_author_stats` fixes drift
+    list_display = ['user', 'post_count', 'total_views', 'likes_received', 'unique_visitors', 'last_post_at']
+    ordering = ['-post_count', 'user']
+    search_fields = ['user__username']
+    readonly_fields = ['user', 'post_count', 'total_views', 'likes_received', 'unique_visitors', 'last_post_at', 'views_over_time', 'visitors_over_time']
+
+    def views_over_time(self, obj):
+        return render_views_over_time(post__author_id=obj.user_id)
+    views_over_time.short_description = 'Views over time'
+
+    def visitors_over_time(self, obj):
+        # The author's own sketches, so a reader of several posts counts once
+        return render_unique_visitors(AuthorVisitorSketch.objects.filter(user_id=obj.user_id))
+    visitors_over_time.short_description = 'Visitors over time'
@@ -9,4 +9,5 @@ class AppConfig(AppConfig):
         """
         Import signals when app is ready
         """
-        import app.models  # This loads the signals
\ No newline at end of file
+        import app.models  # This loads the signals
+        import app.signals
\ No newline at end of file
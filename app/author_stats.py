@@ -0,0 +1,118 @@
+"""
+Maintenance of the AuthorStats materialization.
+
+Each author's post count, total views, likes received, last post time and
+unique visitors are kept in one AuthorStats row. Likes and views are applied as F() deltas
+from the like signal handlers in app/signals.py and from the view count
+flush in app/view_counter.py, unique visitors by the visitor flush in
+app/visitors.py. New posts bump the count in place; deleted or
+reassigned posts rebuild their author's row, which is cheap for one author
+and keeps last_post_at exact. `manage.py rebuild_author_stats` recomputes
+every row after writes that bypass these paths.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, AuthorVisitorSketch, Post
+
+
+def rebuild_author_stats(user_ids):
+    """
+    Recompute the stats of the given users from their posts. Users without
+    posts lose their row. Returns the number of rows written.
+    """
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if not user_ids:
+        return 0
+    rows = [
+        AuthorStats(user_id=row.pop('author_id'), **row)
+        for row in Post.objects.filter(author_id__in=user_ids)
+        .order_by().values('author_id')
+        .annotate(
+            post_count=Count('pk'),
+            total_views=Coalesce(Sum('view_count'), 0),
+            likes_received=Coalesce(Sum('like_count'), 0),
+            last_post_at=Max('created_at'),
+        )
+    ]
+    visitors = dict(
+        AuthorVisitorSketch.objects.filter(user_id__in=user_ids, day__isnull=True).values_list('user_id', 'visitors')
+    )
+    for row in rows:
+        row.unique_visitors = visitors.get(row.user_id, 0)
+    AuthorStats.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['post_count', 'total_views', 'likes_received', 'last_post_at', 'unique_visitors'],
+    )
+    written = {row.user_id for row in rows}
+    AuthorStats.objects.filter(user_id__in=[user_id for user_id in user_ids if user_id not in written]).delete()
+    return len(rows)
+
+
+def bump_author_stats(user_ids, field, delta):
+    """Atomically add delta to a stats column, never going below zero"""
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if not user_ids or not delta:
+        return
+    if delta > 0:
+        expression = F(field) + delta
+    else:
+        expression = Greatest(F(field) + delta, Value(0))
+    AuthorStats.objects.filter(user_id__in=user_ids).update(**{field: expression})
+
+
+def bump_by_post(post_deltas, field):
+    """
+    Add per-post deltas ({post_id: delta}) to the stats of the posts'
+    authors, with one UPDATE per distinct author delta.
+    """
+    per_author = Counter()
+    for post_id, author_id in Post.objects.filter(pk__in=post_deltas.keys()).values_list('pk', 'author_id'):
+        if author_id is not None:
+            per_author[author_id] += post_deltas[post_id]
+
+    by_delta = defaultdict(list)
+    for author_id, delta in per_author.items():
+        by_delta[delta].append(author_id)
+    for delta, author_ids in by_delta.items():
+        bump_author_stats(author_ids, field, delta)
+
+
+def add_post(post):
+    """Count a newly created post, creating its author's row if needed"""
+    if post.author_id is None:
+        return
+    created_at = Value(post.created_at)
+    updated = AuthorStats.objects.filter(user_id=post.author_id).update(
+        post_count=F('post_count') + 1,
+        last_post_at=Greatest(Coalesce(F('last_post_at'), created_at), created_at),
+    )
+    if not updated:
+        rebuild_author_stats([post.author_id])
+
+
+def track_likes(through, instance, action, reverse, pk_set):
+    """
+    Apply a change to Post.likes to likes_received. Authors are looked up
+    by post id, as the toggles in app/engagement.py send a bare Post(pk=...).
+    """
+    if action in ('post_add', 'post_remove'):
+        sign = 1 if action == 'post_add' else -1
+        if not reverse:
+            bump_by_post({instance.pk: sign * len(pk_set)}, 'likes_received')
+            return
+        post_ids = pk_set
+    elif action == 'pre_clear':
+        # Counted before the rows are gone
+        sign = -1
+        if not reverse:
+            bump_by_post({instance.pk: -through.objects.filter(post_id=instance.pk).count()}, 'likes_received')
+            return
+        post_ids = through.objects.filter(user_id=instance.pk).values_list('post_id', flat=True)
+    else:
+        return
+    bump_by_post({post_id: sign for post_id in post_ids}, 'likes_received')
@@ -0,0 +1,93 @@
+"""
+Threaded comment loader for post_page.
+
+All comments of a post are read with one query over the (post, date) index
+and nested in memory, so rendering no longer runs comment.replies.all per
+thread. Only the comments belonging to the requested page of top-level
+threads are kept; the rest are streamed past and only counted, which keeps
+memory bounded on posts with thousands of comments.
+"""
+from django.conf import settings
+from django.core.paginator import EmptyPage, Paginator
+
+from .models import Comments
+
+
+class CommentTree:
+    """
+    Result of load_comment_tree.
+    page     - Page of top-level comments, each with a `children` list
+    total    - number of comments on the post, replies included
+    """
+
+    def __init__(self, page, total):
+        self.page = page
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.page)
+
+    def __len__(self):
+        return len(self.page)
+
+
+def _page_number(number):
+    try:
+        number = int(number)
+    except (TypeError, ValueError):
+        return 1
+    return max(number, 1)
+
+
+def load_comment_tree(post, page=1, per_page=None):
+    """
+    Load one page of top-level comment threads for a post, nested to any depth.
+    Invalid page numbers fall back to the first page and pages past the end
+    fall back to the last one, like Paginator.get_page.
+    """
+    per_page = per_page or getattr(settings, 'COMMENT_THREADS_PER_PAGE', 20)
+    number = _page_number(page)
+    first, last = (number - 1) * per_page, number * per_page
+
+    thread_of = {}  # comment id -> index of its top-level thread
+    nodes = {}      # comment id -> Comments, only for threads on this page
+    threads = []
+    thread_count = 0
+    total = 0
+
+    comments = (
+        Comments.objects
+        .filter(post=post)
+        .only('id', 'parent_id', 'name', 'date', 'content')
+        .order_by('date', 'id')
+    )
+    # Replies are always created after their parent, so a parent is seen
+    # before any of its children in (date, id) order.
+    for comment in comments.iterator(chunk_size=500):
+        total += 1
+        thread = thread_of.get(comment.parent_id)
+        if thread is None:
+            # Top-level comment, or a reply whose parent no longer exists
+            thread = thread_count
+            thread_count += 1
+        thread_of[comment.id] = thread
+
+        if not first <= thread < last:
+            continue
+
+        comment.children = []
+        nodes[comment.id] = comment
+        parent = nodes.get(comment.parent_id)
+        if parent is not None:
+            parent.children.append(comment)
+        else:
+            threads.append(comment)
+
+    paginator = Paginator(range(thread_count), per_page)
+    try:
+        comment_page = paginator.page(number)
+    except EmptyPage:
+        return load_comment_tree(post, paginator.num_pages, per_page)
+    comment_page.object_list = threads
+
+    return CommentTree(comment_page, total)
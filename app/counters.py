@@ -0,0 +1,67 @@
+"""
+Helpers for denormalized counters: Post's engagement counters
+(like_count, bookmark_count, comment_count) and ContentGenre.post_count.
+
+bump_counter() and bump_genre_count() are used by the signal handlers in
+app/signals.py for incremental changes; recount_counters() and
+recount_genre_counts() recompute the exact values and are used by
+`manage.py reconcile_post_counters` and `manage.py recount_genre_posts`
+after drift.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comments, ContentGenre, Post
+
+
+def bump_counter(post_ids, field, delta):
+    """Atomically add delta to a counter column, never going below zero"""
+    if not post_ids or not delta:
+        return
+    if delta > 0:
+        expression = F(field) + delta
+    else:
+        expression = Greatest(F(field) + delta, Value(0))
+    Post.objects.filter(pk__in=post_ids).update(**{field: expression})
+
+
+def _count_subquery(queryset):
+    counted = queryset.order_by().values('post_id').annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def recount_counters(post_ids):
+    """
+    Recompute the counters of the given posts with a single UPDATE.
+    Returns the number of posts updated.
+    """
+    return Post.objects.filter(pk__in=post_ids).update(
+        like_count=_count_subquery(Post.likes.through.objects.filter(post_id=OuterRef('pk'))),
+        bookmark_count=_count_subquery(Post.bookmarks.through.objects.filter(post_id=OuterRef('pk'))),
+        comment_count=_count_subquery(Comments.objects.filter(post_id=OuterRef('pk'))),
+    )
+
+
+def bump_genre_count(genre_id, delta):
+    """Atomically add delta to ContentGenre.post_count, never going below zero"""
+    if genre_id is None or not delta:
+        return
+    if delta > 0:
+        expression = F('post_count') + delta
+    else:
+        expression = Greatest(F('post_count') + delta, Value(0))
+    ContentGenre.objects.filter(pk=genre_id).update(post_count=expression)
+
+
+def recount_genre_counts(genre_ids):
+    """
+    Recompute ContentGenre.post_count for the given genres with a single
+    UPDATE. Returns the number of genres updated.
+    """
+    counted = (
+        Post.objects.filter(content_genre_id=OuterRef('pk'))
+        .order_by().values('content_genre_id').annotate(n=Count('*')).values('n')
+    )
+    return ContentGenre.objects.filter(pk__in=genre_ids).update(
+        post_count=Coalesce(Subquery(counted, output_field=IntegerField()), Value(0)),
+    )
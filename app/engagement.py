@@ -0,0 +1,58 @@
+"""
+Like/bookmark toggles.
+
+A toggle is a single DELETE on the through table, followed by an INSERT only
+when nothing was deleted, inside one transaction. The matching m2m_changed
+signal is sent only when a row really changed, with the same arguments
+Django's related manager would use, so the handlers in app/signals.py keep
+the denormalized counters right without a separate code path.
+"""
+from django.db import IntegrityError, router, transaction
+from django.db.models.signals import m2m_changed
+
+from .models import Post
+
+
+def _toggle(field, post_id, user_id):
+    """
+    Flip the relation between a post and a user.
+    Returns (is_set, count) where count is the post's updated counter.
+    """
+    through = getattr(Post, field).through
+    counter = {'likes': 'like_count', 'bookmarks': 'bookmark_count'}[field]
+    using = router.db_for_write(through)
+
+    with transaction.atomic(using=using):
+        deleted, _ = through.objects.filter(post_id=post_id, user_id=user_id).delete()
+        if deleted:
+            action, is_set = 'post_remove', False
+        else:
+            try:
+                with transaction.atomic(using=using):
+                    through.objects.create(post_id=post_id, user_id=user_id)
+                action, is_set = 'post_add', True
+            except IntegrityError:
+                # A concurrent request inserted the same row first
+                action, is_set = None, True
+
+        if action:
+            m2m_changed.send(
+                sender=through,
+                instance=Post(pk=post_id),
+                action=action,
+                reverse=False,
+                model=through._meta.get_field('user').related_model,
+                pk_set={user_id},
+                using=using,
+            )
+        count = Post.objects.filter(pk=post_id).values_list(counter, flat=True).get()
+
+    return is_set, count
+
+
+def toggle_like(post_id, user_id):
+    return _toggle('likes', post_id, user_id)
+
+
+def toggle_bookmark(post_id, user_id):
+    return _toggle('bookmarks', post_id, user_id)
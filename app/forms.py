@@ -5,6 +5,7 @@ from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from .reference_data import get_content_types
 
 class SteamIDForm(forms.ModelForm):
     """
@@ -81,6 +82,17 @@ class PostForm(forms.ModelForm):
         help_text="Select tags for this post (optional)"
     )
     
+    # Choices are filled in __init__ from the per-process reference cache,
+    # so building or validating the form doesn't query ContentType
+    content_type = forms.ChoiceField(
+        required=False,
+        widget=forms.Select(attrs={
+            'class': 'form-control',
+            'id': 'id_content_type',
+        }),
+        help_text="Type of content this post is about"
+    )
+    
     # New genre field - will be populated dynamically
     content_genre_new = forms.CharField(
         max_length=100,
@@ -114,10 +126,6 @@ class PostForm(forms.ModelForm):
             'is_featured': forms.CheckboxInput(attrs={
                 'class': 'form-check-input',
             }),
-            'content_type': forms.Select(attrs={
-                'class': 'form-control',
-                'id': 'id_content_type',
-            }),
             'content_genre': forms.Select(attrs={
                 'class': 'form-control',
                 'id': 'id_content_genre',
@@ -126,6 +134,10 @@ class PostForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.content_types = {str(content_type.pk): content_type for content_type in get_content_types()}
+        self.fields['content_type'].choices = [('', '---------')] + [
+            (pk, str(content_type)) for pk, content_type in self.content_types.items()
+        ]
         
         # Empty by default
         self.fields['content_genre'].queryset = ContentGenre.objects.none()
@@ -145,6 +157,10 @@ class PostForm(forms.ModelForm):
                 content_type=self.instance.content_type
             ).order_by('name')
     
+    def clean_content_type(self):
+        # ChoiceField has already checked the pk is one of the choices
+        return self.content_types.get(self.cleaned_data['content_type'])
+    
     def clean(self):
         cleaned_data = super().clean()
         content_type = cleaned_data.get('content_type')
@@ -0,0 +1,77 @@
+"""
+Cached genre lists for the create-post genre dropdown.
+
+The genres of one content type are read from the Django cache under
+genres:<content_type_id>, together with an ETag computed from the list, so
+the api_genres view can answer repeat requests with 304 Not Modified. The
+create_post view embeds the lists of every content type in the page, so
+switching content type in the form needs no round-trip at all.
+
+Entries are dropped by the ContentGenre signal handlers in app/signals.py
+whenever a genre of that content type is added, renamed or deleted.
+post_count is not part of the lists, so counter updates leave them alone.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ContentGenre
+from .reference_data import get_content_types
+
+
+def _cache_key(content_type_id):
+    return f'genres:{content_type_id}'
+
+
+def _load(content_type_ids):
+    genres = {content_type_id: [] for content_type_id in content_type_ids}
+    rows = (
+        ContentGenre.objects.filter(content_type_id__in=content_type_ids)
+        .order_by('content_type_id', 'name')
+        .values('id', 'name', 'content_type_id')
+    )
+    for row in rows:
+        genres[row.pop('content_type_id')].append(row)
+    return {
+        content_type_id: {
+            'genres': items,
+            'etag': '"%s"' % hashlib.md5(json.dumps(items).encode()).hexdigest(),
+        }
+        for content_type_id, items in genres.items()
+    }
+
+
+def get_genre_entries(content_type_ids):
+    """
+    {content_type_id: {'genres': [{'id', 'name'}, ...], 'etag': ...}} for
+    the given content types, loading any missing ones in one query.
+    """
+    keys = {_cache_key(content_type_id): content_type_id for content_type_id in content_type_ids}
+    found = cache.get_many(keys)
+    entries = {keys[key]: entry for key, entry in found.items()}
+
+    missing = [content_type_id for key, content_type_id in keys.items() if key not in found]
+    if missing:
+        loaded = _load(missing)
+        cache.set_many(
+            {_cache_key(content_type_id): entry for content_type_id, entry in loaded.items()},
+            getattr(settings, 'GENRE_CACHE_TIMEOUT', 3600),
+        )
+        entries.update(loaded)
+    return entries
+
+
+def get_genres(content_type_id):
+    return get_genre_entries([content_type_id])[content_type_id]
+
+
+def get_genre_map():
+    """Genre lists of every content type, keyed by content type id"""
+    entries = get_genre_entries([content_type.pk for content_type in get_content_types()])
+    return {content_type_id: entry['genres'] for content_type_id, entry in entries.items()}
+
+
+def invalidate_genres(content_type_id):
+    cache.delete(_cache_key(content_type_id))
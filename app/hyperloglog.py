@@ -0,0 +1,78 @@
+"""
+HyperLogLog cardinality sketch.
+
+Estimates the number of distinct values added to it in a fixed amount of
+memory: 2**precision one-byte registers, 4 KB at the default precision of
+12, for a standard error of 1.04 / sqrt(4096), about 1.6%, no matter how
+many values are added. Sketches of the same precision merge losslessly by
+taking the maximum of each register, so per-day or per-worker sketches can
+be combined into the sketch of their union.
+
+Serialized sketches are a precision byte followed by the zlib-compressed
+registers, so sketches of posts with few visitors take a few dozen bytes.
+"""
+import hashlib
+import math
+import zlib
+
+DEFAULT_PRECISION = 12
+
+
+def hash_value(value):
+    """64-bit hash of a string, the input of HyperLogLog.add_hash()"""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"precision must be between 4 and 16, not {precision}")
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            registers = bytearray(self.size)
+        elif len(registers) != self.size:
+            raise ValueError(f"expected {self.size} registers, got {len(registers)}")
+        self.registers = bytearray(registers)
+
+    def add(self, value):
+        self.add_hash(hash_value(value))
+
+    def add_hash(self, hashed):
+        """Add a value by its 64-bit hash"""
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rest = hashed & ((1 << bits) - 1)
+        # Position of the leftmost 1 in the remaining bits
+        rank = bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Fold another sketch into this one; afterwards it counts their union"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimated number of distinct values added"""
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        # Linear counting is more accurate while many registers are empty
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_bytes(self):
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        data = bytes(data)
+        return cls(precision=data[0], registers=zlib.decompress(data[1:]))
@@ -0,0 +1,132 @@
+"""
+Responsive variants of uploaded images.
+
+Cards and sidebars used to load the full-size upload for every thumbnail.
+When a Post.image or Profile.avatar is saved, generate_variants() writes
+downscaled WebP and JPEG copies next to it under variants/, one per width
+in VARIANT_WIDTHS that is not wider than the original, and records them on
+the model (Post.image_variants / Profile.avatar_variants) together with a
+~16px blurred JPEG placeholder as a data URI, so it can be inlined in the
+page while the real image loads.
+
+The manifest stores the name of the image it was built from; a manifest
+whose source differs from the current file is stale and treated as empty,
+so templates fall back to the original until the variants are rebuilt
+(app/signals.py on save, `manage.py build_image_variants` for backfills).
+The variants of the previous image are deleted once the new manifest is
+saved. A file that can't be read gets a manifest with no widths, so it
+isn't opened again on every save; templates show the original.
+"""
+import base64
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError
+
+VARIANT_WIDTHS = {
+    'post': (400, 800, 1600),
+    'avatar': (96, 192),
+}
+VARIANT_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+PLACEHOLDER_WIDTH = 16
+
+
+def variant_name(source_name, width, extension):
+    stem, _ = os.path.splitext(source_name)
+    return f'variants/{stem}-{width}w.{extension}'
+
+
+def manifest_for(field_file, manifest):
+    """The manifest if it was built from the field's current file, else None"""
+    if field_file and manifest and manifest.get('source') == field_file.name:
+        return manifest
+    return None
+
+
+def _placeholder(image):
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def generate_variants(field_file, kind):
+    """
+    Write the variants of an image file and return its manifest: {} without
+    a file, and one with no widths if the file is missing or not an image
+    Pillow can read.
+    """
+    if not field_file:
+        return {}
+    try:
+        with field_file.open('rb') as f:
+            source = Image.open(f)
+            source.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError):
+        return {'source': field_file.name, 'widths': []}
+
+    source = ImageOps.exif_transpose(source).convert('RGB')
+    widths = [width for width in VARIANT_WIDTHS[kind] if width < source.width] or [source.width]
+
+    for width in widths:
+        height = max(1, round(source.height * width / source.width))
+        resized = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+        for extension, pil_format, options in VARIANT_FORMATS:
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            name = variant_name(field_file.name, width, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    return {
+        'source': field_file.name,
+        'width': source.width,
+        'height': source.height,
+        'widths': widths,
+        'placeholder': _placeholder(source),
+    }
+
+
+def delete_variants(manifest):
+    """Delete the variant files listed in a manifest"""
+    for width in manifest.get('widths', ()):
+        for extension, _, _ in VARIANT_FORMATS:
+            default_storage.delete(variant_name(manifest['source'], width, extension))
+
+
+def delete_replaced_variants(old, new):
+    """Delete the variants of `old` if `new` was built from another image"""
+    if old and old.get('source') != new.get('source'):
+        delete_variants(old)
+
+
+def refresh_variants(instance, field_name, kind):
+    """
+    Rebuild the variants of an instance's image field if its manifest is
+    stale, saving the manifest with update() so no save signals fire again,
+    and delete the variants of the image it replaced.
+    """
+    field_file = getattr(instance, field_name)
+    manifest_field = f'{field_name}_variants'
+    current = getattr(instance, manifest_field)
+    if manifest_for(field_file, current) is not None:
+        return
+    manifest = generate_variants(field_file, kind)
+    if manifest != current:
+        type(instance).objects.filter(pk=instance.pk).update(**{manifest_field: manifest})
+        setattr(instance, manifest_field, manifest)
+        delete_replaced_variants(current, manifest)
+
+
+def srcset(source_name, manifest, extension):
+    return ', '.join(
+        f'{default_storage.url(variant_name(source_name, width, extension))} {width}w'
+        for width in manifest['widths']
+    )
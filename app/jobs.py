@@ -0,0 +1,136 @@
+"""
+Database-backed job queue for Steam syncs.
+
+The sync_steam view only inserts a SteamSyncJob row and returns; the Steam
+API call and the SteamGame upsert run in `manage.py run_steam_worker`.
+
+A worker claims a job with a compare-and-set UPDATE (status queued ->
+running), so several workers can poll the same table without running a job
+twice. Failed attempts whose error is retryable are put back in the queue
+with exponential backoff; the others, and jobs out of attempts, end as
+failed. Jobs left running by a worker that died are handed back to the
+queue once their lease (STEAM_SYNC_JOB_LEASE seconds) runs out.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Profile, SteamSyncJob
+from .steam import fetch_steam_games, sync_steam_games
+from .steam_client import SteamAPIError
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_steam_sync(user, steam_id):
+    """
+    Queue a sync of the user's games, reusing a job for the same Steam ID
+    that is still queued or running. Returns (job, created).
+    """
+    job = (
+        SteamSyncJob.objects
+        .filter(user=user, steam_id=steam_id, status__in=SteamSyncJob.ACTIVE_STATUSES)
+        .first()
+    )
+    if job:
+        return job, False
+    return SteamSyncJob.objects.create(user=user, steam_id=steam_id), True
+
+
+def claim_next_job():
+    """Mark the next due job as running and return it, or None if there is none"""
+    while True:
+        now = timezone.now()
+        job_id = (
+            SteamSyncJob.objects
+            .filter(status=SteamSyncJob.STATUS_QUEUED, run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = SteamSyncJob.objects.filter(pk=job_id, status=SteamSyncJob.STATUS_QUEUED).update(
+            status=SteamSyncJob.STATUS_RUNNING,
+            attempts=F('attempts') + 1,
+            started_at=now,
+        )
+        if claimed:
+            return SteamSyncJob.objects.select_related('user').get(pk=job_id)
+        # Another worker claimed it first, try the next one
+
+
+def requeue_stale_jobs():
+    """
+    Hand running jobs whose lease has expired back to the queue, or fail
+    them when they are out of attempts. Returns the number of jobs touched.
+    """
+    lease = getattr(settings, 'STEAM_SYNC_JOB_LEASE', 300)
+    now = timezone.now()
+    stale = SteamSyncJob.objects.filter(
+        status=SteamSyncJob.STATUS_RUNNING,
+        started_at__lt=now - timedelta(seconds=lease),
+    )
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(
+        status=SteamSyncJob.STATUS_QUEUED,
+        run_after=now,
+        last_error='Worker stopped before the sync finished',
+    )
+    failed = stale.update(
+        status=SteamSyncJob.STATUS_FAILED,
+        finished_at=now,
+        last_error='Worker stopped before the sync finished',
+    )
+    return requeued + failed
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after `attempts` failed ones"""
+    base = getattr(settings, 'STEAM_SYNC_RETRY_BASE_DELAY', 30)
+    cap = getattr(settings, 'STEAM_SYNC_RETRY_MAX_DELAY', 3600)
+    delay = min(base * 2 ** (attempts - 1), cap)
+    # Spread retries out so failed jobs don't hit Steam again in lockstep
+    return delay + random.uniform(0, delay / 10)
+
+
+def _fail(job, error, retryable):
+    now = timezone.now()
+    if retryable and job.attempts < job.max_attempts:
+        job.status = SteamSyncJob.STATUS_QUEUED
+        job.run_after = now + timedelta(seconds=retry_delay(job.attempts))
+    else:
+        job.status = SteamSyncJob.STATUS_FAILED
+        job.finished_at = now
+    job.last_error = error
+    job.save(update_fields=['status', 'run_after', 'finished_at', 'last_error'])
+
+
+def run_job(job):
+    """Run one claimed job and record its outcome on the row"""
+    try:
+        games = fetch_steam_games(job.steam_id)
+        result = sync_steam_games(job.user, games)
+    except SteamAPIError as e:
+        _fail(job, str(e), e.retryable)
+        return job
+    except Exception as e:
+        logger.exception("Steam sync job %s failed", job.pk)
+        _fail(job, f'❌ Unexpected error: {e}', retryable=True)
+        return job
+
+    now = timezone.now()
+    job.status = SteamSyncJob.STATUS_SUCCEEDED
+    job.finished_at = now
+    job.last_error = ''
+    job.games_inserted = result.inserted
+    job.games_updated = result.updated
+    job.games_removed = result.removed
+    job.save(update_fields=[
+        'status', 'finished_at', 'last_error', 'games_inserted', 'games_updated', 'games_removed',
+    ])
+    Profile.objects.filter(user_id=job.user_id).update(last_sync_time=now)
+    return job
@@ -0,0 +1,325 @@
+import json
+import math
+import os
+import time
+import tracemalloc
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from app import urls as app_urls
+from app.management.commands.seed_benchmark import USERNAME_PREFIX
+from app.models import AuthorStats, ContentType, Post, SteamGame, Tag
+from app.steam_artwork import _store_sizes, artwork_name
+from app.trending import trending_buffer
+from app.view_counter import view_counter
+from app.view_events import view_log
+from app.visitors import visitor_buffer
+from portfolio import urls as portfolio_urls
+
+DEFAULT_THRESHOLDS = settings.BASE_DIR / 'benchmarks' / 'view_thresholds.json'
+
+# How each named URL is requested: (method, sample kwargs, logged in, query string).
+# Sample kwargs name an entry of Command.samples().
+REQUESTS = {
+    'app:home': ('GET', None, False, ''),
+    'app:post_page': ('GET', 'post', False, ''),
+    'app:tag_page': ('GET', 'tag', False, ''),
+    'app:author_page': ('GET', 'author', False, ''),
+    'app:search': ('GET', None, False, 'q=game+review'),
+    'app:about': ('GET', None, False, ''),
+    'app:register': ('GET', None, False, ''),
+    'app:all_post': ('GET', None, False, ''),
+    'app:api_genres': ('GET', None, False, 'content_type={content_type}'),
+    'app:steam_artwork': ('GET', 'artwork', False, ''),
+    'app:all_bookmarked_post': ('GET', None, True, ''),
+    'app:your_post': ('GET', None, True, ''),
+    'app:liked_post': ('GET', None, True, ''),
+    'app:create_post': ('GET', None, True, ''),
+    'app:my_profile': ('GET', None, True, ''),
+    'app:edit_profile': ('GET', None, True, ''),
+    'app:recently_played': ('GET', None, True, ''),
+    'app:content_sync': ('GET', None, True, ''),
+    'app:steam_sync_status': ('GET', None, True, ''),
+    # Redirects without a POST, so no sync is queued
+    'app:sync_steam': ('GET', None, True, ''),
+    # The like/bookmark toggles flip back and forth between iterations
+    'app:like_post': ('GET', 'post', True, ''),
+    'app:bookmark_post': ('GET', 'post', True, ''),
+    'app:api_like_post': ('POST', 'post', True, ''),
+    'app:api_bookmark_post': ('POST', 'post', True, ''),
+    'portfolio:home': ('GET', None, False, ''),
+    'portfolio:projects': ('GET', None, False, ''),
+    'portfolio:about': ('GET', None, False, ''),
+}
+
+
+# Write-behind buffers fed by the requests above. They are flushed between
+# requests, and their timers are pushed out of reach while measuring, so a
+# flush never lands inside a timed request and skews its query count.
+BUFFERS = (view_counter, trending_buffer, view_log, visitor_buffer)
+NO_TIMED_FLUSH = {
+    name: 10 ** 9
+    for prefix in ('VIEW_COUNT', 'TRENDING', 'VIEW_EVENT', 'VISITOR')
+    for name in (f'{prefix}_FLUSH_INTERVAL', f'{prefix}_FLUSH_THRESHOLD')
+}
+
+
+def flush_buffers():
+    for buffer in BUFFERS:
+        buffer.flush()
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every URL of app.urls and portfolio.urls through the test client and "
+        "report latency percentiles, query counts and peak memory as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=30,
+            help='Timed requests per URL (default: 30)',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Untimed requests per URL before timing (default: 3)',
+        )
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Keep the cache between requests instead of clearing it, so cached pages are measured as hits',
+        )
+        parser.add_argument(
+            '--only', nargs='*', default=None,
+            help='URL names to run, e.g. app:home app:post_page',
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument(
+            '--thresholds', default=str(DEFAULT_THRESHOLDS),
+            help='Thresholds file checked after the run (default: benchmarks/view_thresholds.json)',
+        )
+        parser.add_argument(
+            '--no-check', action='store_true',
+            help='Only report, do not compare against the thresholds',
+        )
+        parser.add_argument(
+            '--write-thresholds', action='store_true',
+            help='Save this run, with headroom, as the new thresholds',
+        )
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false', dest='interactive',
+            help='Do not ask for confirmation before clearing the cache and writing to the database',
+        )
+
+    def handle(self, *args, **options):
+        if options['interactive']:
+            answer = input(
+                f"This clears the cache ({settings.CACHES['default']['BACKEND']}) between requests and "
+                f"toggles likes and bookmarks of generated posts in {settings.DATABASES['default']['NAME']}.\n"
+                "Only run it against a benchmark database. Type 'yes' to continue: "
+            )
+            if answer != 'yes':
+                raise CommandError("Benchmark cancelled.")
+
+        samples = self.samples()
+        requests = self.requests(samples, options['only'])
+
+        # Errors are reported as 500s instead of aborting the run
+        user_client = Client(raise_request_exception=False)
+        user_client.force_login(samples['user'])
+        clients = {False: Client(raise_request_exception=False), True: user_client}
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], **NO_TIMED_FLUSH):
+            try:
+                for name, (method, url, logged_in) in requests.items():
+                    self.stderr.write(f"{name} {method} {url}")
+                    results[name] = self.measure(clients[logged_in], method, url, options)
+            finally:
+                flush_buffers()
+
+        skipped = sorted(set(self.url_names()) - set(REQUESTS))
+        report = {
+            'iterations': options['iterations'],
+            'warm_cache': options['warm_cache'],
+            'posts': Post.objects.count(),
+            'views': results,
+            'skipped': skipped,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        for name in skipped:
+            self.stderr.write(self.style.WARNING(f"No benchmark request defined for {name}"))
+
+        if options['write_thresholds']:
+            self.write_thresholds(options['thresholds'], results)
+        elif not options['no_check']:
+            self.check_thresholds(options['thresholds'], results)
+
+    def url_names(self):
+        for module in (app_urls, portfolio_urls):
+            for pattern in module.urlpatterns:
+                if pattern.name:
+                    yield f'{module.app_name}:{pattern.name}'
+
+    def samples(self):
+        """
+        The rows the benchmark requests point at: the busiest post, tag
+        and author, and a Steam user whose games are shown. The post whose
+        likes are toggled and the logged in user are generated ones.
+        """
+        generated = {'author__username__startswith': USERNAME_PREFIX}
+        post = Post.objects.filter(**generated).order_by('-comment_count', 'pk').first()
+        tag = Tag.objects.order_by('pk').filter(posts__isnull=False).first()
+        stats = AuthorStats.objects.select_related('user__profile').order_by('-post_count', 'user').first()
+        game = SteamGame.objects.select_related('user').filter(
+            user__username__startswith=USERNAME_PREFIX,
+        ).exclude(
+            Q(img_logo_url__isnull=True) | Q(img_logo_url='')
+        ).order_by('pk').first()
+        content_type = ContentType.objects.order_by('pk').first()
+        if not (post and tag and stats and game and content_type):
+            raise CommandError("Not enough data to benchmark; run `manage.py seed_benchmark` first.")
+
+        # Stored up front so steam_artwork never downloads from Steam
+        if not all(self.artwork_exists(game, size) for size in ('logo', 'icon')):
+            buffer = BytesIO()
+            Image.new('RGB', (184, 69), (40, 60, 90)).save(buffer, 'JPEG')
+            _store_sizes(game.appid, game.img_logo_url, buffer.getvalue())
+
+        return {
+            'post': {'slug': post.slug},
+            'tag': {'slug': tag.slug},
+            'author': {'slug': stats.user.profile.slug},
+            'artwork': {'appid': game.appid, 'image_hash': game.img_logo_url, 'size': 'logo'},
+            'content_type': content_type.pk,
+            'user': game.user,
+        }
+
+    def artwork_exists(self, game, size):
+        return default_storage.exists(artwork_name(game.appid, game.img_logo_url, size))
+
+    def requests(self, samples, only):
+        requests = {}
+        for name in self.url_names():
+            if name not in REQUESTS or (only and name not in only):
+                continue
+            method, kwargs, logged_in, query = REQUESTS[name]
+            url = reverse(name, kwargs=samples[kwargs] if kwargs else None)
+            if query:
+                url = f"{url}?{query.format(content_type=samples['content_type'])}"
+            requests[name] = (method, url, logged_in)
+        return requests
+
+    def measure(self, client, method, url, options):
+        send = client.post if method == 'POST' else client.get
+
+        def prepare():
+            # Untimed, so flushes and cache clearing don't count against the view
+            flush_buffers()
+            if not options['warm_cache']:
+                cache.clear()
+
+        for _ in range(options['warmup']):
+            prepare()
+            send(url)
+
+        timings = []
+        queries = []
+        status = None
+        for _ in range(options['iterations']):
+            prepare()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = send(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured.captured_queries))
+            status = response.status_code
+
+        # Measured on a separate request, tracing slows everything down
+        prepare()
+        tracemalloc.start()
+        try:
+            send(url)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        return {
+            'method': method,
+            'url': url,
+            'status': status,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'mean_ms': round(sum(timings) / len(timings), 2),
+            'queries': max(queries),
+            'peak_memory_kb': round(peak / 1024),
+        }
+
+    def check_thresholds(self, path, results):
+        try:
+            with open(path) as f:
+                thresholds = json.load(f)
+        except FileNotFoundError:
+            raise CommandError(f"No thresholds file at {path}; create one with --write-thresholds.")
+
+        failures = []
+        for name, result in results.items():
+            if result['status'] >= 500:
+                failures.append(f"{name}: status {result['status']}")
+                continue
+            limits = thresholds.get(name)
+            if limits is None:
+                self.stderr.write(self.style.WARNING(f"No thresholds for {name}"))
+                continue
+            if result['status'] != limits.get('status', result['status']):
+                failures.append(f"{name}: status {result['status']}, expected {limits['status']}")
+            for metric in ('p95_ms', 'queries', 'peak_memory_kb'):
+                if metric in limits and result[metric] > limits[metric]:
+                    failures.append(f"{name}: {metric} {result[metric]} > {limits[metric]}")
+
+        if failures:
+            raise CommandError("Benchmark regressions:\n  " + "\n  ".join(failures))
+        self.stderr.write(self.style.SUCCESS(f"All {len(results)} views within thresholds"))
+
+    def write_thresholds(self, path, results):
+        try:
+            with open(path) as f:
+                thresholds = json.load(f)
+        except FileNotFoundError:
+            thresholds = {}
+        # Query counts are exact; timings and memory get room for noisy machines
+        thresholds.update({
+            name: {
+                'status': result['status'],
+                'p95_ms': math.ceil(result['p95_ms'] * 3 + 20),
+                'queries': result['queries'],
+                'peak_memory_kb': math.ceil(result['peak_memory_kb'] * 1.5 + 256),
+            }
+            for name, result in results.items()
+        })
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(thresholds, f, indent=2, sort_keys=True)
+            f.write('\n')
+        self.stderr.write(self.style.SUCCESS(f"Wrote thresholds for {len(results)} views to {path}"))
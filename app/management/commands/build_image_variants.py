@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from app.images import delete_replaced_variants, generate_variants, manifest_for
+from app.models import Post, Profile
+
+TARGETS = (
+    (Post, 'image', 'post'),
+    (Profile, 'avatar', 'avatar'),
+)
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG variants for post images and avatars that lack them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Rows loaded and updated per batch (default: 200)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Images processed in parallel (default: 4)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rebuild variants even when they are up to date or the image could not be read before',
+        )
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for model, field_name, kind in TARGETS:
+                built = self.backfill(executor, model, field_name, kind, options)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Built variants for {built} {model._meta.verbose_name_plural}"
+                ))
+
+    def backfill(self, executor, model, field_name, kind, options):
+        manifest_field = f'{field_name}_variants'
+        queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+        last_id = 0
+        built = 0
+
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=last_id)
+                .order_by('pk')
+                .only('id', field_name, manifest_field)[:options['batch_size']]
+            )
+            if not rows:
+                break
+            last_id = rows[-1].pk
+
+            stale = [
+                row for row in rows
+                if options['force'] or manifest_for(getattr(row, field_name), getattr(row, manifest_field)) is None
+            ]
+            previous = [getattr(row, manifest_field) for row in stale]
+            manifests = executor.map(lambda row: generate_variants(getattr(row, field_name), kind), stale)
+            for row, manifest in zip(stale, manifests):
+                setattr(row, manifest_field, manifest)
+            if stale:
+                model.objects.bulk_update(stale, [manifest_field])
+                for row, old in zip(stale, previous):
+                    delete_replaced_variants(old, getattr(row, manifest_field))
+                built += sum(1 for row in stale if getattr(row, manifest_field).get('widths'))
+            self.stdout.write(f"Processed {model._meta.verbose_name_plural} up to id {last_id}...")
+
+        return built
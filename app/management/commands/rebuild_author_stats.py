@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.author_stats import rebuild_author_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute AuthorStats for every user in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of users recomputed per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        scanned = 0
+        written = 0
+
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not user_ids:
+                break
+            with transaction.atomic():
+                written += rebuild_author_stats(user_ids)
+            scanned += len(user_ids)
+            last_id = user_ids[-1]
+            self.stdout.write(f"Rebuilt {scanned} users...")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {written} authors"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.related import rebuild_related_posts
+
+
+class Command(BaseCommand):
+    help = "Rebuild the related-posts index from tag overlap and content genre/type"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of posts scored and written per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_related_posts(options['batch_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} related-post rows"))
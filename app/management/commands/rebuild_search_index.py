@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for all posts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of posts indexed per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("The search index needs SQLite with FTS5; run migrate first.")
+        total = search.rebuild_index(options['batch_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} posts"))
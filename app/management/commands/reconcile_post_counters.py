@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.counters import recount_counters
+from app.models import Post
+
+
+class Command(BaseCommand):
+    help = "Recompute Post.like_count, bookmark_count and comment_count in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of posts recomputed per UPDATE (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+
+        while True:
+            post_ids = list(
+                Post.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not post_ids:
+                break
+            with transaction.atomic():
+                total += recount_counters(post_ids)
+            last_id = post_ids[-1]
+            self.stdout.write(f"Reconciled {total} posts...")
+
+        self.stdout.write(self.style.SUCCESS(f"Reconciled counters for {total} posts"))
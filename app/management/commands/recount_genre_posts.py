@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.counters import recount_genre_counts
+from app.models import ContentGenre
+
+
+class Command(BaseCommand):
+    help = "Recompute ContentGenre.post_count in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of genres recomputed per UPDATE (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+
+        while True:
+            genre_ids = list(
+                ContentGenre.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not genre_ids:
+                break
+            with transaction.atomic():
+                total += recount_genre_counts(genre_ids)
+            last_id = genre_ids[-1]
+            self.stdout.write(f"Recounted {total} genres...")
+
+        self.stdout.write(self.style.SUCCESS(f"Recounted post_count for {total} genres"))
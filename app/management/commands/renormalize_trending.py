@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from app.trending import rebuild_scores, renormalize
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the trending score epoch to now and scale stored scores to match; "
+        "run daily from cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recompute all scores from the post counters instead, e.g. after a bulk import',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of posts scored per UPDATE with --rebuild (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            total = rebuild_scores(options['batch_size'], stdout=self.stdout)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt trending scores for {total} posts"))
+            return
+        factor = renormalize()
+        self.stdout.write(self.style.SUCCESS(f"Renormalized trending scores by a factor of {factor:.6g}"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from app.view_events import rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact post view events into hourly and daily rollups and prune expired "
+        "events; run from cron every few minutes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild the rollups of the days still covered by raw events instead of adding new events',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows per upsert or DELETE (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        counts = rollup(full=options['full'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {counts['hours']} hourly and {counts['days']} daily rollups, pruned "
+            f"{counts['events_pruned']} events and {counts['hours_pruned']} hourly rollups"
+        ))
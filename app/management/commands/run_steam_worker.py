@@ -0,0 +1,53 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.jobs import claim_next_job, requeue_stale_jobs, run_job
+from app.steam_client import get_steam_client
+
+
+class Command(BaseCommand):
+    help = "Run queued Steam sync jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait when the queue is empty (default: 2)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when there are no due jobs left instead of polling',
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        processed = 0
+        while not self.stopping:
+            close_old_connections()
+            requeue_stale_jobs()
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            run_job(job)
+            processed += 1
+            self.stdout.write(f"Job {job.pk} for {job.user}: {job.status}")
+
+        metrics = get_steam_client().metrics.snapshot()
+        self.stdout.write(', '.join(f"{name}={value:g}" for name, value in sorted(metrics.items())))
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} Steam sync jobs"))
+
+    def stop(self, signum, frame):
+        # Finish the current job, then exit
+        self.stopping = True
@@ -0,0 +1,250 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from app.models import Comments, ContentGenre, ContentType, Post, Profile, SteamGame, Tag
+from app.slugs import assign_slugs
+
+# Every generated username starts with this, so --clear can find them again
+USERNAME_PREFIX = 'bench-'
+
+WORDS = (
+    'game', 'level', 'quest', 'story', 'review', 'boss', 'patch', 'update', 'guide', 'build',
+    'strategy', 'speedrun', 'indie', 'studio', 'release', 'trailer', 'season', 'ranked', 'mod',
+    'soundtrack', 'character', 'world', 'open', 'retro', 'pixel', 'co-op', 'online', 'campaign',
+    'dungeon', 'loot', 'crafting', 'survival', 'puzzle', 'racing', 'shooter', 'platformer',
+    'the', 'a', 'with', 'and', 'of', 'in', 'new', 'best', 'first', 'final', 'hidden', 'true',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate users, posts, tags, comment threads, likes, bookmarks, genres and "
+        "Steam games for benchmarking, then rebuild the derived data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Users to create (default: 500)')
+        parser.add_argument('--posts', type=int, default=5000, help='Posts to create (default: 5000)')
+        parser.add_argument('--tags', type=int, default=60, help='Tags to create (default: 60)')
+        parser.add_argument(
+            '--genres', type=int, default=12,
+            help='Genres per content type (default: 12)',
+        )
+        parser.add_argument(
+            '--comments', type=int, default=8,
+            help='Average comments per post, about a third of them replies (default: 8)',
+        )
+        parser.add_argument(
+            '--likes', type=int, default=15,
+            help='Average likes per post; bookmarks are a third of that (default: 15)',
+        )
+        parser.add_argument(
+            '--steam-games', type=int, default=10,
+            help='Steam games per user with a Steam ID (default: 10)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows per bulk insert (default: 1000)',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Delete the users (and so the posts) of earlier runs first',
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            self.stdout.write(f"Deleted {deleted} rows from earlier runs")
+
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            content_types = self.create_content_types()
+            genres = self.create_genres(content_types, options['genres'])
+            tags = self.create_tags(options['tags'])
+            posts = self.create_posts(options['posts'], users, genres, tags)
+            self.create_comments(posts, users, options['comments'])
+            self.create_engagement(posts, users, options['likes'])
+            self.create_steam_games(users, options['steam_games'])
+
+        # The rows above were bulk inserted, so no signal handler saw them
+        for command, command_options in (
+            ('reconcile_post_counters', {}),
+            ('recount_genre_posts', {}),
+            ('rebuild_author_stats', {}),
+            ('rebuild_related_posts', {}),
+            ('rebuild_search_index', {}),
+            ('renormalize_trending', {'rebuild': True}),
+        ):
+            self.stdout.write(f"Running {command}...")
+            call_command(command, stdout=self.stdout, **command_options)
+        cache.clear()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(posts)} posts, {len(tags)} tags and {len(genres)} genres"
+        ))
+
+    def words(self, low, high):
+        return ' '.join(self.random.choice(WORDS) for _ in range(self.random.randint(low, high)))
+
+    def paragraphs(self, count):
+        return '\n\n'.join(
+            f'<p>{self.words(40, 120).capitalize()}.</p>' for _ in range(count)
+        )
+
+    def past(self, days=365):
+        return timezone.now() - timedelta(seconds=self.random.randint(0, days * 24 * 3600))
+
+    def create_users(self, count):
+        start = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        # One hash for everyone; hashing thousands of passwords would dominate the run
+        password = make_password('bench-password')
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=f'{USERNAME_PREFIX}{start + i}',
+                    first_name=self.words(1, 1).capitalize(),
+                    email=f'{USERNAME_PREFIX}{start + i}@example.com',
+                    password=password,
+                )
+                for i in range(count)
+            ],
+            batch_size=self.batch_size,
+        )
+        profiles = [
+            Profile(
+                user=user,
+                bio=self.words(8, 20).capitalize(),
+                # Every other user has a Steam account
+                steam_id=str(76561197960265728 + user.pk) if i % 2 == 0 else None,
+            )
+            for i, user in enumerate(users)
+        ]
+        assign_slugs(profiles, 'user.username')
+        Profile.objects.bulk_create(profiles, batch_size=self.batch_size)
+        self.stdout.write(f"Created {len(users)} users")
+        return users
+
+    def create_content_types(self):
+        for name, display_name in ContentType.CONTENT_TYPE_CHOICES:
+            ContentType.objects.get_or_create(name=name, defaults={'display_name': display_name})
+        return list(ContentType.objects.all())
+
+    def create_genres(self, content_types, per_type):
+        genres = [
+            ContentGenre(content_type=content_type, name=self.words(1, 2).title())
+            for content_type in content_types
+            for _ in range(per_type)
+        ]
+        assign_slugs(genres, 'name', scope_attrs=('content_type_id',))
+        genres = ContentGenre.objects.bulk_create(genres, batch_size=self.batch_size)
+        self.stdout.write(f"Created {len(genres)} genres")
+        return genres
+
+    def create_tags(self, count):
+        existing = set(Tag.objects.values_list('name', flat=True))
+        tags = []
+        while len(tags) < count:
+            name = f'{self.words(1, 2)} {len(existing) + len(tags)}'
+            tags.append(Tag(name=name, description=self.words(3, 8)))
+        assign_slugs(tags, 'name')
+        tags = Tag.objects.bulk_create(tags, batch_size=self.batch_size)
+        self.stdout.write(f"Created {len(tags)} tags")
+        return tags
+
+    def create_posts(self, count, users, genres, tags):
+        posts = []
+        for _ in range(count):
+            genre = self.random.choice(genres) if self.random.random() < 0.7 else None
+            posts.append(Post(
+                title=self.words(3, 9).capitalize(),
+                content=self.paragraphs(self.random.randint(2, 8)),
+                author=self.random.choice(users),
+                content_type_id=genre.content_type_id if genre else None,
+                content_genre=genre,
+                is_featured=self.random.random() < 0.02,
+                # Long-tailed, like real traffic
+                view_count=int(self.random.paretovariate(1.2) * 20),
+            ))
+        assign_slugs(posts, 'title')
+        posts = Post.objects.bulk_create(posts, batch_size=self.batch_size)
+
+        # created_at/last_modified are set to now on insert; spread them out
+        for post in posts:
+            post.created_at = self.past()
+            post.last_modified = post.created_at + timedelta(hours=self.random.randint(0, 72))
+        Post.objects.bulk_update(posts, ['created_at', 'last_modified'], batch_size=self.batch_size)
+
+        PostTag = Post.tags.through
+        PostTag.objects.bulk_create(
+            [
+                PostTag(post_id=post.pk, tag_id=tag.pk)
+                for post in posts
+                for tag in self.random.sample(tags, min(len(tags), self.random.randint(1, 4)))
+            ],
+            batch_size=self.batch_size,
+        )
+        self.stdout.write(f"Created {len(posts)} posts")
+        return posts
+
+    def create_comments(self, posts, users, average):
+        top_level = []
+        for post in posts:
+            for _ in range(self.random.randint(0, average * 4 // 3)):
+                user = self.random.choice(users)
+                top_level.append(Comments(
+                    post=post, author=user, name=user.first_name, email=user.email,
+                    content=self.words(5, 40).capitalize(),
+                ))
+        top_level = Comments.objects.bulk_create(top_level, batch_size=self.batch_size)
+
+        by_post = {}
+        for comment in top_level:
+            by_post.setdefault(comment.post_id, []).append(comment)
+        replies = []
+        for post_id, threads in by_post.items():
+            for _ in range(len(threads) // 2):
+                user = self.random.choice(users)
+                replies.append(Comments(
+                    post_id=post_id, parent=self.random.choice(threads), author=user,
+                    name=user.first_name, email=user.email, content=self.words(3, 25).capitalize(),
+                ))
+        Comments.objects.bulk_create(replies, batch_size=self.batch_size)
+        self.stdout.write(f"Created {len(top_level) + len(replies)} comments")
+
+    def create_engagement(self, posts, users, average):
+        for field, per_post in (('likes', average), ('bookmarks', max(1, average // 3))):
+            through = getattr(Post, field).through
+            rows = []
+            for post in posts:
+                count = min(len(users), self.random.randint(0, per_post * 2))
+                rows.extend(through(post_id=post.pk, user_id=user.pk) for user in self.random.sample(users, count))
+            through.objects.bulk_create(rows, batch_size=self.batch_size)
+            self.stdout.write(f"Created {len(rows)} {field}")
+
+    def create_steam_games(self, users, per_user):
+        games = []
+        for user in users[::2]:
+            for appid in self.random.sample(range(10, 2000000, 10), per_user):
+                games.append(SteamGame(
+                    user=user,
+                    appid=appid,
+                    name=self.words(1, 4).title(),
+                    playtime_2weeks=self.random.randint(0, 3000),
+                    playtime_forever=self.random.randint(0, 300000),
+                    img_icon_url='%040x' % self.random.getrandbits(160),
+                    img_logo_url='%040x' % self.random.getrandbits(160),
+                ))
+        SteamGame.objects.bulk_create(games, batch_size=self.batch_size)
+        self.stdout.write(f"Created {len(games)} Steam games")
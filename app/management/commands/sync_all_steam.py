@@ -0,0 +1,190 @@
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+
+from app.models import Profile
+from app.steam import sync_steam_games_bulk
+from app.steam_client import SteamAPIError, SteamClient
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh SteamGame for every profile with a Steam ID, least recently "
+        "synced first, resuming from the last checkpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=16,
+            help='Concurrent Steam API requests (default: 16)',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=20.0,
+            help='Steam API requests per second across all workers (default: 20)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Profiles fetched and written per batch (default: 200)',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=0,
+            help='Skip profiles synced less than this many hours ago (default: 0)',
+        )
+        parser.add_argument(
+            '--retries',
+            type=int,
+            default=2,
+            help='Extra attempts for a profile after a retryable Steam error (default: 2)',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(tempfile.gettempdir(), 'sync_all_steam.json'),
+            help='Progress file used to resume an interrupted run',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore an existing checkpoint and start a new run',
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = self.load_checkpoint(options)
+        cutoff = datetime.fromisoformat(checkpoint['cutoff'])
+        if checkpoint['processed']:
+            self.stdout.write(f"Resuming run from {checkpoint['processed']} profiles")
+
+        self.retries = options['retries']
+        self.client = SteamClient(
+            rate_limit=options['rate'],
+            burst=options['workers'],
+            pool_size=options['workers'],
+        )
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                profiles = self.next_batch(cutoff, checkpoint['cursor'], options['batch_size'])
+                if not profiles:
+                    break
+
+                # Only one batch of responses is held in memory at a time
+                games_by_user = {}
+                for profile, games in zip(profiles, executor.map(self.fetch, profiles)):
+                    if games is None:
+                        checkpoint['failed'] += 1
+                    else:
+                        games_by_user[profile['user_id']] = games
+
+                if games_by_user:
+                    results = sync_steam_games_bulk(games_by_user)
+                    Profile.objects.filter(user_id__in=games_by_user.keys()).update(
+                        last_sync_time=timezone.now(),
+                    )
+                    for result in results.values():
+                        checkpoint['inserted'] += result.inserted
+                        checkpoint['updated'] += result.updated
+                        checkpoint['removed'] += result.removed
+
+                last = profiles[-1]
+                checkpoint['cursor'] = [
+                    last['last_sync_time'].isoformat() if last['last_sync_time'] else None,
+                    last['id'],
+                ]
+                checkpoint['processed'] += len(profiles)
+                self.save_checkpoint(options['checkpoint'], checkpoint)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"Synced {checkpoint['processed']} profiles "
+                    f"({checkpoint['failed']} failed, {len(profiles) / max(elapsed, 0.001):.0f}/s)..."
+                )
+                started = time.monotonic()
+
+                if self.client.circuit.state != self.client.circuit.CLOSED:
+                    self.stdout.write(self.style.WARNING("Steam API is failing, pausing..."))
+                    time.sleep(self.client.circuit.reset_timeout)
+
+        # Runs with nothing to sync never wrote one
+        if os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        metrics = self.client.metrics.snapshot()
+        self.stdout.write(', '.join(f"{name}={value:g}" for name, value in sorted(metrics.items())))
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {checkpoint['processed'] - checkpoint['failed']} of {checkpoint['processed']} profiles: "
+            f"{checkpoint['inserted']} games added, {checkpoint['updated']} updated, "
+            f"{checkpoint['removed']} removed"
+        ))
+
+    def load_checkpoint(self, options):
+        path = options['checkpoint']
+        if not options['restart'] and os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        # Profiles synced after the cutoff (by this run or by users) are skipped
+        cutoff = timezone.now() - timedelta(hours=options['min_age'])
+        return {
+            'cutoff': cutoff.isoformat(),
+            'cursor': None,
+            'processed': 0,
+            'failed': 0,
+            'inserted': 0,
+            'updated': 0,
+            'removed': 0,
+        }
+
+    def save_checkpoint(self, path, checkpoint):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
+
+    def next_batch(self, cutoff, cursor, batch_size):
+        """
+        The next profiles due for a sync, ordered by (last_sync_time, id)
+        with never-synced profiles first. Profiles synced in this run move
+        past the cutoff, so the cursor only has to skip the failed ones.
+        """
+        queryset = Profile.objects.exclude(steam_id__isnull=True).exclude(steam_id='').filter(
+            Q(last_sync_time__isnull=True) | Q(last_sync_time__lt=cutoff)
+        )
+        if cursor:
+            last_sync_time, pk = cursor
+            if last_sync_time is None:
+                queryset = queryset.filter(
+                    Q(last_sync_time__isnull=True, pk__gt=pk) | Q(last_sync_time__isnull=False)
+                )
+            else:
+                last_sync_time = datetime.fromisoformat(last_sync_time)
+                queryset = queryset.filter(
+                    Q(last_sync_time__gt=last_sync_time) | Q(last_sync_time=last_sync_time, pk__gt=pk)
+                )
+        return list(
+            queryset.order_by(F('last_sync_time').asc(nulls_first=True), 'id')
+            .values('id', 'user_id', 'steam_id', 'last_sync_time')[:batch_size]
+        )
+
+    def fetch(self, profile):
+        """Games of one profile, or None if Steam could not be read"""
+        for attempt in range(self.retries + 1):
+            try:
+                return self.client.get_recently_played(profile['steam_id'], use_cache=False)
+            except SteamAPIError as e:
+                if not e.retryable or attempt == self.retries:
+                    return None
+                time.sleep(2 ** attempt)
+        return None
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_profile_steam_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comments',
+            index=models.Index(fields=['post', 'date'], name='app_comment_post_id_e8f3eb_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:18
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('app', 'Post')
+    Comments = apps.get_model('app', 'Comments')
+
+    def count_of(queryset):
+        counted = queryset.order_by().values('post_id').annotate(n=Count('*')).values('n')
+        return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+    Post.objects.update(
+        like_count=count_of(Post.likes.through.objects.filter(post_id=OuterRef('pk'))),
+        bookmark_count=count_of(Post.bookmarks.through.objects.filter(post_id=OuterRef('pk'))),
+        comment_count=count_of(Comments.objects.filter(post_id=OuterRef('pk'))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_comments_app_comment_post_id_e8f3eb_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='bookmark_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_post_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_scores', to='app.post')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_by', to='app.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['post', '-score'], name='app_related_post_id_40b969_idx')],
+                'unique_together': {('post', 'related')},
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# Fixed here rather than imported from app/search.py, so later changes to
+# the index don't rewrite what this migration did. The bodies are indexed
+# as stored, HTML included; `manage.py rebuild_search_index` re-indexes
+# them with the current document format.
+CREATE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS app_post_search USING fts5("
+    "title, content, tags, genre, tokenize = 'porter unicode61 remove_diacritics 2')"
+)
+INDEX_POSTS = """
+    INSERT INTO app_post_search (rowid, title, content, tags, genre)
+    SELECT
+        post.id,
+        post.title,
+        post.content,
+        COALESCE((
+            SELECT group_concat(tag.name, ' ')
+            FROM app_post_tags AS post_tag
+            JOIN app_tag AS tag ON tag.id = post_tag.tag_id
+            WHERE post_tag.post_id = post.id
+        ), ''),
+        TRIM(COALESCE(genre.name, '') || ' ' || COALESCE(content_type.display_name, ''))
+    FROM app_post AS post
+    LEFT JOIN app_contentgenre AS genre ON genre.id = post.content_genre_id
+    LEFT JOIN app_contenttype AS content_type ON content_type.id = post.content_type_id
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_INDEX)
+    schema_editor.execute(INDEX_POSTS)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS app_post_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_relatedpost'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
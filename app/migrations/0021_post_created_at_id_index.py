@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_post_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', 'id'], name='app_post_created_03fbfc_idx'),
+        ),
+    ]
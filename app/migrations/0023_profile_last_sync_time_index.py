@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_steamsyncjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['last_sync_time', 'id'], name='app_profile_last_sy_a7fba7_idx'),
+        ),
+    ]
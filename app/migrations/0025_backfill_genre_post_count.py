@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_post_count(apps, schema_editor):
+    ContentGenre = apps.get_model('app', 'ContentGenre')
+    Post = apps.get_model('app', 'Post')
+
+    counted = (
+        Post.objects.filter(content_genre_id=OuterRef('pk'))
+        .order_by().values('content_genre_id').annotate(n=Count('*')).values('n')
+    )
+    ContentGenre.objects.update(
+        post_count=Coalesce(Subquery(counted, output_field=IntegerField()), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_post_count, migrations.RunPython.noop),
+    ]
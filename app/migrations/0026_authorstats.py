@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_author_stats(apps, schema_editor):
+    AuthorStats = apps.get_model('app', 'AuthorStats')
+    Post = apps.get_model('app', 'Post')
+
+    totals = (
+        Post.objects.exclude(author_id=None)
+        .order_by().values('author_id')
+        .annotate(
+            post_count=Count('pk'),
+            total_views=Coalesce(Sum('view_count'), 0),
+            likes_received=Coalesce(Sum('like_count'), 0),
+            last_post_at=Max('created_at'),
+        )
+    )
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(user_id=row.pop('author_id'), **row) for row in totals],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_backfill_genre_post_count'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='author_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('total_views', models.PositiveBigIntegerField(default=0)),
+                ('likes_received', models.PositiveIntegerField(default=0)),
+                ('last_post_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Author stats',
+                'indexes': [models.Index(fields=['-post_count', 'user'], name='app_authors_post_co_16b978_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_author_stats, migrations.RunPython.noop),
+    ]
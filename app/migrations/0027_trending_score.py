@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:48
+
+import math
+import time
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_scores(apps, schema_editor):
+    """Score existing posts as if all their engagement came when they were published"""
+    Post = apps.get_model('app', 'Post')
+    TrendingState = apps.get_model('app', 'TrendingState')
+
+    epoch = time.time()
+    TrendingState.objects.create(pk=1, epoch=epoch)
+    rate = math.log(2) / (getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 48) * 3600)
+    weights = getattr(settings, 'TRENDING_WEIGHTS', {'view': 1, 'like': 5, 'comment': 8, 'post': 20})
+
+    posts = list(Post.objects.only('id', 'created_at', 'view_count', 'like_count', 'comment_count'))
+    for post in posts:
+        amount = (
+            (post.view_count or 0) * weights['view']
+            + post.like_count * weights['like']
+            + post.comment_count * weights['comment']
+            + weights['post']
+        )
+        post.trending_score = amount * math.exp(rate * (post.created_at.timestamp() - epoch))
+    Post.objects.bulk_update(posts, ['trending_score'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0026_authorstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.FloatField(help_text='Unix time the stored trending scores are relative to')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-trending_score', '-id'], name='app_post_trendin_0257e2_idx'),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0027_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('viewed_at', models.DateTimeField(db_index=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_events', to='app.post')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostViewRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_rollups', to='app.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'start'], name='app_postvie_period_d17f1a_idx')],
+                'unique_together': {('post', 'period', 'start')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0028_view_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='unique_viewers',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(blank=True, null=True)),
+                ('sketch', models.BinaryField()),
+                ('visitors', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visitor_sketches', to='app.post')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('day__isnull', True)), fields=('post',), name='unique_all_time_visitor_sketch')],
+                'unique_together': {('post', 'day')},
+            },
+        ),
+    ]
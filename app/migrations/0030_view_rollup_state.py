@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:08
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def start_after_rolled_up_events(apps, schema_editor):
+    """Events already in the rollups were counted by the time-based rollup"""
+    PostViewRollup = apps.get_model('app', 'PostViewRollup')
+    ViewEvent = apps.get_model('app', 'ViewEvent')
+    ViewRollupState = apps.get_model('app', 'ViewRollupState')
+    last_event_id = 0
+    if PostViewRollup.objects.exists():
+        last_event_id = ViewEvent.objects.aggregate(last=Max('pk'))['last'] or 0
+    ViewRollupState.objects.create(pk=1, last_event_id=last_event_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0029_visitor_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(start_after_rolled_up_events, migrations.RunPython.noop),
+    ]
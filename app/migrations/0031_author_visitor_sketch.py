@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_post_sketches(apps, schema_editor):
+    """Build the authors' sketches from their posts' sketches so far"""
+    from app.hyperloglog import HyperLogLog
+
+    AuthorStats = apps.get_model('app', 'AuthorStats')
+    AuthorVisitorSketch = apps.get_model('app', 'AuthorVisitorSketch')
+    VisitorSketch = apps.get_model('app', 'VisitorSketch')
+    merged = {}
+    for author_id, day, data in (
+        VisitorSketch.objects.filter(post__author__isnull=False)
+        .values_list('post__author_id', 'day', 'sketch').iterator()
+    ):
+        merged.setdefault((author_id, day), HyperLogLog()).merge(HyperLogLog.from_bytes(data))
+    rows = [
+        AuthorVisitorSketch(user_id=author_id, day=day, sketch=sketch.to_bytes(), visitors=sketch.count())
+        for (author_id, day), sketch in merged.items()
+    ]
+    AuthorVisitorSketch.objects.bulk_create(rows, batch_size=500)
+    AuthorStats.objects.bulk_update(
+        [AuthorStats(pk=row.user_id, unique_visitors=row.visitors) for row in rows if row.day is None],
+        ['unique_visitors'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0030_view_rollup_state'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='unique_visitors',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='AuthorVisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(blank=True, null=True)),
+                ('sketch', models.BinaryField()),
+                ('visitors', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visitor_sketches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('day__isnull', True)), fields=('user',), name='unique_all_time_author_visitor_sketch')],
+                'unique_together': {('user', 'day')},
+            },
+        ),
+        migrations.RunPython(merge_post_sketches, migrations.RunPython.noop),
+    ]
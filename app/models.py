@@ -1,8 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.utils.text import slugify
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .slugs import save_with_unique_slug
 # Create your models here.
 
 
@@ -17,12 +19,7 @@ def create_user_profile(sender, instance, created, **kwargs):
     Automatically create a Profile when a new User is created
     """
     if created:
-        Profile.objects.get_or_create(
-            user=instance,
-            defaults={
-                'slug': slugify(instance.username),
-            }
-        )
+        Profile.objects.get_or_create(user=instance)
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
@@ -106,7 +103,10 @@ class ContentGenre(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            return save_with_unique_slug(
+                self, self.name, lambda: super(ContentGenre, self).save(*args, **kwargs),
+                scope={'content_type_id': self.content_type_id},
+            )
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -130,17 +130,72 @@ class SteamGame(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.name}"
 
+class SteamSyncJob(models.Model):
+    """
+    Queued Steam sync for one user, run by `manage.py run_steam_worker`.
+    Failed attempts are retried with exponential backoff (see app/jobs.py).
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='steam_sync_jobs')
+    steam_id = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Earliest time the next attempt may start")
+    last_error = models.TextField(blank=True, default='')
+    games_inserted = models.PositiveIntegerField(default=0)
+    games_updated = models.PositiveIntegerField(default=0)
+    games_removed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Steam sync for {self.user} ({self.status})"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(blank=True, null=True)
     avatar = models.ImageField(upload_to='profiles/avatars/', blank=True, null=True)
+    # Resized copies of the avatar, see app/images.py
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     slug = models.SlugField(unique=True, max_length=200)
     steam_id = models.CharField(max_length=50, blank=True, null=True, unique=True, help_text="User's Steam ID for API integration")
     last_sync_time = models.DateTimeField(blank=True, null=True, help_text="Last time Steam games were synced")
+
+    class Meta:
+        indexes = [
+            # sync_all_steam walks profiles from the least recently synced
+            models.Index(fields=['last_sync_time', 'id']),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.id:
-            self.slug = slugify(self.user.username)
+            return save_with_unique_slug(
+                self, self.user.username, lambda: super(Profile, self).save(*args, **kwargs),
+            )
         return super(Profile, self).save(*args, **kwargs)
     
     def __str__(self):
@@ -162,6 +217,11 @@ class Comments(models.Model):
     post = models.ForeignKey('Post', on_delete=models.CASCADE, related_name='comments')
     parent = models.ForeignKey('self', on_delete=models.DO_NOTHING, blank=True, null=True, related_name='replies')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'date']),
+        ]
+
 
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -170,12 +230,30 @@ class Tag(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.id:
-            self.slug = slugify(self.name)
+            return save_with_unique_slug(self, self.name, lambda: super(Tag, self).save(*args, **kwargs))
         return super(Tag, self).save(*args, **kwargs)
     
     def __str__(self):
         return self.name
 
+class PostQuerySet(models.QuerySet):
+
+    def cards(self):
+        """
+        Posts as shown on list cards: every column but content, with the
+        author, profile, content type and genre joined in and only the first
+        tag of each post prefetched, so a page of cards always takes two
+        queries however many cards it shows.
+        """
+        return (
+            self.defer('content')
+            .select_related('author__profile', 'content_type', 'content_genre')
+            .prefetch_related(
+                models.Prefetch('tags', queryset=Tag.objects.order_by('pk')[:1], to_attr='card_tags')
+            )
+        )
+
+
 class Post(models.Model):
 
     title = models.CharField(max_length=200)
@@ -184,8 +262,18 @@ class Post(models.Model):
     last_modified = models.DateTimeField(auto_now=True)
     slug = models.SlugField(unique=True, max_length=200)
     image = models.ImageField(upload_to='posts/images/', null=True, blank=True)
+    # Resized copies of the image, see app/images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     tags = models.ManyToManyField(Tag, related_name='posts', blank=True)
     view_count = models.PositiveIntegerField(default=0, null=True)
+    # Denormalized engagement counters, kept in sync by app/signals.py
+    like_count = models.PositiveIntegerField(default=0)
+    bookmark_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Time-decayed popularity, see app/trending.py
+    trending_score = models.FloatField(default=0)
+    # Estimated distinct visitors, from the all-time sketch in app/visitors.py
+    unique_viewers = models.PositiveIntegerField(default=0)
     is_featured = models.BooleanField(default=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True) 
     bookmarks = models.ManyToManyField(User, related_name='bookmarks', blank=True, default=None)
@@ -207,18 +295,191 @@ class Post(models.Model):
         help_text="Genre of the content"
     )
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['author', '-created_at']),
             models.Index(fields=['content_type', 'content_genre']),
+            models.Index(fields=['-created_at', 'id']),
+            models.Index(fields=['-trending_score', '-id']),
         ]   
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            return save_with_unique_slug(self, self.title, lambda: super(Post, self).save(*args, **kwargs))
+        return super(Post, self).save(*args, **kwargs)
+
     def __str__(self):
         return self.title
     
+    @property
+    def first_tag(self):
+        """The tag shown on the post's card, prefetched by cards()"""
+        if hasattr(self, 'card_tags'):
+            return self.card_tags[0] if self.card_tags else None
+        return self.tags.order_by('pk').first()
+
     def number_of_likes(self):
-        return self.likes.count()
+        return self.like_count
     
     def number_of_comments(self):
-        return self.comments.count()
\ No newline at end of file
+        return self.comment_count
+
+
+class RelatedPost(models.Model):
+    """
+    Precomputed similarity between two posts, maintained by app/related.py.
+    Only the best few matches of each post are kept.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_scores')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_by')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('post', 'related')
+        indexes = [
+            models.Index(fields=['post', '-score']),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} -> {self.related_id} ({self.score:.3f})"
+
+
+class AuthorStats(models.Model):
+    """
+    Per-author totals, maintained by app/author_stats.py so the author page
+    and the top authors leaderboard don't aggregate over every post.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='author_stats')
+    post_count = models.PositiveIntegerField(default=0)
+    total_views = models.PositiveBigIntegerField(default=0)
+    likes_received = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(blank=True, null=True)
+    # Estimated distinct visitors of all their posts, from the all-time
+    # AuthorVisitorSketch in app/visitors.py
+    unique_visitors = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Author stats'
+        indexes = [
+            models.Index(fields=['-post_count', 'user']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.post_count} posts"
+
+
+class TrendingState(models.Model):
+    """
+    Single row holding the reference time Post.trending_score values are
+    relative to; moved forward by `manage.py renormalize_trending`.
+    """
+    SINGLETON_ID = 1
+
+    epoch = models.FloatField(help_text="Unix time the stored trending scores are relative to")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Trending epoch {self.epoch:.0f}"
+
+
+class ViewEvent(models.Model):
+    """
+    One post page view. Append-only: written in batches by app/view_events.py,
+    compacted into PostViewRollup and pruned by `manage.py rollup_view_events`.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='view_events')
+    viewed_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.post_id} at {self.viewed_at}"
+
+
+class ViewRollupState(models.Model):
+    """
+    Single row holding the id of the last ViewEvent counted into the
+    rollups by `manage.py rollup_view_events`.
+    """
+    SINGLETON_ID = 1
+
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"View events rolled up to {self.last_event_id}"
+
+
+class PostViewRollup(models.Model):
+    """Views of a post per hour or per day, compacted from ViewEvent"""
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='view_rollups')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    start = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'period', 'start')
+        indexes = [
+            models.Index(fields=['period', 'start']),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} {self.period} {self.start}: {self.views}"
+
+
+class VisitorSketch(models.Model):
+    """
+    HyperLogLog sketch (app/hyperloglog.py) of the distinct visitors of a
+    post on one day, or over all time when day is null. Written by
+    app/visitors.py.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='visitor_sketches')
+    day = models.DateField(blank=True, null=True)
+    sketch = models.BinaryField()
+    # Cached estimate of the sketch
+    visitors = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'day')
+        constraints = [
+            # unique_together doesn't cover rows whose day is null
+            models.UniqueConstraint(
+                fields=['post'], condition=models.Q(day__isnull=True), name='unique_all_time_visitor_sketch',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} {self.day or 'all time'}: ~{self.visitors}"
+
+
+class AuthorVisitorSketch(models.Model):
+    """
+    Like VisitorSketch, for the union of the visitors of all of an author's
+    posts, so the admin reads one sketch per day instead of merging every
+    post's. Written by app/visitors.py in the same flush.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='visitor_sketches')
+    day = models.DateField(blank=True, null=True)
+    sketch = models.BinaryField()
+    # Cached estimate of the sketch
+    visitors = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'day')
+        constraints = [
+            # unique_together doesn't cover rows whose day is null
+            models.UniqueConstraint(
+                fields=['user'], condition=models.Q(day__isnull=True), name='unique_all_time_author_visitor_sketch',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day or 'all time'}: ~{self.visitors}"
@@ -0,0 +1,127 @@
+"""
+Full-page cache for anonymous readers.
+
+Logged-out visitors all get the same HTML for home, post, tag, author and
+portfolio pages, so those responses are cached by URL (plus the few cookies
+that change the markup) and served without running the view. Requests with
+a session, pending flash messages or a method other than GET/HEAD always go
+through to the view.
+
+Cached pages carry a weak ETag of their content, and requests whose
+If-None-Match still matches are answered with 304 Not Modified without
+rendering anything. There is deliberately no Last-Modified: a page shows
+comments, sidebars and counts besides its post, and no single date covers
+them, so an If-Modified-Since check could keep serving a stale page.
+
+The `{% csrf_token %}` value is swapped for a placeholder before storing and
+filled in with the visitor's own token when served, so the footer/newsletter
+forms keep working from the cache.
+
+Invalidation is generational: every namespace ('blog', 'portfolio') has a
+generation number that is part of the cache key, and the signal handlers
+bump it when a model shown on those pages changes.
+"""
+import hashlib
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+CSRF_PLACEHOLDER = b'__page_cache_csrf_token__'
+_CSRF_INPUT_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+# Cookies that change what an anonymous visitor sees
+VARY_COOKIES = ('subscribed',)
+
+
+def _generation_key(namespace):
+    return f'pagecache:{namespace}:generation'
+
+
+def get_generation(namespace):
+    return cache.get_or_set(_generation_key(namespace), 1, None)
+
+
+def invalidate(namespace):
+    """Make every page cached under a namespace stale"""
+    key = _generation_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def _is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    # No session cookie means anonymous, without loading anything
+    if settings.SESSION_COOKIE_NAME in request.COOKIES and request.user.is_authenticated:
+        return False
+    return 'messages' not in request.COOKIES
+
+
+def _cache_key(namespace, request):
+    variant = '|'.join(request.COOKIES.get(name, '') for name in VARY_COOKIES)
+    raw = f'{request.get_full_path()}|{variant}'
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return f'pagecache:{namespace}:{get_generation(namespace)}:{digest}'
+
+
+def _respond(request, entry):
+    """Build a response (or a 304) for a cached entry"""
+    response = get_conditional_response(request, etag=entry['etag'])
+    if response is None:
+        content = entry['content'].replace(CSRF_PLACEHOLDER, get_token(request).encode())
+        response = HttpResponse(content, content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['X-Page-Cache'] = 'hit'
+    patch_vary_headers(response, ['Cookie'])
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+    return response
+
+
+def cache_anonymous_page(namespace, on_hit=None):
+    """
+    Cache a view's 200 responses for anonymous GET requests.
+    A view can put data needed on cache hits in `response.page_cache_meta`;
+    on_hit(request, meta) is then called for every hit and 304, e.g. to
+    keep counting views of a cached post.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not _is_cacheable_request(request):
+                return view_func(request, *args, **kwargs)
+
+            key = _cache_key(namespace, request)
+            entry = cache.get(key)
+            if entry is not None:
+                if on_hit:
+                    on_hit(request, entry['meta'])
+                return _respond(request, entry)
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+
+            content = _CSRF_INPUT_RE.sub(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content)
+            entry = {
+                'content': content,
+                'content_type': response['Content-Type'],
+                'etag': 'W/"%s"' % hashlib.md5(content, usedforsecurity=False).hexdigest(),
+                'meta': getattr(response, 'page_cache_meta', {}),
+            }
+            cache.set(key, entry, getattr(settings, 'PAGE_CACHE_TIMEOUT', 300))
+
+            response['ETag'] = entry['etag']
+            response['X-Page-Cache'] = 'miss'
+            patch_vary_headers(response, ['Cookie'])
+            patch_cache_control(response, max_age=0, must_revalidate=True)
+            # The client may already hold this exact page
+            return get_conditional_response(request, etag=entry['etag'], response=response)
+        return wrapper
+    return decorator
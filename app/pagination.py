@@ -0,0 +1,101 @@
+"""
+Keyset (cursor) pagination for post listings.
+
+Pages are addressed by the (created_at, id) of the row at their edge rather
+than by an offset, so fetching a page is an index range scan of per_page + 1
+rows no matter how deep the user has scrolled, and no COUNT is needed.
+Rows are ordered by (-created_at, id), which is stable even when several
+posts share a timestamp.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PER_PAGE = 20
+
+
+def encode_cursor(post):
+    raw = f"{post.created_at.isoformat()}|{post.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (created_at, id) or None for a missing or malformed cursor"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def paginate_posts(queryset, after=None, before=None, per_page=DEFAULT_PER_PAGE):
+    """
+    Return one KeysetPage of a Post queryset.
+    `after` is the next_cursor of the page the user came from and `before`
+    its previous_cursor; with neither the first page is returned.
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+
+    if before:
+        created_at, pk = before
+        rows = list(
+            queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__lt=pk))
+            .order_by('created_at', '-id')[:per_page + 1]
+        )
+        more_before = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1]) if rows else None,
+            previous_cursor=encode_cursor(rows[0]) if rows and more_before else None,
+        )
+
+    if after:
+        created_at, pk = after
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__gt=pk))
+    rows = list(queryset.order_by('-created_at', 'id')[:per_page + 1])
+    more_after = len(rows) > per_page
+    rows = rows[:per_page]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1]) if rows and more_after else None,
+        previous_cursor=encode_cursor(rows[0]) if rows and after else None,
+    )
+
+
+def paginate_request(request, queryset, per_page=DEFAULT_PER_PAGE):
+    return paginate_posts(
+        queryset,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        per_page=per_page,
+    )
@@ -0,0 +1,62 @@
+"""
+Per-process cache for small reference/singleton rows.
+
+WebsiteMeta, the portfolio's SiteSettings and the fixed ContentType rows
+change only when someone edits them in the admin, yet were queried on
+every request. They are now loaded once per process and served from memory.
+
+Each entry carries a version token stored in the Django cache. Saving or
+deleting one of these models (see app/signals.py and portfolio/signals.py)
+writes a new token, and every worker reloads the entry the next time it
+sees a token different from the one it loaded with. With a shared cache
+backend this invalidates all workers at once; with the per-process default
+other workers pick up changes after REFERENCE_DATA_MAX_AGE seconds.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ContentType, WebsiteMeta
+
+
+class ReferenceDataCache:
+
+    def __init__(self):
+        self._entries = {}  # name -> (version, loaded_at, value)
+        self._lock = threading.Lock()
+
+    def _version_key(self, name):
+        return f'refdata:{name}:version'
+
+    def get(self, name, loader):
+        """Return the cached value of an entry, calling loader() to (re)load it"""
+        version = cache.get(self._version_key(name))
+        max_age = getattr(settings, 'REFERENCE_DATA_MAX_AGE', 60)
+        entry = self._entries.get(name)
+        if entry and entry[0] == version and time.monotonic() - entry[1] < max_age:
+            return entry[2]
+
+        value = loader()
+        with self._lock:
+            self._entries[name] = (version, time.monotonic(), value)
+        return value
+
+    def invalidate(self, name):
+        """Drop an entry in this process and tell the other workers to reload it"""
+        cache.set(self._version_key(name), uuid.uuid4().hex, None)
+        with self._lock:
+            self._entries.pop(name, None)
+
+
+reference_cache = ReferenceDataCache()
+
+
+def get_website_meta():
+    return reference_cache.get('website_meta', WebsiteMeta.objects.first)
+
+
+def get_content_types():
+    return reference_cache.get('content_types', lambda: list(ContentType.objects.all()))
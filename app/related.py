@@ -0,0 +1,202 @@
+"""
+Related-posts index.
+
+Similarity between posts is precomputed into RelatedPost so post_page can
+read its top matches with one indexed lookup instead of joining through the
+tag table with DISTINCT on every view.
+
+The score of a candidate is the sum over shared tags of 1 / log2(1 + n),
+where n is the number of posts carrying that tag, plus a bonus for the same
+content genre and a smaller one for the same content type. Tags used by more
+than RELATED_POSTS_MAX_TAG_POSTS posts are ignored, they say little about
+similarity and would make every post a candidate of every other.
+
+The index is updated incrementally when a post or its tags change (see
+app/signals.py) and rebuilt in bulk by `manage.py rebuild_related_posts`.
+"""
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Post, RelatedPost
+
+GENRE_WEIGHT = 1.0
+CONTENT_TYPE_WEIGHT = 0.25
+# Posts of the same genre considered as candidates even without shared tags
+MAX_GENRE_CANDIDATES = 200
+
+
+def _keep():
+    """Number of matches stored per post"""
+    return getattr(settings, 'RELATED_POSTS_KEEP', 10)
+
+
+def _max_tag_posts():
+    return getattr(settings, 'RELATED_POSTS_MAX_TAG_POSTS', 1000)
+
+
+def tag_weight(post_count):
+    return 1.0 / math.log2(1 + post_count)
+
+
+def score_post(post_id, tag_ids, meta, posts_by_tag, posts_by_genre):
+    """
+    Score every candidate of one post.
+    meta maps post id -> (content_type_id, content_genre_id) and must cover
+    the post itself and all of its candidates.
+    Returns {candidate_id: score}.
+    """
+    scores = defaultdict(float)
+    for tag_id in tag_ids:
+        tagged = posts_by_tag.get(tag_id, ())
+        if not tagged or len(tagged) > _max_tag_posts():
+            continue
+        weight = tag_weight(len(tagged))
+        for other_id in tagged:
+            scores[other_id] += weight
+
+    content_type_id, content_genre_id = meta[post_id]
+    if content_genre_id:
+        for other_id in posts_by_genre.get(content_genre_id, ()):
+            scores.setdefault(other_id, 0.0)
+
+    scores.pop(post_id, None)
+    for other_id in scores:
+        other_type_id, other_genre_id = meta[other_id]
+        if content_genre_id and other_genre_id == content_genre_id:
+            scores[other_id] += GENRE_WEIGHT
+        if content_type_id and other_type_id == content_type_id:
+            scores[other_id] += CONTENT_TYPE_WEIGHT
+    return scores
+
+
+def _top(scores, keep):
+    return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:keep]
+
+
+def update_related_posts(post_id):
+    """
+    Recompute the matches of one post after its tags, genre or content type
+    changed. The post's own list is replaced, and the post is re-scored in
+    the lists of all of its candidates, which are then trimmed back to
+    RELATED_POSTS_KEEP rows.
+    """
+    Through = Post.tags.through
+    row = Post.objects.filter(pk=post_id).values_list('content_type_id', 'content_genre_id').first()
+    if row is None:
+        return
+
+    # Skip loading the members of tags too common to be scored
+    tag_ids = [
+        tag_id for tag_id, n in
+        Through.objects.filter(tag_id__in=Through.objects.filter(post_id=post_id).values('tag_id'))
+        .values('tag_id').annotate(n=Count('*')).values_list('tag_id', 'n')
+        if n <= _max_tag_posts()
+    ]
+    posts_by_tag = defaultdict(list)
+    for tag_id, other_id in Through.objects.filter(tag_id__in=tag_ids).values_list('tag_id', 'post_id'):
+        posts_by_tag[tag_id].append(other_id)
+
+    posts_by_genre = {}
+    if row[1]:
+        posts_by_genre[row[1]] = list(
+            Post.objects.filter(content_genre_id=row[1])
+            .order_by('-created_at')
+            .values_list('id', flat=True)[:MAX_GENRE_CANDIDATES]
+        )
+
+    candidate_ids = {other_id for ids in posts_by_tag.values() for other_id in ids}
+    candidate_ids.update(posts_by_genre.get(row[1], ()))
+    meta = {
+        pk: (content_type_id, content_genre_id)
+        for pk, content_type_id, content_genre_id in Post.objects.filter(
+            pk__in=candidate_ids
+        ).values_list('id', 'content_type_id', 'content_genre_id')
+    }
+    meta[post_id] = row
+
+    scores = score_post(post_id, tag_ids, meta, posts_by_tag, posts_by_genre)
+
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id=post_id).delete()
+        RelatedPost.objects.filter(related_id=post_id).delete()
+        rows = [
+            RelatedPost(post_id=post_id, related_id=other_id, score=score)
+            for other_id, score in _top(scores, _keep())
+        ]
+        # Similarity is symmetric, so the same scores place this post in
+        # its candidates' lists.
+        rows += [
+            RelatedPost(post_id=other_id, related_id=post_id, score=score)
+            for other_id, score in scores.items()
+        ]
+        RelatedPost.objects.bulk_create(rows, batch_size=500)
+        _trim(list(scores), _keep())
+
+
+def _trim(post_ids, keep, batch_size=500):
+    """Delete all but the best `keep` matches of each of the given posts"""
+    for start in range(0, len(post_ids), batch_size):
+        ranked = RelatedPost.objects.filter(post_id__in=post_ids[start:start + batch_size]).annotate(
+            # Same order as _top()
+            rank=Window(RowNumber(), partition_by=F('post_id'), order_by=[F('score').desc(), F('related_id').desc()]),
+        )
+        extra = list(ranked.filter(rank__gt=keep).values_list('pk', flat=True))
+        if extra:
+            RelatedPost.objects.filter(pk__in=extra).delete()
+
+
+def rebuild_related_posts(batch_size=500, stdout=None):
+    """
+    Rebuild the whole index.
+    Tag and genre memberships are loaded once as id lists; posts are then
+    scored and written in batches, one transaction per batch.
+    Returns the number of RelatedPost rows written.
+    """
+    keep = _keep()
+    posts_by_tag = defaultdict(list)
+    tags_by_post = defaultdict(list)
+    for post_id, tag_id in Post.tags.through.objects.values_list('post_id', 'tag_id').iterator(chunk_size=5000):
+        posts_by_tag[tag_id].append(post_id)
+        tags_by_post[post_id].append(tag_id)
+
+    meta = {}
+    posts_by_genre = defaultdict(list)
+    rows = Post.objects.order_by('-created_at').values_list('id', 'content_type_id', 'content_genre_id')
+    for post_id, content_type_id, content_genre_id in rows.iterator(chunk_size=5000):
+        meta[post_id] = (content_type_id, content_genre_id)
+        if content_genre_id and len(posts_by_genre[content_genre_id]) < MAX_GENRE_CANDIDATES:
+            posts_by_genre[content_genre_id].append(post_id)
+
+    post_ids = sorted(meta)
+    written = 0
+    for start in range(0, len(post_ids), batch_size):
+        batch = post_ids[start:start + batch_size]
+        new_rows = []
+        for post_id in batch:
+            scores = score_post(post_id, tags_by_post.get(post_id, ()), meta, posts_by_tag, posts_by_genre)
+            new_rows += [
+                RelatedPost(post_id=post_id, related_id=other_id, score=score)
+                for other_id, score in _top(scores, keep)
+            ]
+        with transaction.atomic():
+            RelatedPost.objects.filter(post_id__in=batch).delete()
+            RelatedPost.objects.bulk_create(new_rows, batch_size=500)
+        written += len(new_rows)
+        if stdout:
+            stdout.write(f"Indexed {start + len(batch)}/{len(post_ids)} posts...")
+
+    # Rows of posts that no longer exist are removed by the FK cascade
+    return written
+
+
+def get_related_posts(post, limit=3):
+    """Top related posts of a post, read from the index as cards (see Post.objects.cards())"""
+    return (
+        Post.objects.cards().filter(related_by__post=post)
+        .order_by('-related_by__score', '-id')[:limit]
+    )
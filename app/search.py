@@ -0,0 +1,196 @@
+"""
+Full-text post search backed by an SQLite FTS5 index.
+
+app_post_search holds one row per post (rowid = post id) with the post's
+title, the text of its content (tags stripped, entities decoded), its tag names and its genre/content
+type names. Results are ranked with bm25(), title and tag hits weighing
+more than body hits, and come with a highlighted content snippet.
+
+The index is kept up to date by the signal handlers in app/signals.py and
+can be rebuilt with `manage.py rebuild_search_index`. On database backends
+without FTS5 search falls back to unranked icontains matching.
+"""
+import html
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+from .models import Post
+
+TABLE = 'app_post_search'
+# bm25 column weights: title, content, tags, genre
+WEIGHTS = (10.0, 1.0, 5.0, 3.0)
+SNIPPET_TOKENS = 24
+
+# Snippet delimiters that cannot occur in indexed text; swapped for <mark>
+# after the snippet has been HTML-escaped
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+_available = False
+
+
+def is_available():
+    """Whether the FTS index exists; a positive answer is remembered"""
+    global _available
+    if not _available:
+        _available = connection.vendor == 'sqlite' and TABLE in connection.introspection.table_names()
+    return _available
+
+
+def build_match_query(text):
+    """
+    Turn free user input into a safe FTS5 query.
+    Every word must match; the last one is treated as a prefix so results
+    show up while the user is still typing.
+    """
+    tokens = _TOKEN_RE.findall(text or '')
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _documents(post_ids):
+    posts = (
+        Post.objects.filter(pk__in=post_ids)
+        .select_related('content_genre', 'content_type')
+        .prefetch_related('tags')
+    )
+    for post in posts:
+        genre = ' '.join(
+            part for part in (
+                post.content_genre.name if post.content_genre else '',
+                post.content_type.display_name if post.content_type else '',
+            ) if part
+        )
+        yield (
+            post.pk,
+            post.title,
+            # Text, not markup: snippets are escaped when shown
+            html.unescape(strip_tags(post.content)),
+            ' '.join(tag.name for tag in post.tags.all()),
+            genre,
+        )
+
+
+def index_posts(post_ids):
+    """(Re)index the given posts, dropping the rows of posts that are gone"""
+    post_ids = list(post_ids)
+    if not post_ids or not is_available():
+        return 0
+    rows = list(_documents(post_ids))
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', post_ids)
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, title, content, tags, genre) VALUES (%s, %s, %s, %s, %s)',
+            rows,
+        )
+    return len(rows)
+
+
+def remove_posts(post_ids):
+    post_ids = list(post_ids)
+    if not post_ids or not is_available():
+        return
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', post_ids)
+
+
+def rebuild_index(batch_size=500, stdout=None):
+    """Drop and rebuild the whole index in keyset batches"""
+    if not is_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    last_id = 0
+    total = 0
+    while True:
+        post_ids = list(
+            Post.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not post_ids:
+            break
+        total += index_posts(post_ids)
+        last_id = post_ids[-1]
+        if stdout:
+            stdout.write(f"Indexed {total} posts...")
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return total
+
+
+class SearchResults:
+    """
+    Lazy, sliceable result set for a search, so it can be handed straight
+    to Django's Paginator: count() runs one COUNT over the FTS index and
+    each page is one ranked LIMIT/OFFSET query plus one query for the posts.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.match = build_match_query(query)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if not self.match:
+                self._count = 0
+            elif is_available():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT count(*) FROM {TABLE} WHERE {TABLE} MATCH %s', [self.match])
+                    self._count = cursor.fetchone()[0]
+            else:
+                self._count = self._fallback().count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if not self.match or (stop is not None and stop <= start):
+            return []
+        if not is_available():
+            return list(self._posts(self._fallback())[start:stop])
+
+        limit = -1 if stop is None else stop - start
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, snippet({TABLE}, 1, %s, %s, '…', %s) FROM {TABLE} "
+                f"WHERE {TABLE} MATCH %s ORDER BY bm25({TABLE}, %s, %s, %s, %s) "
+                f"LIMIT %s OFFSET %s",
+                [_MARK_START, _MARK_END, SNIPPET_TOKENS, self.match, *WEIGHTS, limit, start],
+            )
+            hits = cursor.fetchall()
+
+        posts = {post.pk: post for post in self._posts(Post.objects.filter(pk__in=[pk for pk, _ in hits]))}
+        results = []
+        for pk, snippet in hits:
+            post = posts.get(pk)
+            if post is None:
+                continue
+            post.snippet = mark_safe(
+                escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+            )
+            results.append(post)
+        return results
+
+    def _posts(self, queryset):
+        return queryset.cards()
+
+    def _fallback(self):
+        queryset = Post.objects.all()
+        for token in _TOKEN_RE.findall(self.query):
+            queryset = queryset.filter(Q(title__icontains=token) | Q(content__icontains=token))
+        return queryset.order_by('-created_at')
@@ -0,0 +1,90 @@
+"""
+Cached sidebar blocks for post_page.
+
+The "Most recent", "Top Authors" and "Top Tags" blocks are the same for every
+post, apart from leaving out the post being viewed and its author. They are
+computed once, cached, and invalidated by the Post/Tag/Profile signal
+handlers in app/signals.py. The per-post exclusions are applied in memory on
+the cached lists, which is why one extra row is cached for each block.
+author_page shows the same "Top Authors" block through get_top_authors().
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import AuthorStats, Post, Tag
+
+RECENT_POSTS = 3
+TOP_AUTHORS = 5
+
+CACHE_KEYS = {
+    'recent_posts': 'sidebar:recent_posts',
+    'top_authors': 'sidebar:top_authors',
+    'tags': 'sidebar:tags',
+}
+
+
+def _load_recent_posts():
+    return list(
+        Post.objects.cards()
+        .order_by('-last_modified')[:RECENT_POSTS + 1]
+    )
+
+
+def _load_top_authors():
+    # Users, ranked by their AuthorStats row; the stats stay cached on
+    # user.author_stats
+    return [
+        stats.user for stats in
+        AuthorStats.objects.filter(post_count__gt=0)
+        .select_related('user__profile')
+        .order_by('-post_count', 'user')[:TOP_AUTHORS + 1]
+    ]
+
+
+def _load_tags():
+    return list(Tag.objects.all())
+
+
+LOADERS = {
+    'recent_posts': _load_recent_posts,
+    'top_authors': _load_top_authors,
+    'tags': _load_tags,
+}
+
+
+def _get_block(name):
+    key = CACHE_KEYS[name]
+    value = cache.get(key)
+    if value is None:
+        value = LOADERS[name]()
+        cache.set(key, value, getattr(settings, 'SIDEBAR_CACHE_TIMEOUT', 300))
+    return value
+
+
+def get_top_authors(exclude_user_id=None):
+    """The top authors leaderboard, leaving out the given user"""
+    top_authors = [u for u in _get_block('top_authors') if u.id != exclude_user_id]
+    return top_authors[:TOP_AUTHORS]
+
+
+def get_sidebar(post=None):
+    """
+    Sidebar context for post_page.
+    When a post is given, it is left out of recent_posts and its author is
+    left out of top_authors.
+    """
+    post_id = post.id if post else None
+    author_id = post.author_id if post else None
+
+    recent_posts = [p for p in _get_block('recent_posts') if p.id != post_id]
+
+    return {
+        'recent_posts': recent_posts[:RECENT_POSTS],
+        'top_authors': get_top_authors(author_id),
+        'tags': _get_block('tags'),
+    }
+
+
+def invalidate_sidebar(*names):
+    """Drop the given cached blocks, or all of them when none are given"""
+    cache.delete_many([CACHE_KEYS[name] for name in (names or CACHE_KEYS)])
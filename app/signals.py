@@ -0,0 +1,281 @@
+"""
+Signal handlers for derived data: Post's denormalized engagement counters,
+ContentGenre.post_count, AuthorStats, trending scores, the cached genre
+lists, the cached post_page sidebar, the related-posts index, the full-text
+search index, the reference data cache, resized image variants and the
+anonymous page cache.
+
+Counters are changed with F() expressions inside the same transaction as the
+write that triggered them, so concurrent likes never overwrite each other.
+Writes that bypass signals (cascading user deletes, raw SQL) can still make
+them drift; `manage.py reconcile_post_counters`,
+`manage.py recount_genre_posts` and `manage.py rebuild_author_stats`
+recompute them.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .counters import bump_counter, bump_genre_count
+from .genres import invalidate_genres
+from .images import refresh_variants
+from . import author_stats, page_cache, search, trending
+from .models import Comments, ContentGenre, ContentType, Post, Profile, Tag, WebsiteMeta
+from .reference_data import reference_cache
+from .related import update_related_posts
+from .sidebar import invalidate_sidebar
+
+
+def _track_m2m(through, field, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add':
+        # pk_set only holds the rows that were actually inserted
+        if reverse:
+            bump_counter(pk_set, field, 1)
+        else:
+            bump_counter([instance.pk], field, len(pk_set))
+    elif action == 'post_remove':
+        if reverse:
+            bump_counter(pk_set, field, -1)
+        else:
+            bump_counter([instance.pk], field, -len(pk_set))
+    elif action == 'pre_clear' and reverse:
+        # Remember which posts lose a row before the rows are gone
+        instance._cleared_post_ids = list(
+            through.objects.filter(user_id=instance.pk).values_list('post_id', flat=True)
+        )
+    elif action == 'post_clear':
+        if reverse:
+            bump_counter(instance.__dict__.pop('_cleared_post_ids', []), field, -1)
+        else:
+            Post.objects.filter(pk=instance.pk).update(**{field: 0})
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def update_like_count(sender, **kwargs):
+    _track_m2m(sender, 'like_count', **kwargs)
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def update_likes_received(sender, instance, action, reverse, pk_set, **kwargs):
+    author_stats.track_likes(sender, instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Post.bookmarks.through)
+def update_bookmark_count(sender, **kwargs):
+    _track_m2m(sender, 'bookmark_count', **kwargs)
+
+
+@receiver(post_save, sender=Comments)
+def increment_comment_count(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_counter([instance.post_id], 'comment_count', 1)
+
+
+@receiver(post_delete, sender=Comments)
+def decrement_comment_count(sender, instance, **kwargs):
+    bump_counter([instance.post_id], 'comment_count', -1)
+
+
+# Trending scores. Events are buffered and written in batches by
+# app/trending.py; views are added by the view count flush.
+
+@receiver(post_save, sender=Post)
+def trend_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        trending.record(instance.pk, 'post')
+
+
+@receiver(post_save, sender=Comments)
+def trend_on_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        trending.record(instance.post_id, 'comment')
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def trend_on_like(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add':
+        return
+    if reverse:
+        for post_id in pk_set:
+            trending.record(post_id, 'like')
+    else:
+        trending.record(instance.pk, 'like', len(pk_set))
+
+
+# ContentGenre.post_count and AuthorStats follow each post's genre and
+# author, and related posts its genre and content type. Their values before
+# the save are looked up in pre_save, as they are not kept on the instance.
+
+@receiver(pre_save, sender=Post)
+def remember_previous_values(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._previous_values = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not {'content_genre', 'author', 'content_type'} & set(update_fields):
+        return
+    instance._previous_values = (
+        Post.objects.filter(pk=instance.pk).values('content_genre_id', 'author_id', 'content_type_id').first()
+    )
+
+
+@receiver(post_save, sender=Post)
+def update_owner_counts_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        bump_genre_count(instance.content_genre_id, 1)
+        author_stats.add_post(instance)
+    elif instance.__dict__.get('_previous_values'):
+        previous = instance._previous_values
+        if previous['content_genre_id'] != instance.content_genre_id:
+            bump_genre_count(previous['content_genre_id'], -1)
+            bump_genre_count(instance.content_genre_id, 1)
+        if previous['author_id'] != instance.author_id:
+            author_stats.rebuild_author_stats([previous['author_id'], instance.author_id])
+
+
+@receiver(post_delete, sender=Post)
+def update_owner_counts_on_delete(sender, instance, **kwargs):
+    bump_genre_count(instance.content_genre_id, -1)
+    author_stats.rebuild_author_stats([instance.author_id])
+
+
+# Sidebar cache invalidation. Deferred to commit so a concurrent request
+# cannot cache the old rows again between the delete and the commit.
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_sidebar(sender, **kwargs):
+    transaction.on_commit(partial(invalidate_sidebar, 'recent_posts', 'top_authors'))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_sidebar(sender, **kwargs):
+    transaction.on_commit(partial(invalidate_sidebar, 'tags'))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_author_sidebar(sender, **kwargs):
+    transaction.on_commit(partial(invalidate_sidebar, 'top_authors'))
+
+
+# Related-posts index, refreshed after commit once the tags are in place
+
+@receiver(post_save, sender=Post)
+def update_related_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # Edits to the title or text don't change the scores
+    previous = instance.__dict__.get('_previous_values')
+    if created or previous and (
+        previous['content_genre_id'] != instance.content_genre_id
+        or previous['content_type_id'] != instance.content_type_id
+    ):
+        transaction.on_commit(partial(update_related_posts, instance.pk))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def update_related_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # tag.posts.add(...) and friends; a cleared tag has no pk_set and is
+        # picked up by the next rebuild
+        for post_id in pk_set or ():
+            transaction.on_commit(partial(update_related_posts, post_id))
+    else:
+        transaction.on_commit(partial(update_related_posts, instance.pk))
+
+
+# Full-text search index
+
+@receiver(post_save, sender=Post)
+def index_post_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(partial(search.index_posts, [instance.pk]))
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_index(sender, instance, **kwargs):
+    search.remove_posts([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def index_post_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    post_ids = list(pk_set or ()) if reverse else [instance.pk]
+    transaction.on_commit(partial(search.index_posts, post_ids))
+
+
+@receiver(post_save, sender=Tag)
+def index_posts_on_tag_rename(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        post_ids = list(instance.posts.values_list('pk', flat=True))
+        transaction.on_commit(partial(search.index_posts, post_ids))
+
+
+@receiver(post_save, sender=ContentGenre)
+def index_posts_on_genre_rename(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        post_ids = list(instance.posts.values_list('pk', flat=True))
+        transaction.on_commit(partial(search.index_posts, post_ids))
+
+
+# Reference data cache
+
+@receiver(post_save, sender=WebsiteMeta)
+@receiver(post_delete, sender=WebsiteMeta)
+def invalidate_website_meta(sender, **kwargs):
+    transaction.on_commit(partial(reference_cache.invalidate, 'website_meta'))
+
+
+@receiver(post_save, sender=ContentType)
+@receiver(post_delete, sender=ContentType)
+def invalidate_content_types(sender, **kwargs):
+    transaction.on_commit(partial(reference_cache.invalidate, 'content_types'))
+
+
+@receiver(post_save, sender=ContentGenre)
+@receiver(post_delete, sender=ContentGenre)
+def invalidate_genre_lists(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_genres, instance.content_type_id))
+
+
+# Responsive image variants. Resizing is slow, so it runs after commit
+# instead of holding the write lock of the saving transaction.
+
+@receiver(post_save, sender=Post)
+def build_post_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(partial(refresh_variants, instance, 'image', 'post'))
+
+
+@receiver(post_save, sender=Profile)
+def build_avatar_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(partial(refresh_variants, instance, 'avatar', 'avatar'))
+
+
+# Anonymous page cache. Engagement counters are updated with update() and
+# don't fire these, so cached pages catch up on likes/views when they expire.
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(m2m_changed, sender=Post.tags.through)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_save, sender=Comments)
+@receiver(post_delete, sender=Comments)
+@receiver(post_save, sender=WebsiteMeta)
+@receiver(post_delete, sender=WebsiteMeta)
+def invalidate_blog_pages(sender, action=None, **kwargs):
+    # m2m_changed also fires for the pre_* actions
+    if action is None or action.startswith('post_'):
+        transaction.on_commit(partial(page_cache.invalidate, 'blog'))
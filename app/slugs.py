@@ -0,0 +1,106 @@
+"""
+Unique slug allocation.
+
+Slugs are the slugified source text, with "-<n>" appended when that is
+taken. Instead of probing "my-review", "my-review-1", "my-review-2", ... one
+query at a time, next_free_slug() asks the database in a single aggregate
+whether the base slug is taken and what the highest numeric suffix in use
+is, using a range scan on the slug index.
+
+Two writers can still pick the same slug between that query and their
+INSERT, so save_with_unique_slug() saves inside a savepoint and allocates
+again when the unique constraint rejects the row.
+"""
+import re
+from operator import attrgetter
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, IntegerField, Max, Q
+from django.db.models.functions import Cast, Substr
+from django.utils.text import slugify
+
+# Room kept for a "-<n>" suffix when the slugified text fills the field
+SUFFIX_RESERVE = 7
+SAVE_ATTEMPTS = 5
+
+
+def base_slug(model, text, field='slug'):
+    max_length = model._meta.get_field(field).max_length
+    base = slugify(text) or model._meta.model_name
+    if len(base) > max_length - SUFFIX_RESERVE:
+        base = base[:max_length - SUFFIX_RESERVE].rstrip('-')
+    return base
+
+
+def _slug_stats(model, base, scope, field):
+    """(base is taken, highest numeric suffix or None) in one query"""
+    suffixed = Q(**{f'{field}__regex': rf'^{re.escape(base)}-[0-9]+$'})
+    stats = (
+        model._default_manager.filter(**scope)
+        # "-" sorts right before ".", so this range is every "<base>-..." slug
+        .filter(Q(**{field: base}) | Q(**{f'{field}__gt': f'{base}-', f'{field}__lt': f'{base}.'}))
+        .aggregate(
+            taken=Count('pk', filter=Q(**{field: base})),
+            top=Max(Cast(Substr(field, len(base) + 2), IntegerField()), filter=suffixed),
+        )
+    )
+    return bool(stats['taken']), stats['top']
+
+
+def next_free_slug(model, text, scope=None, field='slug'):
+    """
+    The first slug for `text` not used by any row of `model` (within the
+    rows matching `scope`, for slugs that are only unique per parent).
+    """
+    base = base_slug(model, text, field)
+    taken, top = _slug_stats(model, base, scope or {}, field)
+    if not taken and top is None:
+        return base
+    return f'{base}-{(top or 0) + 1}'
+
+
+def save_with_unique_slug(instance, text, save, scope=None, field='slug'):
+    """
+    Give an unsaved instance a free slug and save it with `save()`,
+    allocating again if a concurrent insert took the slug first.
+    """
+    model = type(instance)
+    using = router.db_for_write(model, instance=instance)
+    for attempt in range(SAVE_ATTEMPTS):
+        setattr(instance, field, next_free_slug(model, text, scope, field))
+        try:
+            with transaction.atomic(using=using):
+                return save()
+        except IntegrityError:
+            slug_taken = model._default_manager.filter(**(scope or {}), **{field: getattr(instance, field)}).exists()
+            # Another unique field failed, or we keep losing the race
+            if not slug_taken or attempt == SAVE_ATTEMPTS - 1:
+                raise
+
+
+def assign_slugs(instances, text_attr, scope_attrs=(), field='slug'):
+    """
+    Set unique slugs on unsaved instances before a bulk_create: one query
+    per distinct base slug, with suffixes handed out in memory. text_attr
+    may be a dotted path, like 'user.username'.
+    """
+    if not instances:
+        return instances
+    model = type(instances[0])
+    get_text = attrgetter(text_attr)
+    free = {}  # (base, scope) -> [base still free, next suffix]
+    for instance in instances:
+        scope = {name: getattr(instance, name) for name in scope_attrs}
+        base = base_slug(model, get_text(instance), field)
+        key = (base, tuple(scope.items()))
+        if key not in free:
+            taken, top = _slug_stats(model, base, scope, field)
+            free[key] = [not taken, (top or 0) + 1]
+        state = free[key]
+        if state[0]:
+            setattr(instance, field, base)
+            state[0] = False
+        else:
+            setattr(instance, field, f'{base}-{state[1]}')
+            state[1] += 1
+    return instances
@@ -0,0 +1,106 @@
+"""
+Steam recently-played sync pipeline.
+
+fetch_steam_games() goes through the shared SteamClient (app/steam_client.py)
+and raises SteamAPIError on failure; `retryable` tells the job runner
+(app/jobs.py) whether another attempt can succeed. The endpoint is
+settings.STEAM_API_URL, so it can be pointed at a local stub server.
+
+The games returned by the Steam API are diffed against the user's stored
+SteamGame rows: new and changed games are written with one
+bulk_create(update_conflicts=True) upsert, games that dropped out of the
+response are removed with one DELETE, and unchanged games are not touched.
+Everything runs in one transaction, so a sync costs the same handful of
+queries whether the user has three games or three hundred, and
+sync_steam_games_bulk() does the same for a whole batch of users.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import SteamGame
+from .steam_client import get_steam_client
+
+SyncResult = namedtuple('SyncResult', ['inserted', 'updated', 'removed', 'unchanged'])
+
+SYNCED_FIELDS = ['name', 'playtime_2weeks', 'playtime_forever', 'img_icon_url', 'img_logo_url']
+
+
+def fetch_steam_games(steam_id):
+    """Recently played games of a Steam account, see SteamClient"""
+    return get_steam_client().get_recently_played(steam_id)
+
+
+def _game_values(game):
+    """SteamGame field values for one game of the API payload"""
+    return {
+        'name': game['name'],
+        'playtime_2weeks': game.get('playtime_2weeks', 0),
+        'playtime_forever': game.get('playtime_forever', 0),
+        'img_icon_url': game.get('img_icon_url', ''),
+        'img_logo_url': game.get('img_logo_url', ''),
+    }
+
+
+def sync_steam_games(user, games):
+    """
+    Make the user's SteamGame rows match the API payload.
+    Returns a SyncResult with the number of inserted, updated, removed and
+    unchanged games.
+    """
+    return sync_steam_games_bulk({user.pk: games})[user.pk]
+
+
+def sync_steam_games_bulk(games_by_user):
+    """
+    sync_steam_games() for many users at once: {user_id: games} in,
+    {user_id: SyncResult} out, still one SELECT, one upsert and one DELETE.
+    """
+    # Later entries win if the API ever repeats an appid
+    incoming = {
+        user_id: {game['appid']: _game_values(game) for game in games}
+        for user_id, games in games_by_user.items()
+    }
+    stored = {user_id: {} for user_id in incoming}
+    now = timezone.now()
+
+    with transaction.atomic():
+        for row in (
+            SteamGame.objects.select_for_update()
+            .filter(user_id__in=incoming.keys())
+            .values('id', 'user_id', 'appid', *SYNCED_FIELDS)
+        ):
+            stored[row['user_id']][row['appid']] = row
+
+        upserts = []
+        removed_ids = []
+        counts = {}
+        for user_id, user_games in incoming.items():
+            current_games = stored[user_id]
+            inserted = updated = 0
+            for appid, values in user_games.items():
+                current = current_games.get(appid)
+                if current is None:
+                    inserted += 1
+                elif any(current[field] != values[field] for field in SYNCED_FIELDS):
+                    updated += 1
+                else:
+                    continue
+                upserts.append(SteamGame(user_id=user_id, appid=appid, last_synced=now, **values))
+            gone = [row['id'] for appid, row in current_games.items() if appid not in user_games]
+            removed_ids.extend(gone)
+            counts[user_id] = SyncResult(inserted, updated, len(gone), len(user_games) - inserted - updated)
+
+        if upserts:
+            SteamGame.objects.bulk_create(
+                upserts,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['user', 'appid'],
+                update_fields=SYNCED_FIELDS + ['last_synced'],
+            )
+        if removed_ids:
+            SteamGame.objects.filter(pk__in=removed_ids).delete()
+
+    return counts
@@ -0,0 +1,111 @@
+"""
+Local copies of Steam game artwork.
+
+Game logos and icons used to be hotlinked from media.steampowered.com over
+plain HTTP. The steam_artwork view now serves them from MEDIA_ROOT instead:
+the first request for an (appid, image hash) downloads the image once,
+re-encodes it as a JPEG in every size of ARTWORK_SIZES and stores the
+results under steam/artwork/<appid>/. Later requests just send the stored
+file. Steam image hashes change whenever the artwork does, so the files
+never go stale and are served with a long-lived immutable Cache-Control.
+"""
+import io
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from PIL import Image, ImageOps, UnidentifiedImageError
+from requests.exceptions import RequestException
+
+from .models import SteamGame
+from .steam_client import get_steam_client
+
+DEFAULT_STEAM_MEDIA_URL = 'https://media.steampowered.com/steamcommunity/public/images/apps/'
+
+ARTWORK_SIZES = {
+    'icon': (32, 32),
+    'logo': (184, 69),
+}
+
+IMAGE_HASH_RE = re.compile(r'^[0-9a-f]{40}$')
+
+# Upstream misses are remembered so a broken image isn't refetched on every view
+MISSING_TIMEOUT = 3600
+
+
+class ArtworkUnavailable(Exception):
+    def __init__(self, message, status=404):
+        super().__init__(message)
+        self.status = status
+
+
+def artwork_name(appid, image_hash, size):
+    """Storage name of one normalized artwork file"""
+    return f'steam/artwork/{appid}/{image_hash}_{size}.jpg'
+
+
+def _missing_key(appid, image_hash):
+    return f'steam:artwork:missing:{appid}:{image_hash}'
+
+
+def _download(appid, image_hash):
+    base_url = getattr(settings, 'STEAM_MEDIA_URL', DEFAULT_STEAM_MEDIA_URL)
+    url = f'{base_url.rstrip("/")}/{appid}/{image_hash}.jpg'
+    try:
+        response = get_steam_client().session.get(url, timeout=getattr(settings, 'STEAM_API_TIMEOUT', 10))
+    except RequestException as e:
+        raise ArtworkUnavailable(f'Could not fetch artwork: {e}', status=502)
+    if response.status_code == 404:
+        cache.set(_missing_key(appid, image_hash), True, MISSING_TIMEOUT)
+        raise ArtworkUnavailable('Artwork not found on Steam')
+    if response.status_code != 200:
+        raise ArtworkUnavailable(f'Steam media error: {response.status_code}', status=502)
+    return response.content
+
+
+def _store_sizes(appid, image_hash, data):
+    try:
+        source = Image.open(io.BytesIO(data))
+        source.load()
+    except (UnidentifiedImageError, OSError):
+        cache.set(_missing_key(appid, image_hash), True, MISSING_TIMEOUT)
+        raise ArtworkUnavailable('Steam returned an unreadable image')
+    source = source.convert('RGB')
+
+    for size, dimensions in ARTWORK_SIZES.items():
+        image = ImageOps.fit(source, dimensions, Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+        name = artwork_name(appid, image_hash, size)
+        if default_storage.exists(name):
+            continue
+        saved = default_storage.save(name, ContentFile(buffer.getvalue()))
+        if saved != name:
+            # Another request stored the same file first
+            default_storage.delete(saved)
+
+
+def get_artwork(appid, image_hash, size):
+    """
+    Storage name of an artwork file, fetching it from Steam on first use.
+    Only images of games someone has synced are fetched.
+    Raises ArtworkUnavailable when the image can't be served.
+    """
+    if size not in ARTWORK_SIZES or not IMAGE_HASH_RE.match(image_hash):
+        raise ArtworkUnavailable('Unknown artwork')
+
+    name = artwork_name(appid, image_hash, size)
+    if default_storage.exists(name):
+        return name
+
+    if cache.get(_missing_key(appid, image_hash)):
+        raise ArtworkUnavailable('Artwork not found on Steam')
+    known = SteamGame.objects.filter(Q(img_logo_url=image_hash) | Q(img_icon_url=image_hash), appid=appid)
+    if not known.exists():
+        raise ArtworkUnavailable('Unknown artwork')
+
+    _store_sizes(appid, image_hash, _download(appid, image_hash))
+    return name
@@ -0,0 +1,255 @@
+"""
+Client for the Steam Web API.
+
+One SteamClient per process holds a pooled requests.Session, so calls reuse
+keep-alive connections instead of opening a new one each time. In front of
+the network it has:
+
+- a response cache (the Django cache) keyed by Steam ID, so syncing the
+  same account again within STEAM_API_CACHE_TTL seconds costs no API call;
+- a token bucket that keeps this process under STEAM_API_RATE_LIMIT
+  requests per second, with bursts of up to STEAM_API_BURST;
+- a circuit breaker that stops calling Steam for STEAM_API_CIRCUIT_RESET
+  seconds after STEAM_API_CIRCUIT_THRESHOLD retryable failures in a row,
+  then lets a single trial request through.
+
+Requests refused by the rate limiter or the open circuit raise a retryable
+SteamAPIError, so queued jobs (app/jobs.py) simply try again later.
+Latency, errors and cache hits are counted in `client.metrics`.
+"""
+import threading
+import time
+from collections import Counter
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+DEFAULT_STEAM_API_URL = "http://api.steampowered.com/IPlayerService/GetRecentlyPlayedGames/v0001/"
+
+
+class SteamAPIError(ValueError):
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take a token, waiting up to `timeout` seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a request may go out now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let one trial request through
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class ClientMetrics:
+    """Request counters and latency totals of one client"""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._lock = threading.Lock()
+
+    def incr(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def observe(self, seconds):
+        with self._lock:
+            self._counts['requests'] += 1
+            self._latency_total += seconds
+            self._latency_max = max(self._latency_max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            requests_made = self._counts['requests']
+            return {
+                **self._counts,
+                'latency_avg': self._latency_total / requests_made if requests_made else 0.0,
+                'latency_max': self._latency_max,
+            }
+
+
+class SteamClient:
+
+    def __init__(self, api_url=None, api_key=None, timeout=None, rate_limit=None, burst=None, pool_size=None):
+        self.api_url = api_url or getattr(settings, 'STEAM_API_URL', DEFAULT_STEAM_API_URL)
+        self.api_key = api_key if api_key is not None else getattr(settings, 'STEAM_API_KEY', '')
+        self.timeout = timeout or getattr(settings, 'STEAM_API_TIMEOUT', 10)
+        self.cache_ttl = getattr(settings, 'STEAM_API_CACHE_TTL', 300)
+
+        pool_size = pool_size or getattr(settings, 'STEAM_API_POOL_SIZE', 10)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.rate_limiter = TokenBucket(
+            rate=rate_limit or getattr(settings, 'STEAM_API_RATE_LIMIT', 1.0),
+            capacity=burst or getattr(settings, 'STEAM_API_BURST', 5),
+        )
+        self.circuit = CircuitBreaker(
+            threshold=getattr(settings, 'STEAM_API_CIRCUIT_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'STEAM_API_CIRCUIT_RESET', 60),
+        )
+        self.metrics = ClientMetrics()
+
+    def _cache_key(self, steam_id):
+        return f'steam:recently_played:{steam_id}'
+
+    def get_recently_played(self, steam_id, use_cache=True):
+        """
+        Recently played games of a Steam account.
+        Bad ids, bad keys and private/unknown profiles are permanent errors;
+        timeouts, rate limiting and Steam server errors are retryable.
+        """
+        steam_id = str(steam_id).strip()
+        if not steam_id or not steam_id.isdigit():
+            raise SteamAPIError(f"❌ Invalid Steam ID: {steam_id}")
+
+        if use_cache:
+            games = cache.get(self._cache_key(steam_id))
+            if games is not None:
+                self.metrics.incr('cache_hits')
+                return games
+            self.metrics.incr('cache_misses')
+
+        games = self._request(steam_id)
+        cache.set(self._cache_key(steam_id), games, self.cache_ttl)
+        return games
+
+    def _request(self, steam_id):
+        # Rate limit first: once allow() has let a half-open trial through,
+        # nothing may stop it before its outcome is recorded
+        if not self.rate_limiter.acquire(timeout=self.timeout):
+            self.metrics.incr('rate_limited')
+            raise SteamAPIError("❌ Too many Steam requests, try again later.", retryable=True)
+        if not self.circuit.allow():
+            self.metrics.incr('circuit_open')
+            raise SteamAPIError("❌ Steam API is unavailable, try again later.", retryable=True)
+
+        try:
+            return self._send(steam_id)
+        except SteamAPIError:
+            raise
+        except Exception:
+            # Anything unexpected still counts, or a trial would leave the circuit half open
+            self._failed('unexpected')
+            raise
+
+    def _send(self, steam_id):
+        params = {
+            'steamid': steam_id,
+            'key': self.api_key,
+            'format': 'json',
+            'include_appinfo': True,
+        }
+        started = time.monotonic()
+        try:
+            response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            self._failed('network')
+            raise SteamAPIError(f"❌ Network Error: {e}", retryable=True)
+        finally:
+            self.metrics.observe(time.monotonic() - started)
+
+        if response.status_code == 400:
+            self._failed('client', trip=False)
+            raise SteamAPIError("❌ Error 400: Bad Request. Invalid Steam ID format.")
+        if response.status_code == 403:
+            self._failed('client', trip=False)
+            raise SteamAPIError("❌ Error 403: API Key invalid or domain mismatch.")
+        if response.status_code != 200:
+            retryable = response.status_code == 429 or response.status_code >= 500
+            self._failed('server' if retryable else 'client', trip=retryable)
+            raise SteamAPIError(f"❌ Steam API Error: {response.status_code}", retryable=retryable)
+
+        try:
+            data = response.json()
+        except ValueError:
+            self._failed('invalid_response')
+            raise SteamAPIError("❌ Steam API returned an invalid response.", retryable=True)
+
+        self.circuit.record_success()
+        # An empty list is fine: private profile or nothing played recently
+        return data.get('response', {}).get('games', [])
+
+    def _failed(self, kind, trip=True):
+        self.metrics.incr(f'errors_{kind}')
+        if trip:
+            self.circuit.record_failure()
+        else:
+            # Steam answered, it is our request that was wrong
+            self.circuit.record_success()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_steam_client():
+    """The process-wide SteamClient, created on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SteamClient()
+    return _client
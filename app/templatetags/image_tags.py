@@ -0,0 +1,36 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from app.images import manifest_for, srcset, variant_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(field_file, manifest, sizes='100vw', alt='', lazy=True):
+    """
+    <picture> with WebP/JPEG srcsets for an image that has variants, or a
+    plain <img> of the original while it has none (yet, or because it
+    could not be read).
+    Usage: {% responsive_image post.image post.image_variants sizes="(max-width: 768px) 100vw, 400px" alt=post.title %}
+    """
+    if not field_file:
+        return ''
+    loading = 'lazy' if lazy else 'eager'
+    manifest = manifest_for(field_file, manifest)
+    if manifest is None or not manifest['widths']:
+        return format_html('<img src="{}" alt="{}" loading="{}" />', field_file.url, alt, loading)
+
+    fallback = default_storage.url(variant_name(field_file.name, manifest['widths'][-1], 'jpg'))
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}" />'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async"'
+        ' style="background: url({}) center / cover no-repeat;" />'
+        '</picture>',
+        srcset(field_file.name, manifest, 'webp'), sizes,
+        fallback, srcset(field_file.name, manifest, 'jpg'), sizes,
+        manifest['width'], manifest['height'], alt, loading,
+        manifest['placeholder'],
+    )
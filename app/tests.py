@@ -1,3 +1,1127 @@
-from django.test import TestCase
+import io
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.db.models.query import QuerySet
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from blogapp import metrics
+
+from . import search, slugs, steam_client, trending
+from .author_stats import rebuild_author_stats
+from .counters import bump_counter
+from .engagement import toggle_like
+from .forms import PostForm
+from .images import variant_name
+from .jobs import claim_next_job, requeue_stale_jobs, retry_delay, run_job
+from .pagination import encode_cursor, paginate_posts
+from .models import (
+    AuthorStats, AuthorVisitorSketch, Comments, ContentGenre, ContentType, Post, PostViewRollup, Profile, RelatedPost, SteamGame,
+    SteamSyncJob, Tag, TrendingState, ViewEvent,
+)
+from .sidebar import get_sidebar
+from .steam_artwork import artwork_name
+from .steam_client import CircuitBreaker, SteamAPIError, SteamClient, TokenBucket
+from .view_counter import ViewCountBuffer, view_counter
+from .view_events import ViewEventLog, rollup, view_log
+from .visitors import VisitorBuffer, unique_visitors, visitor_buffer
+
+
+class StubServer:
+    """
+    Local HTTP server standing in for Steam. `responses` maps a path or
+    query substring to (status, content type, body); unmatched requests
+    get a 404. Requests made are collected in `requests`.
+    """
+
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(self.path)
+                for key, (status, content_type, body) in stub.responses.items():
+                    if key in self.path:
+                        break
+                else:
+                    status, content_type, body = 404, 'text/plain', b''
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def steam_games_response(count):
+    games = [
+        {'appid': i, 'name': f'Game {i}', 'playtime_2weeks': i, 'playtime_forever': 10 * i}
+        for i in range(1, count + 1)
+    ]
+    return 200, 'application/json', json.dumps({'response': {'total_count': count, 'games': games}}).encode()
+
+
+class SteamSyncJobQueueTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('player', password='pw')
+
+    def test_claim_marks_job_running(self):
+        job = SteamSyncJob.objects.create(user=self.user, steam_id='76561197960265729')
+
+        claimed = claim_next_job()
+
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, SteamSyncJob.STATUS_RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNotNone(claimed.started_at)
+        self.assertIsNone(claim_next_job())
+
+    def test_claim_skips_jobs_not_due(self):
+        SteamSyncJob.objects.create(
+            user=self.user, steam_id='76561197960265729', run_after=timezone.now() + timedelta(minutes=5),
+        )
+        self.assertIsNone(claim_next_job())
+
+    def test_claim_moves_on_when_another_worker_wins(self):
+        first = SteamSyncJob.objects.create(user=self.user, steam_id='1', run_after=timezone.now() - timedelta(minutes=2))
+        second = SteamSyncJob.objects.create(user=self.user, steam_id='2', run_after=timezone.now() - timedelta(minutes=1))
+        original_first = QuerySet.first
+
+        def first_then_steal(queryset):
+            # Another worker claims the job between our SELECT and UPDATE
+            result = original_first(queryset)
+            if result == first.pk:
+                SteamSyncJob.objects.filter(pk=first.pk).update(status=SteamSyncJob.STATUS_RUNNING)
+            return result
+
+        with mock.patch.object(QuerySet, 'first', autospec=True, side_effect=first_then_steal):
+            claimed = claim_next_job()
+
+        self.assertEqual(claimed.pk, second.pk)
+        first.refresh_from_db()
+        self.assertEqual(first.attempts, 0)
+
+    @override_settings(STEAM_SYNC_RETRY_BASE_DELAY=30, STEAM_SYNC_RETRY_MAX_DELAY=3600)
+    def test_retry_delay_backs_off_exponentially_with_cap(self):
+        for attempts, delay in ((1, 30), (2, 60), (4, 240), (10, 3600)):
+            with self.subTest(attempts=attempts):
+                self.assertGreaterEqual(retry_delay(attempts), delay)
+                self.assertLessEqual(retry_delay(attempts), delay * 1.1)
+
+    @override_settings(STEAM_SYNC_JOB_LEASE=60)
+    def test_stale_running_jobs_are_requeued_or_failed(self):
+        started = timezone.now() - timedelta(minutes=5)
+        retry = SteamSyncJob.objects.create(
+            user=self.user, steam_id='1', status=SteamSyncJob.STATUS_RUNNING, attempts=1, started_at=started,
+        )
+        exhausted = SteamSyncJob.objects.create(
+            user=self.user, steam_id='2', status=SteamSyncJob.STATUS_RUNNING, attempts=5, started_at=started,
+        )
+
+        self.assertEqual(requeue_stale_jobs(), 2)
+
+        retry.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retry.status, SteamSyncJob.STATUS_QUEUED)
+        self.assertEqual(exhausted.status, SteamSyncJob.STATUS_FAILED)
+
+
+class SteamSyncJobRunTests(TestCase):
+    """Runs jobs against a local stub of the Steam API"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('player', password='pw')
+        cache.clear()
+        self.stub = StubServer({
+            'steamid=111': steam_games_response(3),
+            'steamid=503': (503, 'text/plain', b''),
+            'steamid=403': (403, 'text/plain', b''),
+        }).__enter__()
+        self.addCleanup(self.stub.__exit__, None, None, None)
+        settings_override = override_settings(STEAM_API_URL=self.stub.url, STEAM_API_RATE_LIMIT=1000)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # A fresh process-wide client that reads the settings above
+        patcher = mock.patch.object(steam_client, '_client', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_claimed(self, steam_id):
+        SteamSyncJob.objects.create(user=self.user, steam_id=steam_id)
+        return run_job(claim_next_job())
+
+    def test_success_stores_games(self):
+        job = self.run_claimed('111')
+
+        self.assertEqual(job.status, SteamSyncJob.STATUS_SUCCEEDED)
+        self.assertEqual(job.games_inserted, 3)
+        self.assertEqual(SteamGame.objects.filter(user=self.user).count(), 3)
+
+    def test_server_error_is_retried_later(self):
+        job = self.run_claimed('503')
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SteamSyncJob.STATUS_QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('503', job.last_error)
+        self.assertIsNone(claim_next_job())
+
+    def test_client_error_fails_without_retry(self):
+        job = self.run_claimed('403')
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SteamSyncJob.STATUS_FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_last_attempt_fails_the_job(self):
+        SteamSyncJob.objects.create(user=self.user, steam_id='503', max_attempts=1)
+
+        job = run_job(claim_next_job())
+
+        self.assertEqual(job.status, SteamSyncJob.STATUS_FAILED)
+
+
+class SyncAllSteamTests(TestCase):
+    """sync_all_steam against a local stub of the Steam API"""
+
+    def setUp(self):
+        cache.clear()
+        self.stub = StubServer({
+            'steamid=111': steam_games_response(2),
+            'steamid=222': steam_games_response(3),
+        }).__enter__()
+        self.addCleanup(self.stub.__exit__, None, None, None)
+        settings_override = override_settings(STEAM_API_URL=self.stub.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.checkpoint = os.path.join(tmp_dir, 'checkpoint.json')
+
+    def add_player(self, username, steam_id):
+        user = User.objects.create_user(username, password='pw')
+        Profile.objects.filter(user=user).update(steam_id=steam_id)
+        return user
+
+    def sync(self):
+        out = io.StringIO()
+        call_command('sync_all_steam', checkpoint=self.checkpoint, workers=2, rate=1000, stdout=out)
+        return out.getvalue()
+
+    def test_nothing_to_sync(self):
+        output = self.sync()
+
+        self.assertIn('Synced 0 of 0 profiles', output)
+        self.assertEqual(self.stub.requests, [])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resumes_from_checkpoint(self):
+        first = self.add_player('first', '111')
+        second = self.add_player('second', '222')
+        # An interrupted run that got through the first profile
+        with open(self.checkpoint, 'w') as f:
+            json.dump({
+                'cutoff': timezone.now().isoformat(),
+                'cursor': [None, first.profile.pk],
+                'processed': 1, 'failed': 0, 'inserted': 2, 'updated': 0, 'removed': 0,
+            }, f)
+
+        output = self.sync()
+
+        self.assertIn('Resuming run from 1 profiles', output)
+        self.assertIn('Synced 2 of 2 profiles: 5 games added', output)
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertIn('steamid=222', self.stub.requests[0])
+        self.assertEqual(SteamGame.objects.filter(user=second).count(), 3)
+        self.assertFalse(SteamGame.objects.filter(user=first).exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+class TokenBucketTests(TestCase):
+
+    def test_burst_then_refuses_until_refilled(self):
+        bucket = TokenBucket(rate=1000, capacity=2)
+        with mock.patch('app.steam_client.time.monotonic', return_value=100.0):
+            bucket._updated = 100.0
+            self.assertTrue(bucket.acquire(timeout=0))
+            self.assertTrue(bucket.acquire(timeout=0))
+            self.assertFalse(bucket.acquire(timeout=0))
+        with mock.patch('app.steam_client.time.monotonic', return_value=100.002):
+            self.assertTrue(bucket.acquire(timeout=0))
+
+    def test_waits_for_a_token_within_timeout(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertTrue(bucket.acquire(timeout=1))
+
+
+class CircuitBreakerTests(TestCase):
+
+    def test_opens_after_threshold_failures(self):
+        breaker = CircuitBreaker(threshold=3, reset_timeout=60)
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_trial_closes_or_reopens(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+        breaker.record_failure()
+
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # Only one trial at a time
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+
+class SteamClientTests(TestCase):
+    """The Steam client against a local stub of the Steam API"""
+
+    def setUp(self):
+        cache.clear()
+        self.stub = StubServer({
+            'steamid=111': steam_games_response(2),
+            'steamid=503': (503, 'text/plain', b''),
+            'steamid=403': (403, 'text/plain', b''),
+        }).__enter__()
+        self.addCleanup(self.stub.__exit__, None, None, None)
+        self.client = SteamClient(api_url=self.stub.url, rate_limit=1000, burst=10)
+        self.client.circuit = CircuitBreaker(threshold=2, reset_timeout=0)
+
+    def test_responses_are_cached(self):
+        self.assertEqual(len(self.client.get_recently_played('111')), 2)
+        self.assertEqual(len(self.client.get_recently_played('111')), 2)
+
+        self.assertEqual(len(self.stub.requests), 1)
+        metrics = self.client.metrics.snapshot()
+        self.assertEqual(metrics['cache_hits'], 1)
+        self.assertEqual(metrics['requests'], 1)
+
+    def test_errors_are_classified(self):
+        with self.assertRaises(SteamAPIError) as server_error:
+            self.client.get_recently_played('503')
+        self.assertTrue(server_error.exception.retryable)
+        with self.assertRaises(SteamAPIError) as client_error:
+            self.client.get_recently_played('403')
+        self.assertFalse(client_error.exception.retryable)
+
+    def test_server_errors_open_the_circuit(self):
+        self.client.circuit.reset_timeout = 60
+        for _ in range(2):
+            with self.assertRaises(SteamAPIError):
+                self.client.get_recently_played('503')
+
+        with self.assertRaises(SteamAPIError) as refused:
+            self.client.get_recently_played('111')
+
+        self.assertTrue(refused.exception.retryable)
+        self.assertEqual(len(self.stub.requests), 2)
+        self.assertEqual(self.client.metrics.snapshot()['circuit_open'], 1)
+
+    def test_rate_limited_request_does_not_use_up_the_trial(self):
+        self.client.circuit.record_failure()
+        self.client.circuit.record_failure()
+        with mock.patch.object(self.client.rate_limiter, 'acquire', return_value=False):
+            with self.assertRaises(SteamAPIError):
+                self.client.get_recently_played('111')
+
+        self.assertEqual(self.client.circuit.state, CircuitBreaker.OPEN)
+        self.assertEqual(len(self.client.get_recently_played('111')), 2)
+        self.assertEqual(self.client.circuit.state, CircuitBreaker.CLOSED)
+
+    def test_unexpected_error_in_trial_reopens_the_circuit(self):
+        self.client.circuit.record_failure()
+        self.client.circuit.record_failure()
+        with mock.patch.object(self.client.session, 'get', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.client.get_recently_played('111')
+
+        self.assertEqual(self.client.circuit.state, CircuitBreaker.OPEN)
+        self.assertEqual(len(self.client.get_recently_played('111')), 2)
+        self.assertEqual(self.client.circuit.state, CircuitBreaker.CLOSED)
+
+
+class SteamArtworkTests(TestCase):
+    """The artwork proxy against a local stand-in for Steam's image server"""
+
+    logo_hash = 'a' * 40
+    missing_hash = 'b' * 40
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        image = io.BytesIO()
+        Image.new('RGB', (231, 87), (200, 30, 30)).save(image, 'JPEG')
+        self.stub = StubServer({
+            f'/570/{self.logo_hash}.jpg': (200, 'image/jpeg', image.getvalue()),
+        }).__enter__()
+        self.addCleanup(self.stub.__exit__, None, None, None)
+        settings_override = override_settings(MEDIA_ROOT=media_root, STEAM_MEDIA_URL=self.stub.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch.object(steam_client, '_client', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create_user('player', password='pw')
+        SteamGame.objects.create(user=user, appid=570, name='Game', img_logo_url=self.logo_hash)
+        SteamGame.objects.create(user=user, appid=620, name='Other', img_logo_url=self.missing_hash)
+
+    def artwork(self, image_hash, size='logo', appid=570):
+        return self.client.get(reverse('app:steam_artwork', kwargs={
+            'appid': appid, 'image_hash': image_hash, 'size': size,
+        }))
+
+    def test_fetches_once_and_stores_every_size(self):
+        response = self.artwork(self.logo_hash)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (184, 69))
+        self.assertTrue(default_storage.exists(artwork_name(570, self.logo_hash, 'icon')))
+
+        self.assertEqual(self.artwork(self.logo_hash, size='icon').status_code, 200)
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_upstream_miss_is_remembered(self):
+        self.assertEqual(self.artwork(self.missing_hash, appid=620).status_code, 404)
+        self.assertEqual(self.artwork(self.missing_hash, appid=620).status_code, 404)
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_unknown_artwork_is_not_fetched(self):
+        self.assertEqual(self.artwork('c' * 40).status_code, 404)
+        self.assertEqual(self.artwork(self.logo_hash, size='huge').status_code, 404)
+        self.assertEqual(self.stub.requests, [])
+
+
+class AuthorStatsLikesTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='pw')
+        self.reader = User.objects.create_user('reader', password='pw')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post = Post.objects.create(title='Post', content='Text', slug='post', author=self.author)
+        rebuild_author_stats([self.author.pk])
+        # Write the buffered trending score while the test database exists
+        self.addCleanup(trending.trending_buffer.flush)
+
+    def likes_received(self):
+        return AuthorStats.objects.get(user=self.author).likes_received
+
+    def test_toggle_like_updates_likes_received(self):
+        toggle_like(self.post.pk, self.reader.pk)
+        self.assertEqual(self.likes_received(), 1)
+
+        toggle_like(self.post.pk, self.reader.pk)
+        self.assertEqual(self.likes_received(), 0)
+
+    def test_related_manager_updates_likes_received(self):
+        self.post.likes.add(self.reader)
+        self.assertEqual(self.likes_received(), 1)
+
+        self.post.likes.clear()
+        self.assertEqual(self.likes_received(), 0)
+
+
+class ViewEventRollupTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now().replace(hour=12, minute=30)
+        author = User.objects.create_user('author', password='pw')
+        self.post = Post.objects.create(title='Post', content='Text', slug='post', author=author)
+        self.addCleanup(trending.trending_buffer.flush)
+
+    def log(self, *ages):
+        ViewEvent.objects.bulk_create([ViewEvent(post=self.post, viewed_at=self.now - age) for age in ages])
+
+    def views(self, period):
+        return dict(PostViewRollup.objects.filter(period=period).values_list('start', 'views'))
+
+    def test_counts_each_event_once(self):
+        self.log(timedelta(minutes=5), timedelta(minutes=10), timedelta(hours=2))
+        rollup(now=self.now)
+        rollup(now=self.now)
+
+        hour = self.now.replace(minute=0, second=0, microsecond=0)
+        self.assertEqual(self.views(PostViewRollup.HOUR), {hour: 2, hour - timedelta(hours=2): 1})
+        self.assertEqual(sum(self.views(PostViewRollup.DAY).values()), 3)
+
+    def test_late_events_are_counted(self):
+        self.log(timedelta(minutes=5))
+        rollup(now=self.now)
+        # Flushed long after the view, into an hour rolled up before
+        self.log(timedelta(hours=5), timedelta(minutes=5))
+        rollup(now=self.now)
+
+        hour = self.now.replace(minute=0, second=0, microsecond=0)
+        self.assertEqual(self.views(PostViewRollup.HOUR), {hour: 2, hour - timedelta(hours=5): 1})
+
+    def test_full_rebuild_matches_incremental(self):
+        self.log(timedelta(minutes=5), timedelta(hours=3), timedelta(days=2))
+        rollup(now=self.now)
+        incremental = self.views(PostViewRollup.HOUR), self.views(PostViewRollup.DAY)
+
+        rollup(full=True, now=self.now)
+
+        self.assertEqual((self.views(PostViewRollup.HOUR), self.views(PostViewRollup.DAY)), incremental)
+
+    @override_settings(VIEW_EVENT_RETENTION_DAYS=1, VIEW_ROLLUP_HOURLY_RETENTION_DAYS=1)
+    def test_prunes_whole_days(self):
+        self.log(timedelta(hours=13), timedelta(hours=40))
+        rollup(now=self.now)
+
+        # Yesterday 23:30 is kept with the rest of yesterday, the day before is not
+        self.assertEqual(ViewEvent.objects.count(), 1)
+        self.assertEqual(len(self.views(PostViewRollup.HOUR)), 1)
+        self.assertEqual(sum(self.views(PostViewRollup.DAY).values()), 2)
+
+    def test_buffered_events_are_bulk_inserted(self):
+        log = ViewEventLog(flush_interval=3600, flush_threshold=3)
+        log.record(self.post.pk)
+        log.record(self.post.pk)
+        self.assertEqual(ViewEvent.objects.count(), 0)
+
+        log.record(self.post.pk)
+
+        self.assertEqual(ViewEvent.objects.count(), 3)
+
+
+class VisitorSketchTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='pw')
+        self.posts = [
+            Post.objects.create(title=f'Post {i}', content='Text', slug=f'post-{i}', author=self.author)
+            for i in range(2)
+        ]
+        rebuild_author_stats([self.author.pk])
+        self.addCleanup(trending.trending_buffer.flush)
+        self.buffer = VisitorBuffer(flush_interval=3600, flush_threshold=1000)
+
+    def visit(self, post, reader):
+        request = RequestFactory().get('/')
+        request.user = reader
+        self.buffer.record(post.pk, request)
+
+    def test_flush_updates_post_and_author_sketches(self):
+        readers = [User.objects.create_user(f'reader{i}', password='pw') for i in range(3)]
+        for reader in readers:
+            self.visit(self.posts[0], reader)
+        # Readers of both posts count once for the author
+        self.visit(self.posts[1], readers[0])
+        self.visit(self.posts[1], readers[0])
+
+        self.assertEqual(self.buffer.flush(), 5)
+
+        self.assertEqual(
+            dict(Post.objects.values_list('pk', 'unique_viewers')),
+            {self.posts[0].pk: 3, self.posts[1].pk: 1},
+        )
+        self.assertEqual(AuthorStats.objects.get(user=self.author).unique_visitors, 3)
+        sketches = AuthorVisitorSketch.objects.filter(user=self.author)
+        self.assertEqual(sketches.count(), 2)
+        self.assertEqual(unique_visitors(sketches, since=timezone.localdate()), 3)
+
+    def test_rebuild_keeps_unique_visitors(self):
+        self.visit(self.posts[0], User.objects.create_user('reader', password='pw'))
+        self.buffer.flush()
+
+        rebuild_author_stats([self.author.pk])
+
+        self.assertEqual(AuthorStats.objects.get(user=self.author).unique_visitors, 1)
+
+
+class WriteBehindBufferTests(TestCase):
+
+    def test_timer_flushes_without_another_record(self):
+        written = []
+        flushed = threading.Event()
+
+        class Buffer(ViewCountBuffer):
+            def write(self, batch):
+                written.append(dict(batch))
+                flushed.set()
+
+        buffer = Buffer(flush_interval=0.1, flush_threshold=100)
+        buffer.record(1)
+        buffer.record(1)
+        buffer.record(2)
+        self.assertEqual(written, [])
+
+        self.assertTrue(flushed.wait(5))
+        self.assertEqual(written, [{1: 2, 2: 1}])
+
+
+@override_settings(RELATED_POSTS_KEEP=2)
+class RelatedPostsTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='pw')
+        self.tag = Tag.objects.create(name='Puzzle')
+        self.addCleanup(trending.trending_buffer.flush)
+
+    def create_post(self, title, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title=title, content='Text', author=self.author, **fields)
+            post.tags.add(self.tag)
+        return post
+
+    def test_candidate_lists_are_trimmed(self):
+        posts = [self.create_post(f'Post {i}') for i in range(5)]
+
+        for post in posts:
+            self.assertEqual(RelatedPost.objects.filter(post=post).count(), 2)
+
+    def test_only_genre_or_type_changes_recompute(self):
+        content_type, _ = ContentType.objects.get_or_create(name='game', defaults={'display_name': 'Game'})
+        genre = ContentGenre.objects.create(content_type=content_type, name='Puzzle')
+        post = self.create_post('Post')
+
+        with mock.patch('app.signals.update_related_posts') as update, \
+                self.captureOnCommitCallbacks(execute=True):
+            post.title = 'Renamed'
+            post.save()
+            self.assertFalse(update.called)
+
+            post.content_type = content_type
+            post.content_genre = genre
+            post.save()
+
+        update.assert_called_once_with(post.pk)
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN='secret')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_file(self, pid, count):
+        entry = [0] * len(metrics.QUERY_BUCKETS) + [count, count]
+        with open(os.path.join(self.directory, f'metrics-{pid}-test.json'), 'w') as f:
+            json.dump([['django_view_queries', 'home', entry]], f)
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_files_of_exited_processes_are_merged(self):
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        self.write_file(exited.pid, 2)
+        self.write_file(os.getpid(), 3)
+
+        for _ in range(2):
+            totals = metrics.collect()
+            self.assertEqual(totals[('django_view_queries', 'home')][-1], 5)
+
+        self.assertEqual(
+            set(os.listdir(self.directory)),
+            {'.lock', metrics.EXITED_FILE, f'metrics-{os.getpid()}-test.json'},
+        )
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='pw')
+        self.post = Post.objects.create(title='Post', content='Text', slug='post', author=self.author)
+        self.url = reverse('app:post_page', args=[self.post.slug])
+        for buffer in (trending.trending_buffer, view_counter, view_log, visitor_buffer):
+            self.addCleanup(buffer.flush)
+
+    def test_conditional_requests_follow_the_etag(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        self.assertNotIn('Last-Modified', first)
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        # A new comment changes the page but not the post
+        with self.captureOnCommitCallbacks(execute=True):
+            Comments.objects.create(
+                post=self.post, author=self.author, content='First!', name='author', email='a@example.com',
+            )
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertContains(second, 'First!')
+        # If-Modified-Since alone can't tell the page changed, so it is ignored
+        later = http_date(timezone.now().timestamp() + 3600)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=later).status_code, 200)
+
+
+class PostFormContentTypeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.content_type, _ = ContentType.objects.get_or_create(name='game', defaults={'display_name': 'Game'})
+        self.genre = ContentGenre.objects.create(content_type=self.content_type, name='Puzzle')
+
+    def form(self, content_type):
+        return PostForm(data={
+            'title': 'Post', 'content': 'Text',
+            'content_type': content_type, 'content_genre': self.genre.pk,
+        })
+
+    def test_choices_come_from_the_reference_cache(self):
+        PostForm()
+        with self.assertNumQueries(0):
+            choices = list(PostForm().fields['content_type'].choices)
+        self.assertIn((str(self.content_type.pk), 'Game'), choices)
+
+    def test_cleans_to_a_content_type(self):
+        form = self.form(self.content_type.pk)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['content_type'], self.content_type)
+
+        self.assertIn('content_type', self.form(0).errors)
+
+
+class ImageVariantTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(trending.trending_buffer.flush)
+        self.author = User.objects.create_user('author', password='pw')
+
+    def png(self, width):
+        image = io.BytesIO()
+        Image.new('RGB', (width, width // 2), (30, 120, 200)).save(image, 'PNG')
+        return image.getvalue()
+
+    def save_image(self, post, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            post.image.save(name, ContentFile(content))
+        post.refresh_from_db()
+
+    def variant_files(self, post):
+        return [variant_name(post.image.name, width, 'webp') for width in post.image_variants['widths']]
+
+    def test_replaced_image_variants_are_deleted(self):
+        post = Post.objects.create(title='Post', content='Text', author=self.author)
+        self.save_image(post, 'first.png', self.png(900))
+        old_files = self.variant_files(post)
+        self.assertEqual(len(old_files), 2)
+        self.assertTrue(all(default_storage.exists(name) for name in old_files))
+
+        self.save_image(post, 'second.png', self.png(500))
+
+        self.assertFalse(any(default_storage.exists(name) for name in old_files))
+        self.assertTrue(all(default_storage.exists(name) for name in self.variant_files(post)))
+
+    def test_unreadable_image_is_not_retried(self):
+        post = Post.objects.create(title='Post', content='Text', author=self.author)
+        self.save_image(post, 'broken.png', b'not an image')
+        self.assertEqual(post.image_variants, {'source': post.image.name, 'widths': []})
+
+        with mock.patch('app.images.Image.open') as image_open, self.captureOnCommitCallbacks(execute=True):
+            post.title = 'Renamed'
+            post.save()
+        self.assertFalse(image_open.called)
+
+
+class PostCounterTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='pw')
+        self.readers = [User.objects.create_user(f'reader{i}', password='pw') for i in range(3)]
+        self.posts = [
+            Post.objects.create(title=f'Post {i}', content='Text', author=self.author) for i in range(2)
+        ]
+        self.addCleanup(trending.trending_buffer.flush)
+
+    def counts(self, field):
+        return list(Post.objects.order_by('pk').values_list(field, flat=True))
+
+    def test_forward_changes(self):
+        post = self.posts[0]
+        post.likes.add(*self.readers)
+        post.likes.add(self.readers[0])  # already liked, not counted again
+        self.assertEqual(self.counts('like_count'), [3, 0])
+
+        post.likes.remove(self.readers[0])
+        self.assertEqual(self.counts('like_count'), [2, 0])
+
+        post.likes.clear()
+        self.assertEqual(self.counts('like_count'), [0, 0])
+
+    def test_reverse_changes(self):
+        reader = self.readers[0]
+        reader.bookmarks.add(*self.posts)
+        self.assertEqual(self.counts('bookmark_count'), [1, 1])
+
+        reader.bookmarks.remove(self.posts[0])
+        self.assertEqual(self.counts('bookmark_count'), [0, 1])
+
+        self.posts[0].bookmarks.add(self.readers[1])
+        reader.bookmarks.clear()
+        self.assertEqual(self.counts('bookmark_count'), [1, 0])
+
+    def test_comment_create_and_delete(self):
+        comments = [
+            Comments.objects.create(post=self.posts[0], author=reader, content='Hi', name='r', email='r@example.com')
+            for reader in self.readers
+        ]
+        self.assertEqual(self.counts('comment_count'), [3, 0])
+
+        comments[0].delete()
+        self.assertEqual(self.counts('comment_count'), [2, 0])
+
+    def test_reconcile_fixes_drift(self):
+        self.posts[0].likes.add(self.readers[0])
+        self.posts[1].bookmarks.add(*self.readers)
+        Comments.objects.create(post=self.posts[1], author=self.author, content='Hi', name='a', email='a@example.com')
+        # Writes that bypassed the signals
+        Post.objects.update(like_count=7, bookmark_count=0, comment_count=5)
+
+        call_command('reconcile_post_counters', batch_size=1, stdout=io.StringIO())
+
+        self.assertEqual(self.counts('like_count'), [1, 0])
+        self.assertEqual(self.counts('bookmark_count'), [0, 3])
+        self.assertEqual(self.counts('comment_count'), [0, 1])
+
+    def test_counters_never_go_negative(self):
+        bump_counter([self.posts[0].pk], 'like_count', -2)
+        self.assertEqual(self.counts('like_count'), [0, 0])
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='pw')
+        self.addCleanup(trending.trending_buffer.flush)
+        self.body_hit = self.create_post('Travel notes', '<p>Packing for a <b>dragon</b> hunt</p>')
+        self.title_hit = self.create_post('Dragon quest review', '<p>A classic game</p>')
+        self.create_post('Unrelated', '<p>Nothing to see</p>')
+
+    def create_post(self, title, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(title=title, content=content, author=self.author)
+
+    def results(self, query):
+        return list(search.SearchResults(query)[:10])
+
+    def test_title_hits_rank_first(self):
+        self.assertTrue(search.is_available())
+        self.assertEqual(self.results('dragon'), [self.title_hit, self.body_hit])
+        self.assertEqual(search.SearchResults('dragon').count(), 2)
+        # The last word is a prefix
+        self.assertEqual(self.results('drag'), [self.title_hit, self.body_hit])
+
+    def test_snippet_highlights_escaped_text(self):
+        self.create_post('Escaping', '<p>dragon &lt;script&gt;alert(1)&lt;/script&gt;</p>')
+
+        snippets = {post.title: post.snippet for post in self.results('dragon')}
+
+        self.assertIn('<mark>dragon</mark>', snippets['Travel notes'])
+        self.assertNotIn('<b>', snippets['Travel notes'])
+        self.assertNotIn('<script>', snippets['Escaping'])
+        self.assertIn('&lt;script&gt;', snippets['Escaping'])
+
+    def test_query_syntax_is_treated_as_words(self):
+        for query in ('dragon OR "', 'NEAR(dragon', 'dragon*)', '-dragon', 'title:dragon', '"^'):
+            self.assertIsInstance(self.results(query), list, query)
+        self.assertEqual(self.results('dragon AND'), [])
+        self.assertEqual(search.SearchResults('?!').count(), 0)
+
+    def test_fallback_without_fts(self):
+        with mock.patch.object(search, 'is_available', return_value=False):
+            results = search.SearchResults('dragon')
+            self.assertEqual(results.count(), 2)
+            self.assertEqual(list(results[:10]), [self.title_hit, self.body_hit])
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        author = User.objects.create_user('author', password='pw')
+        self.addCleanup(trending.trending_buffer.flush)
+        now = timezone.now()
+        # Three posts share each timestamp, so ties are broken by id
+        for i in range(7):
+            post = Post.objects.create(title=f'Post {i}', content='Text', author=author)
+            Post.objects.filter(pk=post.pk).update(created_at=now - timedelta(hours=i // 3))
+        self.expected = list(Post.objects.order_by('-created_at', 'id').values_list('pk', flat=True))
+
+    def page(self, **cursors):
+        return paginate_posts(Post.objects.all(), per_page=3, **cursors)
+
+    def ids(self, page):
+        return [post.pk for post in page]
+
+    def walk_forward(self):
+        pages = [self.page()]
+        while pages[-1].has_next:
+            pages.append(self.page(after=pages[-1].next_cursor))
+        return pages
+
+    def test_after_cursors_visit_every_post_once(self):
+        pages = self.walk_forward()
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], self.expected)
+        self.assertFalse(pages[0].has_previous)
+        self.assertTrue(pages[-1].has_previous)
+
+    def test_before_cursors_step_back_from_the_last_page(self):
+        forward = self.walk_forward()
+
+        page = forward[-1]
+        backward = [page]
+        while page.has_previous:
+            page = self.page(before=page.previous_cursor)
+            backward.append(page)
+
+        self.assertEqual([self.ids(page) for page in backward[::-1]], [self.ids(page) for page in forward])
+        self.assertFalse(backward[-1].has_previous)
+        self.assertEqual(backward[-1].next_cursor, forward[0].next_cursor)
+
+    def test_ties_on_created_at(self):
+        tied = Post.objects.get(pk=self.expected[1])
+        page = self.page(after=encode_cursor(tied))
+
+        self.assertEqual(self.ids(page), self.expected[2:5])
+
+    def test_malformed_cursors_give_the_first_page(self):
+        first = self.ids(self.page())
+        for cursor in ('garbage', '!!!', 'eHx5', 'bm90LWEtZGF0ZXwx', ''):
+            self.assertEqual(self.ids(self.page(after=cursor)), first, cursor)
+            self.assertEqual(self.ids(self.page(before=cursor)), first, cursor)
+
+
+class UniqueSlugTests(TestCase):
+
+    def setUp(self):
+        for slug in ('puzzle', 'puzzle-1', 'puzzle-3', 'puzzle-x', 'puzzles'):
+            Tag.objects.create(name=slug, slug=slug)
+
+    def test_next_free_slug_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(slugs.next_free_slug(Tag, 'Puzzle'), 'puzzle-4')
+        with self.assertNumQueries(1):
+            self.assertEqual(slugs.next_free_slug(Tag, 'Racing'), 'racing')
+
+    def test_retries_when_the_slug_was_taken_first(self):
+        real = slugs.next_free_slug
+        # A concurrent insert took the slug between the lookup and the INSERT
+        allocate = mock.Mock(side_effect=lambda *args: 'puzzle' if allocate.call_count == 1 else real(*args))
+
+        with mock.patch.object(slugs, 'next_free_slug', allocate):
+            tag = Tag.objects.create(name='Puzzle!')
+
+        self.assertEqual(allocate.call_count, 2)
+        self.assertEqual(tag.slug, 'puzzle-4')
+
+    def test_other_integrity_errors_are_raised(self):
+        with self.assertRaises(IntegrityError):
+            Tag.objects.create(name='puzzle')
+
+
+class GenreTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='pw')
+        self.addCleanup(trending.trending_buffer.flush)
+        self.content_type, _ = ContentType.objects.get_or_create(name='game', defaults={'display_name': 'Game'})
+        self.puzzle = ContentGenre.objects.create(content_type=self.content_type, name='Puzzle')
+        self.racing = ContentGenre.objects.create(content_type=self.content_type, name='Racing')
+
+    def post_counts(self):
+        genres = ContentGenre.objects.filter(pk__in=[self.puzzle.pk, self.racing.pk]).order_by('name')
+        return [genre.post_count for genre in genres]
+
+    def test_post_count_follows_posts(self):
+        post = Post.objects.create(
+            title='Post', content='Text', author=self.author, content_type=self.content_type, content_genre=self.puzzle,
+        )
+        self.assertEqual(self.post_counts(), [1, 0])
+
+        post.content_genre = self.racing
+        post.save()
+        self.assertEqual(self.post_counts(), [0, 1])
+
+        post.title = 'Renamed'
+        post.save(update_fields=['title'])
+        self.assertEqual(self.post_counts(), [0, 1])
+
+        post.delete()
+        self.assertEqual(self.post_counts(), [0, 0])
+
+    def test_etag_changes_with_the_genre_list(self):
+        url = reverse('app:api_genres') + f'?content_type={self.content_type.pk}'
+        first = self.client.get(url)
+        self.assertEqual([genre['name'] for genre in first.json()['genres']], ['Puzzle', 'Racing'])
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        # Counts aren't in the list, so they don't change the ETag
+        Post.objects.create(
+            title='Post', content='Text', author=self.author, content_type=self.content_type, content_genre=self.puzzle,
+        )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ContentGenre.objects.create(content_type=self.content_type, name='Strategy')
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(len(second.json()['genres']), 3)
+
+
+class CardQueryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(trending.trending_buffer.flush)
+        content_type, _ = ContentType.objects.get_or_create(name='game', defaults={'display_name': 'Game'})
+        genre = ContentGenre.objects.create(content_type=content_type, name='Puzzle')
+        tags = [Tag.objects.create(name=f'Tag {i}') for i in range(3)]
+        for i in range(8):
+            author = User.objects.create_user(f'author{i}', password='pw')
+            post = Post.objects.create(
+                title=f'Post {i}', content='Text', author=author, content_type=content_type, content_genre=genre,
+            )
+            post.tags.add(*tags)
+        rebuild_author_stats(User.objects.values_list('pk', flat=True))
+        self.post = Post.objects.first()
+
+    def render_cards(self, posts):
+        """Everything a post card template reads"""
+        return [
+            (post.title, post.author.profile.slug, post.first_tag, post.content_type, post.content_genre)
+            for post in posts
+        ]
+
+    def render_sidebar(self, sidebar):
+        return (
+            self.render_cards(sidebar['recent_posts']),
+            [(user.profile.slug, user.author_stats.post_count) for user in sidebar['top_authors']],
+            [tag.name for tag in sidebar['tags']],
+        )
+
+    def test_cards_take_two_queries(self):
+        for count in (2, 8):
+            with self.assertNumQueries(2):
+                cards = self.render_cards(Post.objects.cards()[:count])
+            self.assertEqual(len(cards), count)
+            self.assertTrue(all(card[2] is not None for card in cards))
+
+    def test_sidebar_queries_cold_and_warm(self):
+        # Recent posts and their tags, top authors, tags
+        with self.assertNumQueries(4):
+            self.render_sidebar(get_sidebar(self.post))
+        with self.assertNumQueries(0):
+            recent_posts, top_authors, tags = self.render_sidebar(get_sidebar(self.post))
+        self.assertEqual((len(recent_posts), len(top_authors), len(tags)), (3, 5, 3))
+
+
+class TrendingTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(trending.trending_buffer.flush)
+        author = User.objects.create_user('author', password='pw')
+        self.posts = [Post.objects.create(title=f'Post {i}', content='Text', author=author) for i in range(3)]
+        trending.trending_buffer.flush()
+        self.epoch = time.time() - 3 * 24 * 3600
+        TrendingState.objects.update_or_create(pk=TrendingState.SINGLETON_ID, defaults={'epoch': self.epoch})
+
+    def scores(self):
+        return dict(Post.objects.values_list('pk', 'trending_score'))
+
+    def ranking(self):
+        return list(Post.objects.order_by('-trending_score', '-id').values_list('pk', flat=True))
+
+    def test_renormalize_keeps_the_ranking(self):
+        for post, score in zip(self.posts, (50.0, 400.0, 120.0)):
+            Post.objects.filter(pk=post.pk).update(trending_score=score)
+        ranking, before = self.ranking(), self.scores()
+
+        factor = trending.renormalize()
+
+        self.assertAlmostEqual(factor, math.exp(-trending.decay_rate() * 3 * 24 * 3600), places=3)
+        self.assertEqual(self.ranking(), ranking)
+        for pk, score in self.scores().items():
+            self.assertAlmostEqual(score, before[pk] * factor)
+
+    def test_increment_buffered_across_a_renormalize(self):
+        post = self.posts[0]
+        Post.objects.filter(pk=post.pk).update(trending_score=100.0)
+        buffer = trending.TrendingBuffer(flush_interval=3600, flush_threshold=1000)
+        buffer.record(post.pk, trending.weight('like'))
+
+        factor = trending.renormalize()
+        buffer.flush()
+
+        # Written against the new epoch: the like counts at full weight
+        self.assertAlmostEqual(self.scores()[post.pk], 100.0 * factor + trending.weight('like'), places=3)
+
+    def test_rebuild_scores_uses_the_weights(self):
+        post = self.posts[0]
+        Post.objects.filter(pk=post.pk).update(view_count=3, like_count=2, comment_count=1)
+        TrendingState.objects.filter(pk=TrendingState.SINGLETON_ID).update(epoch=post.created_at.timestamp())
+
+        with override_settings(TRENDING_WEIGHTS={'view': 1, 'like': 5, 'comment': 8, 'post': 20}):
+            self.assertEqual(trending.rebuild_scores(batch_size=2), 3)
+
+        # Published at the epoch, so the score is the plain weighted sum
+        self.assertAlmostEqual(self.scores()[post.pk], 3 * 1 + 2 * 5 + 1 * 8 + 20)
+        self.assertEqual(self.ranking()[0], post.pk)
@@ -0,0 +1,137 @@
+"""
+Time-decayed trending scores.
+
+Views, likes, comments and publishing add weight (TRENDING_WEIGHTS) to a
+post's Post.trending_score, and every weight halves each
+TRENDING_HALF_LIFE_HOURS. Decaying every row as time passes would rewrite
+the whole table, so scores are stored relative to a reference time, the
+epoch in TrendingState: an event at time t adds weight * e^(λ(t - epoch)).
+All stored scores are then the current decayed scores times the same
+factor, so ordering by the column ranks posts by their decayed score and
+the (-trending_score, -id) index serves the top posts directly.
+
+Stored scores grow as the epoch falls behind. `manage.py
+renormalize_trending` moves the epoch to now and scales every score down in
+one transaction; it should run daily. Increments read the epoch in SQL, so
+they stay correct while it moves.
+
+Likes, comments and new posts are buffered per process like view counts
+and written in batched UPDATEs; views are added by the view count flush
+itself (app/view_counter.py).
+"""
+import math
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Subquery, Value
+from django.db.models.functions import Coalesce, Exp
+from django.utils import timezone
+
+from .models import Post, TrendingState
+from .view_counter import ViewCountBuffer, flush_at_exit, group_by_delta
+
+DEFAULT_WEIGHTS = {
+    'view': 1,
+    'like': 5,
+    'comment': 8,
+    'post': 20,
+}
+
+
+def decay_rate():
+    """λ, per second"""
+    return math.log(2) / (getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 48) * 3600)
+
+
+def weight(event):
+    return getattr(settings, 'TRENDING_WEIGHTS', DEFAULT_WEIGHTS)[event]
+
+
+def score_increment(amount, now=None):
+    """Expression adding `amount` of weight at time `now` to a stored score"""
+    now = time.time() if now is None else now
+    epoch = Subquery(
+        TrendingState.objects.filter(pk=TrendingState.SINGLETON_ID).values('epoch')[:1],
+        output_field=FloatField(),
+    )
+    age = Value(now) - Coalesce(epoch, Value(now))
+    return Value(float(amount)) * Exp(Value(decay_rate()) * age)
+
+
+class TrendingBuffer(ViewCountBuffer):
+    """Pending like/comment/post weight per post, written in batches"""
+
+    interval_setting = 'TRENDING_FLUSH_INTERVAL'
+    threshold_setting = 'TRENDING_FLUSH_THRESHOLD'
+    description = 'buffered trending weight'
+
+    def write(self, batch):
+        for amount, post_ids in group_by_delta(batch).items():
+            Post.objects.filter(pk__in=post_ids).update(
+                trending_score=F('trending_score') + score_increment(amount)
+            )
+
+
+trending_buffer = TrendingBuffer()
+flush_at_exit(trending_buffer)
+
+
+def record(post_id, event, count=1):
+    """Buffer `count` events of a post"""
+    trending_buffer.record(post_id, weight(event) * count)
+
+
+def renormalize():
+    """
+    Move the epoch to now and scale every score to match, in one
+    transaction. Returns the scale factor applied.
+    """
+    now = time.time()
+    with transaction.atomic():
+        state, _ = TrendingState.objects.select_for_update().get_or_create(
+            pk=TrendingState.SINGLETON_ID, defaults={'epoch': now},
+        )
+        factor = math.exp(-decay_rate() * (now - state.epoch))
+        Post.objects.update(trending_score=F('trending_score') * factor)
+        state.epoch = now
+        state.save()
+    return factor
+
+
+def rebuild_scores(batch_size=1000, stdout=None):
+    """
+    Recompute every score from the posts' counters, as if all engagement
+    happened when the post was published. Used after bulk imports.
+    Returns the number of posts scored.
+    """
+    rate = decay_rate()
+    now = timezone.now()
+    total = 0
+    last_id = 0
+    with transaction.atomic():
+        state, _ = TrendingState.objects.select_for_update().get_or_create(
+            pk=TrendingState.SINGLETON_ID, defaults={'epoch': now.timestamp()},
+        )
+        epoch = state.epoch
+        while True:
+            posts = list(
+                Post.objects.filter(pk__gt=last_id).order_by('pk')
+                .only('id', 'created_at', 'view_count', 'like_count', 'comment_count')[:batch_size]
+            )
+            if not posts:
+                break
+            for post in posts:
+                amount = (
+                    (post.view_count or 0) * weight('view')
+                    + post.like_count * weight('like')
+                    + post.comment_count * weight('comment')
+                    + weight('post')
+                )
+                post.trending_score = amount * math.exp(rate * (post.created_at.timestamp() - epoch))
+            Post.objects.bulk_update(posts, ['trending_score'])
+            total += len(posts)
+            last_id = posts[-1].pk
+            if stdout:
+                stdout.write(f"Scored {total} posts...")
+    return total
@@ -22,8 +22,12 @@ urlpatterns = [
     path('my_profile/', views.my_profile, name='my_profile'),
     path('recently_played/', views.recently_played, name='recently_played'),
     path('sync_steam/', views.sync_steam, name='sync_steam'),
+    path('steam/artwork/<int:appid>/<str:image_hash>/<str:size>.jpg', views.steam_artwork, name='steam_artwork'),
+    path('api/steam_sync_status/', views.steam_sync_status, name='steam_sync_status'),
     path('content_sync/', views.content_sync, name='content_sync'),
     path('api/genres/', views.get_genres_by_content_type, name='api_genres'),
+    path('api/like_post/<str:slug>/', views.api_like_post, name='api_like_post'),
+    path('api/bookmark_post/<str:slug>/', views.api_bookmark_post, name='api_bookmark_post'),
     path('edit_profile/', views.edit_profile, name='edit_profile'),
 ]
 
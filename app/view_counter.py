@@ -0,0 +1,223 @@
+"""
+Write-behind buffer for Post.view_count.
+
+post_page used to bump view_count in Python and call post.save() on every
+hit, which rewrote the whole row, touched last_modified and took the SQLite
+write lock on every request. Hits are now collected in a per-process buffer
+and applied as `F('view_count') + n` updates that only touch that column.
+
+Every gunicorn worker keeps its own buffer and flushes its own deltas, so
+counts from different workers simply add up in the database. A worker
+flushes when it holds more than VIEW_COUNT_FLUSH_THRESHOLD hits, from a
+background thread every VIEW_COUNT_FLUSH_INTERVAL seconds, so hits before
+a quiet period aren't held until the next one, and once more on exit.
+The same flush adds the hits to the posts' trending_score and the authors'
+AuthorStats.total_views.
+
+The buffering itself lives in WriteBehindBuffer, which the trending score,
+view event and unique visitor buffers (app/trending.py, app/view_events.py,
+app/visitors.py) share.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Thread-safe in-process buffer written to the database in batches.
+
+    Items are recorded in memory and written when the buffer is older than
+    the `interval_setting` seconds or holds `threshold_setting` items. A
+    daemon thread, started by the first record() in each process, flushes
+    a buffer that has waited the interval with no record() to trigger it.
+    Subclasses define how pending items are kept (empty, add, restore,
+    size) and how a batch is written (write).
+    """
+
+    interval_setting = None
+    threshold_setting = None
+    description = 'buffered items'
+
+    def __init__(self, flush_interval=None, flush_threshold=None):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending = self.empty()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self._timer_pid = None
+
+    def get_flush_interval(self):
+        if self.flush_interval is not None:
+            return self.flush_interval
+        return getattr(settings, self.interval_setting, 10)
+
+    def get_flush_threshold(self):
+        if self.flush_threshold is not None:
+            return self.flush_threshold
+        return getattr(settings, self.threshold_setting, 500)
+
+    def record(self, *args, **kwargs):
+        """Buffer an item and flush if the buffer is due"""
+        with self._lock:
+            self._size += self.add(self._pending, *args, **kwargs)
+            self._start_timer()
+            due = (
+                self._size >= self.get_flush_threshold()
+                or time.monotonic() - self._last_flush >= self.get_flush_interval()
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered items in a single transaction. On failure they
+        are put back so they are retried on the next flush. Returns the
+        number of items written.
+        """
+        with self._lock:
+            batch = self._pending
+            size = self._size
+            self._pending = self.empty()
+            self._size = 0
+            self._last_flush = time.monotonic()
+
+        if not batch:
+            return 0
+
+        try:
+            with transaction.atomic():
+                self.write(batch)
+        except DatabaseError:
+            logger.exception("Failed to flush %d %s, will retry", size, self.description)
+            with self._lock:
+                self.restore(self._pending, batch)
+                self._size = self.size(self._pending)
+            return 0
+
+        return size
+
+    def _start_timer(self):
+        """Start the periodic flusher of this process unless it is running"""
+        # Threads don't survive a fork, so each pre-forked worker starts its own
+        if self._timer_pid == os.getpid() and self._timer.is_alive():
+            return
+        self._timer = threading.Thread(target=self._flush_periodically, name=f'flush {self.description}', daemon=True)
+        self._timer_pid = os.getpid()
+        self._timer.start()
+
+    def _flush_periodically(self):
+        while True:
+            wait = self._last_flush + self.get_flush_interval() - time.monotonic()
+            if wait > 0:
+                time.sleep(min(wait, threading.TIMEOUT_MAX))
+                continue
+            with self._lock:
+                idle = not self._size
+                if idle:
+                    # Nothing to write; check again an interval from now
+                    self._last_flush = time.monotonic()
+            if idle:
+                continue
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush %s", self.description)
+            finally:
+                # Connections are per thread and this one outlives requests
+                connections.close_all()
+
+    def empty(self):
+        """A new, empty container of pending items"""
+        raise NotImplementedError
+
+    def add(self, pending, *args, **kwargs):
+        """Add an item to `pending`, returning how many items it counts for"""
+        raise NotImplementedError
+
+    def restore(self, pending, batch):
+        """Put a batch that failed to write back into `pending`"""
+        raise NotImplementedError
+
+    def size(self, pending):
+        raise NotImplementedError
+
+    def write(self, batch):
+        raise NotImplementedError
+
+
+def flush_at_exit(buffer):
+    """Flush a buffer once more when the process exits"""
+    @atexit.register
+    def flush():
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception("Failed to flush %s on exit", buffer.description)
+
+
+class ViewCountBuffer(WriteBehindBuffer):
+    """Pending view counts keyed by post id"""
+
+    interval_setting = 'VIEW_COUNT_FLUSH_INTERVAL'
+    threshold_setting = 'VIEW_COUNT_FLUSH_THRESHOLD'
+    description = 'buffered hits'
+
+    def empty(self):
+        return Counter()
+
+    def add(self, pending, post_id, hits=1):
+        pending[post_id] += hits
+        return hits
+
+    def restore(self, pending, batch):
+        pending.update(batch)
+
+    def size(self, pending):
+        return sum(pending.values())
+
+    def pending(self, post_id):
+        """Hits recorded by this process that are not in the database yet"""
+        with self._lock:
+            return self._pending.get(post_id, 0)
+
+    def write(self, batch):
+        """
+        Add a batch of views to view_count, trending_score and the authors'
+        total_views. Posts are grouped by delta so each distinct increment
+        is one UPDATE.
+        """
+        from .author_stats import bump_by_post
+        from .models import Post
+        from .trending import score_increment, weight
+
+        for hits, post_ids in group_by_delta(batch).items():
+            Post.objects.filter(pk__in=post_ids).update(
+                view_count=Coalesce(F('view_count'), 0) + hits,
+                trending_score=F('trending_score') + score_increment(hits * weight('view')),
+            )
+        bump_by_post(batch, 'total_views')
+
+
+def group_by_delta(batch):
+    """{delta: [post ids]} for a {post_id: delta} batch"""
+    by_delta = defaultdict(list)
+    for post_id, delta in batch.items():
+        by_delta[delta].append(post_id)
+    return by_delta
+
+
+view_counter = ViewCountBuffer()
+flush_at_exit(view_counter)
@@ -0,0 +1,180 @@
+"""
+Append-only log of post page views and its hourly/daily rollups.
+
+post_page (including hits served from the anonymous page cache) records a
+ViewEvent per view. Events are buffered per process like view counts and
+written with bulk inserts when the buffer is older than
+VIEW_EVENT_FLUSH_INTERVAL seconds or holds VIEW_EVENT_FLUSH_THRESHOLD
+events, and once more on exit.
+
+`manage.py rollup_view_events`, run from cron every few minutes, adds the
+events logged since its last run to per-post hourly and daily
+PostViewRollup rows, then deletes events older than
+VIEW_EVENT_RETENTION_DAYS and hourly rows older than
+VIEW_ROLLUP_HOURLY_RETENTION_DAYS; daily rows are kept. Reports (the
+admin's views over time) read the rollups only.
+
+Progress is kept as the id of the last event counted (ViewRollupState),
+advanced in the same transaction as the counts, so every event is counted
+exactly once however late its buffer was flushed. This relies on event ids
+becoming visible in order, which SQLite's single writer guarantees.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import PostViewRollup, ViewEvent, ViewRollupState
+from .view_counter import WriteBehindBuffer, flush_at_exit
+
+logger = logging.getLogger(__name__)
+
+
+class ViewEventLog(WriteBehindBuffer):
+    """Pending view events, written with bulk inserts"""
+
+    interval_setting = 'VIEW_EVENT_FLUSH_INTERVAL'
+    threshold_setting = 'VIEW_EVENT_FLUSH_THRESHOLD'
+    description = 'buffered view events'
+
+    def empty(self):
+        return []
+
+    def add(self, pending, post_id):
+        pending.append((post_id, timezone.now()))
+        return 1
+
+    def restore(self, pending, batch):
+        # Beyond VIEW_EVENT_MAX_PENDING the oldest are dropped, so a database
+        # outage can't exhaust memory
+        pending[:0] = batch
+        overflow = len(pending) - getattr(settings, 'VIEW_EVENT_MAX_PENDING', 100000)
+        if overflow > 0:
+            del pending[:overflow]
+            logger.warning("Dropped %d buffered view events", overflow)
+
+    def size(self, pending):
+        return len(pending)
+
+    def write(self, batch):
+        ViewEvent.objects.bulk_create(
+            [ViewEvent(post_id=post_id, viewed_at=viewed_at) for post_id, viewed_at in batch],
+            batch_size=self.get_flush_threshold(),
+        )
+
+
+view_log = ViewEventLog()
+flush_at_exit(view_log)
+
+
+def _start_of_day(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_counts(period, counts, batch_size):
+    """Add {(post_id, start): views} to the rollups. Returns the rows written."""
+    keys = list(counts)
+    for i in range(0, len(keys), batch_size):
+        chunk = keys[i:i + batch_size]
+        existing = {
+            (row.post_id, row.start): row
+            for row in PostViewRollup.objects.filter(
+                period=period,
+                post_id__in={post_id for post_id, _ in chunk},
+                start__in={start for _, start in chunk},
+            )
+        }
+        updated = []
+        created = []
+        for key in chunk:
+            row = existing.get(key)
+            if row is None:
+                created.append(PostViewRollup(post_id=key[0], period=period, start=key[1], views=counts[key]))
+            else:
+                row.views += counts[key]
+                updated.append(row)
+        PostViewRollup.objects.bulk_update(updated, ['views'])
+        PostViewRollup.objects.bulk_create(created)
+    return len(keys)
+
+
+def _delete_before(queryset, field, cutoff, batch_size):
+    """Delete rows with field < cutoff, batch_size rows per DELETE"""
+    deleted = 0
+    while True:
+        ids = list(queryset.filter(**{f'{field}__lt': cutoff}).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
+
+
+def rollup(full=False, batch_size=1000, now=None):
+    """
+    Count new events into the hourly and daily rollups and prune expired
+    events and hourly rollups. With `full`, the rollups of the days still
+    covered by raw events are rebuilt from them instead. Returns a dict of
+    row counts.
+    """
+    now = now or timezone.now()
+    # Whole days, so no day is left with part of its events or hours
+    event_cutoff = _start_of_day(now - timedelta(days=getattr(settings, 'VIEW_EVENT_RETENTION_DAYS', 7)))
+    hour_cutoff = _start_of_day(now - timedelta(days=getattr(settings, 'VIEW_ROLLUP_HOURLY_RETENTION_DAYS', 90)))
+
+    with transaction.atomic():
+        state, _ = ViewRollupState.objects.select_for_update().get_or_create(pk=ViewRollupState.SINGLETON_ID)
+        last_id = ViewEvent.objects.aggregate(last=Max('pk'))['last'] or state.last_event_id
+        events = ViewEvent.objects.filter(pk__lte=last_id)
+        if full:
+            PostViewRollup.objects.filter(start__gte=event_cutoff).delete()
+            events = events.filter(viewed_at__gte=event_cutoff)
+        else:
+            events = events.filter(pk__gt=state.last_event_id)
+
+        written = {}
+        for period, trunc in ((PostViewRollup.HOUR, TruncHour), (PostViewRollup.DAY, TruncDay)):
+            counts = {
+                (post_id, start): views
+                for post_id, start, views in events.annotate(start=trunc('viewed_at'))
+                .order_by().values_list('post_id', 'start').annotate(views=Count('pk')).iterator()
+            }
+            written[period] = _add_counts(period, counts, batch_size)
+
+        state.last_event_id = last_id
+        state.save()
+
+    return {
+        'hours': written[PostViewRollup.HOUR],
+        'days': written[PostViewRollup.DAY],
+        # Late events logged after this run started are left for the next one
+        'events_pruned': _delete_before(
+            ViewEvent.objects.filter(pk__lte=last_id), 'viewed_at', event_cutoff, batch_size,
+        ),
+        'hours_pruned': _delete_before(
+            PostViewRollup.objects.filter(period=PostViewRollup.HOUR), 'start', hour_cutoff, batch_size,
+        ),
+    }
+
+
+def views_over_time(period, count, now=None, **filters):
+    """
+    [(start, views)] for the last `count` hours or days, zeros included,
+    summed over the rollups of the posts matching `filters` (e.g.
+    post_id=... or post__author_id=...).
+    """
+    now = now or timezone.now()
+    if period == PostViewRollup.HOUR:
+        step = timedelta(hours=1)
+        last = now.replace(minute=0, second=0, microsecond=0)
+    else:
+        step = timedelta(days=1)
+        last = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    first = last - step * (count - 1)
+    totals = dict(
+        PostViewRollup.objects.filter(period=period, start__gte=first, **filters)
+        .order_by().values_list('start').annotate(total=Sum('views'))
+    )
+    return [(first + step * i, totals.get(first + step * i, 0)) for i in range(count)]
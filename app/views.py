@@ -1,21 +1,33 @@
 from django.shortcuts import render
-from .models import Post, Comments, Tag, Profile, WebsiteMeta, Subscriber, ContentGenre, ContentType, SteamGame
+from .models import Post, Comments, Tag, Profile, Subscriber, ContentType, SteamGame, SteamSyncJob, AuthorStats
 from .forms import Commentforms, SubscriberForm, NewUserForm, PostForm, SteamIDForm
-from django.http import HttpResponseRedirect
+from .view_counter import view_counter
+from .view_events import view_log
+from .visitors import visitor_buffer
+from .comment_tree import load_comment_tree
+from .sidebar import get_sidebar, get_top_authors
+from .related import get_related_posts
+from .search import SearchResults
+from .pagination import paginate_request
+from .engagement import toggle_like, toggle_bookmark
+from .reference_data import get_content_types, get_website_meta
+from .genres import get_genre_map, get_genres
+from .page_cache import cache_anonymous_page
+from .jobs import enqueue_steam_sync
+from .steam_artwork import ArtworkUnavailable, get_artwork
+from django.http import HttpResponse, HttpResponseRedirect, FileResponse
 from django.urls import reverse
 from django.db import IntegrityError
-from django.contrib.auth.models import User
 from django.contrib.auth import login, authenticate
 from django.shortcuts import redirect, get_object_or_404
-from django.db.models import Count
 from django.contrib.auth.decorators import login_required
-from django.utils.text import slugify
+from django.views.decorators.http import require_POST
+from django.core.paginator import Paginator
 
 from django.contrib import messages
-from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.core.files.storage import default_storage
 
-import requests
-import os
 from django.http import JsonResponse
 from dotenv import load_dotenv
 
@@ -23,32 +35,35 @@ load_dotenv()
  
 
 def liked_post(request):
-    posts = Post.objects.filter(likes__in=[request.user.id])
+    posts = paginate_request(request, Post.objects.filter(likes__in=[request.user.id]).only('id', 'title', 'slug', 'created_at'))
     context = {'posts': posts}
     return render(request, 'app/liked_post.html', context)
 
-STEAM_API_KEY = os.getenv('STEAM_API_KEY', 'put-steam-api-key-here')
-STEAM_API_URL = "http://api.steampowered.com/IPlayerService/GetRecentlyPlayedGames/v0001/"
-
+SEARCH_RESULTS_PER_PAGE = 12
+SUBSCRIBED_COOKIE_AGE = 365 * 24 * 60 * 60
+ARTWORK_CACHE_MAX_AGE = 365 * 24 * 60 * 60
 
 
 def get_genres_by_content_type(request):
     """
     API endpoint to get genres for a specific content type
-    Used for dynamic dropdown loading
+    Used for dynamic dropdown loading. Served from the genre cache
+    (app/genres.py) with an ETag, so unchanged lists come back as 304.
     """
-    content_type_id = request.GET.get('content_type')
-    
-    if not content_type_id:
+    try:
+        content_type_id = int(request.GET.get('content_type', ''))
+    except ValueError:
         return JsonResponse({'genres': []})
-    
-    genres = ContentGenre.objects.filter(
-        content_type_id=content_type_id
-    ).values('id', 'name').order_by('name')
-    
-    return JsonResponse({
-        'genres': list(genres)
-    })
+    if content_type_id not in {content_type.pk for content_type in get_content_types()}:
+        return JsonResponse({'genres': []})
+
+    entry = get_genres(content_type_id)
+    response = get_conditional_response(request, etag=entry['etag'])
+    if response is None:
+        response = JsonResponse({'genres': entry['genres']})
+    response['ETag'] = entry['etag']
+    patch_cache_control(response, no_cache=True)
+    return response
 
 @login_required(login_url='account_login')
 def my_profile(request):
@@ -89,6 +104,20 @@ def recently_played(request):
     
     return render(request, 'app/recently_played.html', context)
 
+def steam_artwork(request, appid, image_hash, size):
+    """
+    Serve a Steam game logo/icon from the local artwork cache
+    """
+    try:
+        name = get_artwork(appid, image_hash, size)
+    except ArtworkUnavailable as e:
+        return HttpResponse(str(e), status=e.status, content_type='text/plain')
+
+    response = FileResponse(default_storage.open(name), content_type='image/jpeg')
+    # The URL changes with the artwork, so the file can be cached for good
+    patch_cache_control(response, public=True, max_age=ARTWORK_CACHE_MAX_AGE, immutable=True)
+    return response
+
 @login_required
 def content_sync(request):
     """
@@ -100,109 +129,26 @@ def content_sync(request):
     
     context = {
         'profile': profile,
+        'steam_sync_job': SteamSyncJob.objects.filter(user=request.user).first(),
     }
     return render(request, 'app/content_sync.html', context)
 
 
-def fetch_steam_games(steam_id):
-    """
-    Fetch games from Steam API with detailed error handling
-    """
-    STEAM_API_KEY = os.getenv('STEAM_API_KEY')
-    
-    steam_id = str(steam_id).strip()
-    
-    if not steam_id or not steam_id.isdigit():
-        raise ValueError(f"❌ Invalid Steam ID: {steam_id}")
-
-    STEAM_API_URL = "http://api.steampowered.com/IPlayerService/GetRecentlyPlayedGames/v0001/"
-    
-    params = {
-        'steamid': steam_id,
-        'key': STEAM_API_KEY,
-        'format': 'json',
-        'include_appinfo': True
-    }
-    
-    try:
-        response = requests.get(STEAM_API_URL, params=params, timeout=10)
-        
-        if response.status_code == 400:
-            raise ValueError("❌ Error 400: Bad Request. Invalid Steam ID format.")
-            
-        if response.status_code == 403:
-            raise ValueError("❌ Error 403: API Key invalid or domain mismatch.")
-            
-        if response.status_code != 200:
-            raise ValueError(f"❌ Steam API Error: {response.status_code}")
-        
-        data = response.json()
-        games = data.get('response', {}).get('games', [])
-        
-        # If 0 games, it's OK - just means no recently played games
-        # This can happen if:
-        # 1. Profile is private (despite settings showing public)
-        # 2. User hasn't played any games
-        # 3. Recently played list is empty
-        
-        print(f"DEBUG: Fetched {len(games)} games for Steam ID {steam_id}")
-        return games
-        
-    except requests.exceptions.RequestException as e:
-        raise ValueError(f"❌ Network Error: {str(e)}")
-    except Exception as e:
-        raise ValueError(f"❌ Error: {str(e)}")
-
-    
 @login_required
 def sync_steam(request):
     """
-    Handle Steam ID submission and sync
+    Save the submitted Steam ID and queue a sync; run_steam_worker does the rest
     """
     if request.method == 'POST':
         form = SteamIDForm(request.POST, instance=request.user.profile)
         
         if form.is_valid():
             profile = form.save()
-            
-            try:
-                games = fetch_steam_games(profile.steam_id)
-                
-                # Store games even if list is empty
-                for game in games:
-                    SteamGame.objects.update_or_create(
-                        user=request.user,
-                        appid=game['appid'],
-                        defaults={
-                            'name': game['name'],
-                            'playtime_2weeks': game.get('playtime_2weeks', 0),
-                            'playtime_forever': game.get('playtime_forever', 0),
-                            'img_icon_url': game.get('img_icon_url', ''),
-                            'img_logo_url': game.get('img_logo_url', ''),
-                        }
-                    )
-                profile.last_sync_time = timezone.now()
-                profile.save()
-                # Success message (even if 0 games)
-                if len(games) == 0:
-                    messages.warning(
-                        request,
-                        '⚠ Steam account connected but no recently played games found. '
-                        'This might mean your profile is private or you have no recently played games.'
-                    )
-                else:
-                    messages.success(
-                        request,
-                        f'✓ Steam account connected! Found {len(games)} games.'
-                    )
-                
-            except ValueError as e:
-                messages.error(request, str(e))
-                return redirect('app:content_sync')
-            except Exception as e:
-                messages.error(request, f'❌ Unexpected error: {str(e)}')
-                return redirect('app:content_sync')
-            
+            job, created = enqueue_steam_sync(request.user, profile.steam_id)
+            if created:
+                messages.info(request, '⏳ Steam sync queued. Your games will appear here in a moment.')
+            else:
+                messages.info(request, '⏳ A Steam sync is already in progress.')
             return redirect('app:content_sync')
         
         else:
@@ -212,11 +158,32 @@ def sync_steam(request):
     
     return redirect('app:content_sync')
 
+
+@login_required
+def steam_sync_status(request):
+    """
+    JSON status of the user's latest Steam sync job, polled by content_sync.html
+    """
+    job = SteamSyncJob.objects.filter(user=request.user).first()
+    if job is None:
+        return JsonResponse({'status': None})
+    return JsonResponse({
+        'status': job.status,
+        'active': job.is_active,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'error': job.last_error,
+        'games_inserted': job.games_inserted,
+        'games_updated': job.games_updated,
+        'games_removed': job.games_removed,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    })
+
 @login_required(login_url='account_login')
 def edit_profile(request):
     """Placeholder for edit profile - to be created later"""
     messages.info(request, 'Edit profile page coming soon!')
-    return redirect('my_profile')
+    return redirect('app:my_profile')
 
 
 @login_required
@@ -224,8 +191,7 @@ def create_post(request):
     """
     Create a new blog post with auto-generated slug.
     - Requires user to be logged in
-    - Auto-generates slug from title
-    - Handles duplicate slugs
+    - Auto-generates a unique slug from the title (see app/slugs.py)
     - Associates tags with the post
     """
     
@@ -239,19 +205,7 @@ def create_post(request):
             # Set the author to current user
             post.author = request.user
             
-            # Generate slug from title
-            base_slug = slugify(form.cleaned_data['title'])
-            slug = base_slug
-            counter = 1
-            
-            # Check if slug already exists, if yes, append number
-            while Post.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            
-            post.slug = slug
-            
-            # Save the post to database
+            # Save the post to database; Post.save picks a free slug
             post.save()
             
             # Save tags (many-to-many relationship)
@@ -265,49 +219,67 @@ def create_post(request):
         # GET request - show empty form
         form = PostForm()
     
-    context = {'form': form}
+    # Every content type's genres go in the page, so the genre dropdown can
+    # be filled without calling api_genres
+    context = {'form': form, 'genre_map': get_genre_map()}
     return render(request, 'app/create_post.html', context)
 
 def all_post(request):
-    posts = Post.objects.all()
+    posts = paginate_request(request, Post.objects.only('id', 'title', 'slug', 'created_at'))
     context = {'posts': posts}
     return render(request, 'app/all_posts.html', context)
 
 def your_post(request):
-    posts = Post.objects.filter(author=request.user)
+    posts = paginate_request(request, Post.objects.filter(author=request.user).only('id', 'title', 'slug', 'created_at'))
     context = {'posts': posts}
     return render(request, 'app/your_post.html', context)
 
 def all_bookmarked_post(request):
-    posts = Post.objects.filter(bookmarks__in=[request.user.id])
+    posts = paginate_request(request, Post.objects.filter(bookmarks__in=[request.user.id]).only('id', 'title', 'slug', 'created_at'))
     context = {'posts': posts}
     return render(request, 'app/all_bookmarked_post.html', context)
 
 
 def like_post(request, slug):
-    post = get_object_or_404(Post, slug=slug)
-    
-    
-    if post.likes.filter(id=request.user.id).exists():
-        post.likes.remove(request.user)
-        post.save()
-    else:
-        post.likes.add(request.user)
-        post.save()
+    """Form fallback for the like button; post.html uses api_like_post"""
+    post_id = get_object_or_404(Post.objects.values_list('id', flat=True), slug=slug)
+    if request.user.is_authenticated:
+        toggle_like(post_id, request.user.id)
     return HttpResponseRedirect(reverse('app:post_page', args=[str(slug)]))
 
 def bookmark_post(request, slug):
-    post = get_object_or_404(Post, slug=slug)
-    
-    
-    if post.bookmarks.filter(id=request.user.id).exists():
-        post.bookmarks.remove(request.user)
-        post.save()
-    else:
-        post.bookmarks.add(request.user)
-        post.save()
+    """Form fallback for the bookmark button; post.html uses api_bookmark_post"""
+    post_id = get_object_or_404(Post.objects.values_list('id', flat=True), slug=slug)
+    if request.user.is_authenticated:
+        toggle_bookmark(post_id, request.user.id)
     return HttpResponseRedirect(reverse('app:post_page', args=[str(slug)]))
 
+
+@require_POST
+def api_like_post(request, slug):
+    """
+    Toggle the current user's like on a post.
+    Returns the new state and like count as JSON
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Login required'}, status=401)
+    post_id = get_object_or_404(Post.objects.values_list('id', flat=True), slug=slug)
+    liked, count = toggle_like(post_id, request.user.id)
+    return JsonResponse({'liked': liked, 'count': count})
+
+
+@require_POST
+def api_bookmark_post(request, slug):
+    """
+    Toggle the current user's bookmark on a post.
+    Returns the new state and bookmark count as JSON
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Login required'}, status=401)
+    post_id = get_object_or_404(Post.objects.values_list('id', flat=True), slug=slug)
+    bookmarked, count = toggle_bookmark(post_id, request.user.id)
+    return JsonResponse({'bookmarked': bookmarked, 'count': count})
+
 def register_user(request):
     form = NewUserForm()
     if request.method == 'POST':
@@ -321,43 +293,49 @@ def register_user(request):
 
 
 def about(request):
-    website_info = None
-
-    if WebsiteMeta.objects.exists():
-        website_info = WebsiteMeta.objects.first()
+    website_info = get_website_meta()
 
     context = {'website_info': website_info}
     return render(request, 'app/about.html', context)
 
 
 def search_posts(request):
-    query = ''  # Get search query safely
+    query = request.GET.get('q', '').strip()
     results = []
-    
-    if request.GET.get('q'):  # Only search if query is provided
-        query = request.GET.get('q')
-        results = Post.objects.filter(
-            title__icontains=query
-        )
-    
-    context = {'results': results, 'query': query}
+    page = None
+
+    if query:  # Only search if query is provided
+        paginator = Paginator(SearchResults(query), SEARCH_RESULTS_PER_PAGE)
+        page = paginator.get_page(request.GET.get('page'))
+        results = page.object_list
+
+    context = {'results': results, 'query': query, 'page': page}
     return render(request, 'app/search.html', context)
 
 
+@cache_anonymous_page('blog')
 def author_page(request, slug):
-    author = Profile.objects.get(slug=slug)
-    top_posts = Post.objects.filter(author__in=[author.user.id]).order_by('-view_count')[0:3]
-    recent_posts = Post.objects.filter(author__in=[author.user.id]).order_by('-last_modified')[0:3]
+    # The profile, user and AuthorStats row in one query
+    author = get_object_or_404(Profile.objects.select_related('user__author_stats'), slug=slug)
+    try:
+        stats = author.user.author_stats
+    except AuthorStats.DoesNotExist:
+        stats = AuthorStats(user=author.user)
+    top_posts = Post.objects.cards().filter(author__in=[author.user.id]).order_by('-view_count')[0:3]
+    recent_posts = Post.objects.cards().filter(author__in=[author.user.id]).order_by('-last_modified')[0:3]
 
-    tags = Tag.objects.all()
-    posts = Post.objects.all()
-    context = {'author': author, 'author_slug': slug, 'top_posts': top_posts, 'recent_posts': recent_posts, 'tags': tags, 'posts': posts}
+    context = {
+        'author': author, 'author_slug': slug, 'stats': stats,
+        'top_posts': top_posts, 'recent_posts': recent_posts,
+        'top_authors': get_top_authors(author.user_id),
+    }
     return render(request, 'app/author.html', context)
 
+@cache_anonymous_page('blog')
 def tag_page(request, slug):
     tag = Tag.objects.get(slug=slug)
-    top_posts = Post.objects.filter(tags__in=[tag.id]).order_by('-view_count')[0:3]
-    recent_posts = Post.objects.filter(tags__in=[tag.id]).order_by('-last_modified')[0:3]
+    top_posts = Post.objects.cards().filter(tags__in=[tag.id]).order_by('-trending_score', '-id')[0:3]
+    recent_posts = Post.objects.cards().filter(tags__in=[tag.id]).order_by('-last_modified')[0:3]
 
     tags = Tag.objects.all()
     context = {'tag': tag, 'tag_slug': slug, 'top_posts': top_posts, 'recent_posts': recent_posts, 'tags': tags}
@@ -365,9 +343,17 @@ def tag_page(request, slug):
 
 
 
+def count_cached_view(request, meta):
+    """Count views of post pages served from the anonymous page cache"""
+    view_counter.record(meta['post_id'])
+    view_log.record(meta['post_id'])
+    visitor_buffer.record(meta['post_id'], request)
+
+
+@cache_anonymous_page('blog', on_hit=count_cached_view)
 def post_page(request, slug):
     post = Post.objects.get(slug=slug)
-    comments = Comments.objects.filter(post=post, parent=None)
+    comments = load_comment_tree(post, request.GET.get('comments_page'))
 
 
     form = Commentforms()
@@ -381,11 +367,9 @@ def post_page(request, slug):
     if post.bookmarks.filter(id=request.user.id).exists():
         is_bookmarked = True
 
-    # side bar
-    recent_posts = Post.objects.all().exclude(id=post.id).order_by('-last_modified')[0:3]
-    top_authors = User.objects.annotate(number =Count('post')).exclude(id=post.author.id).order_by('-number')[0:5]
-    tags = Tag.objects.all()
-    related_posts = Post.objects.filter(tags__in=post.tags.all()).exclude(id=post.id).distinct()[0:3]
+    # side bar (cached, see app/sidebar.py)
+    sidebar = get_sidebar(post)
+    related_posts = get_related_posts(post)
 
 
 
@@ -420,47 +404,44 @@ def post_page(request, slug):
             return HttpResponseRedirect(reverse('app:post_page', args=[slug]))
 
             
-    if post.view_count == 0:  
-        post.view_count = 1
-    else:
-        post.view_count += 1
-    post.save()
+    # Buffered write-behind; the row is updated in batches by view_counter
+    view_counter.record(post.id)
+    view_log.record(post.id)
+    visitor_buffer.record(post.id, request)
+    post.view_count = (post.view_count or 0) + view_counter.pending(post.id)
     
     context = {'post': post, 
                'form': form, 
-               'comments': comments, 
+               'comments': comments.page,
+               'comment_count': comments.total,
                'is_bookmarked': is_bookmarked, 
                'is_liked': is_liked, 
                'number_of_likes': number_of_likes,
-               'recent_posts': recent_posts,
-               'top_authors': top_authors,
-               'tags': tags,
-               'related_posts': related_posts,}
-    return render(request, 'app/post.html', context)
+               'related_posts': related_posts,
+               **sidebar}
+    response = render(request, 'app/post.html', context)
+    # Used by the anonymous page cache to count views of cached hits
+    response.page_cache_meta = {'post_id': post.id}
+    return response
+
 
+@cache_anonymous_page('blog')
 def home(request):
-    top_posts = Post.objects.all().order_by('-view_count')[0:3]
-    recent_posts = Post.objects.all().order_by('-last_modified')[0:3]
-    featured_posts = Post.objects.filter(is_featured=True)
+    top_posts = Post.objects.cards().order_by('-trending_score', '-id')[0:3]
+    recent_posts = Post.objects.cards().order_by('-last_modified')[0:3]
+    # Only the first featured post is shown; it keeps its content for the excerpt
+    featured_post = Post.objects.filter(is_featured=True).first()
     subscribe_form = SubscriberForm()
     
     subscribe_successful = None
-    featured_post = None
-    website_info = None
-
-    if WebsiteMeta.objects.exists():
-        website_info = WebsiteMeta.objects.first()
+    website_info = get_website_meta()
 
     # ✅ NEW: Handle form submission
-    if featured_posts:
-        featured_post = featured_posts[0]
-
     if request.POST and 'email' in request.POST:
         subscribe_form = SubscriberForm(request.POST)
         if subscribe_form.is_valid():
             try:
                 subscribe_form.save()
-                request.session['subscribed'] = True
                 subscribe_successful = 'subscribed successfully'  # Save to database
                 context = {
                     'top_posts': top_posts, 
@@ -471,7 +452,11 @@ def home(request):
                     'website_info': website_info,
                 }
                 
-                return render(request, 'app/home.html', context)
+                response = render(request, 'app/home.html', context)
+                # A cookie rather than the session, so anonymous visitors
+                # never get a session row and their pages stay cacheable
+                response.set_cookie('subscribed', '1', max_age=SUBSCRIBED_COOKIE_AGE, httponly=True, samesite='Lax')
+                return response
             except IntegrityError:
                 # Handle duplicate email (model has unique=True)
                 subscribe_form.add_error('email', 'Email already subscribed!')
@@ -0,0 +1,164 @@
+"""
+Unique visitors per post and per author, counted with HyperLogLog sketches.
+
+view_count counts every page load, reloads and the redirects of
+like_post/bookmark_post included. Distinct visitors are counted by adding
+an identifier of each visitor (the user id when logged in, otherwise a
+hash of address and user agent) to a HyperLogLog sketch
+(app/hyperloglog.py) per post per day, plus an all-time sketch whose
+estimate is kept in Post.unique_viewers for the post cards. The same
+visitors go into per-author sketches (AuthorVisitorSketch, estimate in
+AuthorStats.unique_visitors), so an author's reports read a handful of
+rows rather than merging the sketches of every post. A sketch stays below
+about 4 KB with ~1.6% error however many visitors it counts.
+
+Like view counts, visitors are buffered per process and written every
+VISITOR_FLUSH_INTERVAL seconds or VISITOR_FLUSH_THRESHOLD views and on
+exit. The flush folds each worker's buffer into the stored sketches under
+a row lock, and since merging is a register-wise max, sketches from any
+number of workers or days combine into the sketch of their union.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .hyperloglog import HyperLogLog, hash_value
+from .models import AuthorStats, AuthorVisitorSketch, Post, VisitorSketch
+from .view_counter import WriteBehindBuffer, flush_at_exit
+
+
+def visitor_id(request):
+    """Stable identifier of the visitor making a request"""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f"anon:{request.META.get('REMOTE_ADDR', '')}:{request.headers.get('User-Agent', '')}"
+
+
+class VisitorBuffer(WriteBehindBuffer):
+    """Pending visitor hashes keyed by (post_id, day)"""
+
+    interval_setting = 'VISITOR_FLUSH_INTERVAL'
+    threshold_setting = 'VISITOR_FLUSH_THRESHOLD'
+    description = 'buffered visits'
+
+    def empty(self):
+        return defaultdict(set)
+
+    def add(self, pending, post_id, request):
+        pending[(post_id, timezone.localdate())].add(hash_value(visitor_id(request)))
+        return 1
+
+    def restore(self, pending, batch):
+        for key, hashes in batch.items():
+            pending[key] |= hashes
+
+    def size(self, pending):
+        return sum(len(hashes) for hashes in pending.values())
+
+    def write(self, batch):
+        write(batch)
+
+
+def _merge_into(model, owner, additions):
+    """
+    Add {(owner_id, day): visitor hashes} to the sketches of `model`, whose
+    owner foreign key is the `owner` attname. Returns {owner_id: all-time
+    estimate} for the owners given all-time additions.
+    """
+    # Make sure every row exists, then lock them all before merging
+    model.objects.bulk_create(
+        [model(**{owner: owner_id}, day=day, sketch=HyperLogLog().to_bytes()) for owner_id, day in additions],
+        ignore_conflicts=True,
+    )
+    owner_ids = {owner_id for owner_id, _ in additions}
+    days = {day for _, day in additions if day is not None}
+    rows = [
+        row for row in model.objects.select_for_update()
+        .filter(Q(day__in=days) | Q(day__isnull=True), **{f'{owner}__in': owner_ids})
+        if (getattr(row, owner), row.day) in additions
+    ]
+
+    totals = {}
+    for row in rows:
+        sketch = HyperLogLog.from_bytes(row.sketch)
+        for hashed in additions[(getattr(row, owner), row.day)]:
+            sketch.add_hash(hashed)
+        row.sketch = sketch.to_bytes()
+        row.visitors = sketch.count()
+        if row.day is None:
+            totals[getattr(row, owner)] = row.visitors
+    model.objects.bulk_update(rows, ['sketch', 'visitors'])
+    return totals
+
+
+def write(batch):
+    """
+    Add {(post_id, day): visitor hashes} to the daily and all-time sketches
+    of the posts and their authors, and refresh Post.unique_viewers and
+    AuthorStats.unique_visitors.
+    """
+    authors = dict(Post.objects.filter(pk__in={post_id for post_id, _ in batch}).values_list('pk', 'author_id'))
+    post_additions = defaultdict(set)
+    author_additions = defaultdict(set)
+    for (post_id, day), hashes in batch.items():
+        post_additions[(post_id, day)] |= hashes
+        post_additions[(post_id, None)] |= hashes
+        author_id = authors.get(post_id)
+        if author_id is not None:
+            author_additions[(author_id, day)] |= hashes
+            author_additions[(author_id, None)] |= hashes
+
+    post_totals = _merge_into(VisitorSketch, 'post_id', post_additions)
+    Post.objects.bulk_update(
+        [Post(pk=post_id, unique_viewers=visitors) for post_id, visitors in post_totals.items()], ['unique_viewers'],
+    )
+    if author_additions:
+        author_totals = _merge_into(AuthorVisitorSketch, 'user_id', author_additions)
+        # Authors without an AuthorStats row yet are skipped by the update
+        AuthorStats.objects.bulk_update(
+            [AuthorStats(pk=user_id, unique_visitors=visitors) for user_id, visitors in author_totals.items()],
+            ['unique_visitors'],
+        )
+
+
+visitor_buffer = VisitorBuffer()
+flush_at_exit(visitor_buffer)
+
+
+def merged(sketches):
+    """Sketch of the union of several serialized sketches"""
+    result = HyperLogLog()
+    for data in sketches:
+        result.merge(HyperLogLog.from_bytes(data))
+    return result
+
+
+def unique_visitors(sketches, since=None):
+    """
+    Estimated distinct visitors counted by a queryset of VisitorSketch or
+    AuthorVisitorSketch rows (e.g. filtered by post_id=... or user_id=...),
+    over all time or from the date `since` on, by merging their sketches.
+    """
+    if since is None:
+        sketches = sketches.filter(day__isnull=True)
+    else:
+        sketches = sketches.filter(day__gte=since)
+    return merged(sketches.values_list('sketch', flat=True).iterator()).count()
+
+
+def daily_visitors(sketches, days):
+    """
+    [(day, estimated visitors)] for the last `days` days, zeros included,
+    from a queryset of sketches as for unique_visitors()
+    """
+    first = timezone.localdate() - timedelta(days=days - 1)
+    per_day = {}
+    for day, data in sketches.filter(day__gte=first).values_list('day', 'sketch').iterator():
+        per_day.setdefault(day, HyperLogLog()).merge(HyperLogLog.from_bytes(data))
+    series = []
+    for i in range(days):
+        day = first + timedelta(days=i)
+        series.append((day, per_day[day].count() if day in per_day else 0))
+    return series
@@ -0,0 +1,284 @@
+"""
+Per-request SQL instrumentation and a Prometheus metrics endpoint.
+
+QueryMetricsMiddleware wraps every database cursor while a request runs and
+records how many queries it issued, how long they took and how many were
+repeats of a query already run in the same request (same SQL with different
+parameters, the signature of an N+1 loop). The totals are sent back in a
+Server-Timing header, requests with many repeats are logged with the
+repeated SQL, and everything is added to per-view histograms.
+
+Each process keeps its histograms in memory and writes them to its own file
+in METRICS_DIR every METRICS_FLUSH_INTERVAL seconds and on exit. The
+metrics view adds up the files of all processes, so any gunicorn worker can
+answer a scrape with the totals of all of them. Files of exited workers are
+folded into one metrics-exited.json, so totals never go backwards but the
+directory doesn't grow with every restart.
+
+/metrics is only served with METRICS_TOKEN set, to scrapers sending it as a
+bearer token.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+HISTOGRAMS = {
+    'django_view_duration_seconds': ('Time spent handling a request', TIME_BUCKETS),
+    'django_view_queries': ('SQL queries issued per request', QUERY_BUCKETS),
+    'django_view_sql_seconds': ('Time spent in SQL per request', TIME_BUCKETS),
+    'django_view_duplicate_queries': ('Repeated SQL queries per request', QUERY_BUCKETS),
+}
+
+
+EXITED_FILE = 'metrics-exited.json'
+
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'blogapp-metrics')
+
+
+class QueryRecorder:
+    """execute_wrapper collecting the queries of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        return self.count - len(self.statements)
+
+
+class MetricsRegistry:
+    """This process's histograms, keyed by metric and view name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (metric, view) -> [bucket counts..., sum, count]
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._path = None
+
+    def observe(self, view, values):
+        with self._lock:
+            for metric, value in values.items():
+                buckets = HISTOGRAMS[metric][1]
+                entry = self._histograms.setdefault((metric, view), [0] * len(buckets) + [0, 0])
+                for i, bound in enumerate(buckets):
+                    if value <= bound:
+                        entry[i] += 1
+                entry[-2] += value
+                entry[-1] += 1
+            self._dirty = True
+            due = time.monotonic() - self._last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write this process's histograms to its file in METRICS_DIR"""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._dirty:
+                return
+            self._dirty = False
+            data = [[metric, view, entry] for (metric, view), entry in self._histograms.items()]
+            if self._path is None:
+                # Unique per process, so a reused pid never overwrites an older file
+                self._path = os.path.join(_metrics_dir(), f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+            path = self._path
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception("Failed to write metrics to %s", path)
+
+
+registry = MetricsRegistry()
+
+
+@atexit.register
+def _flush_on_exit():
+    registry.flush()
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _add(totals, data):
+    for metric, view, entry in data:
+        if metric not in HISTOGRAMS:
+            continue
+        total = totals.setdefault((metric, view), [0] * len(entry))
+        for i, value in enumerate(entry):
+            total[i] += value
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _file_pid(name):
+    """Pid of a metrics-<pid>-<id>.json file, None for other files"""
+    try:
+        return int(name.split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _merge_exited(directory, names):
+    """
+    Fold the files of processes that are gone into EXITED_FILE and delete
+    them, under a lock file so concurrent scrapes never count a file twice
+    """
+    exited = [name for name in names if _file_pid(name) is not None and not _is_running(_file_pid(name))]
+    if not exited:
+        return
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # Another worker may have merged some of them while we waited
+        exited = [name for name in exited if os.path.exists(os.path.join(directory, name))]
+        totals = {}
+        _add(totals, _read(os.path.join(directory, EXITED_FILE)))
+        for name in exited:
+            _add(totals, _read(os.path.join(directory, name)))
+        tmp_path = os.path.join(directory, f'{EXITED_FILE}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump([[metric, view, entry] for (metric, view), entry in totals.items()], f)
+        os.replace(tmp_path, os.path.join(directory, EXITED_FILE))
+        for name in exited:
+            os.remove(os.path.join(directory, name))
+
+
+def collect():
+    """Histograms of every process that wrote a metrics file, added up"""
+    directory = _metrics_dir()
+
+    def json_files():
+        try:
+            return [name for name in os.listdir(directory) if name.endswith('.json')]
+        except FileNotFoundError:
+            return []
+
+    try:
+        _merge_exited(directory, json_files())
+    except OSError:
+        logger.exception("Failed to merge the metrics of exited processes in %s", directory)
+    totals = {}
+    for name in json_files():
+        _add(totals, _read(os.path.join(directory, name)))
+    return totals
+
+
+def _label(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def render_prometheus(totals):
+    lines = []
+    for metric, (description, buckets) in HISTOGRAMS.items():
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} histogram')
+        for (name, view), entry in sorted(totals.items()):
+            if name != metric:
+                continue
+            view = _label(view)
+            for bound, cumulative in zip(buckets, entry):
+                lines.append(f'{metric}_bucket{{view="{view}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{view="{view}",le="+Inf"}} {entry[-1]}')
+            lines.append(f'{metric}_sum{{view="{view}"}} {entry[-2]:g}')
+            lines.append(f'{metric}_count{{view="{view}"}} {entry[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, for requests bearing METRICS_TOKEN"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    # Per-view names and timings are not for everyone; no token, no metrics
+    if not token or not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    registry.flush()
+    return HttpResponse(render_prometheus(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class QueryMetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        # Static files and unknown URLs are not views and are left out
+        match = request.resolver_match
+        if match is None or match.view_name == 'metrics':
+            return response
+        view = match.view_name
+
+        registry.observe(view, {
+            'django_view_duration_seconds': duration,
+            'django_view_queries': recorder.count,
+            'django_view_sql_seconds': recorder.duration,
+            'django_view_duplicate_queries': recorder.duplicates,
+        })
+
+        if recorder.duplicates >= getattr(settings, 'METRICS_DUPLICATE_QUERY_WARNING', 10):
+            sql, times = recorder.statements.most_common(1)[0]
+            logger.warning(
+                "%s ran %d queries, %d duplicates; most repeated (%dx): %s",
+                view, recorder.count, recorder.duplicates, times, sql[:500],
+            )
+
+        if getattr(settings, 'METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = (
+                f'sql;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries, '
+                f'{recorder.duplicates} duplicate", total;dur={duration * 1000:.1f}'
+            )
+        return response
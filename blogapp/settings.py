@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the queries of every other middleware are counted too
+    'blogapp.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -83,6 +85,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Wait for the write lock instead of failing with "database is locked"
+            'timeout': 20,
+        },
     }
 }
 
@@ -129,6 +135,80 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 LOGIN_REDIRECT_URL = 'app:home'
 
+# Caching. LocMemCache is per process, so cross-worker invalidation needs a
+# shared backend (Redis/Memcached) configured through CACHE_BACKEND/CACHE_LOCATION.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Longest time a worker serves WebsiteMeta/SiteSettings/ContentType from
+# memory without noticing an invalidation (see app/reference_data.py)
+REFERENCE_DATA_MAX_AGE = 60
+
+# Seconds the post_page sidebar blocks stay cached (see app/sidebar.py)
+SIDEBAR_CACHE_TIMEOUT = 300
+
+# Seconds the per-content-type genre lists stay cached (see app/genres.py)
+GENRE_CACHE_TIMEOUT = 3600
+
+# Seconds anonymous pages stay in the full-page cache (see app/page_cache.py)
+PAGE_CACHE_TIMEOUT = 300
+
+# Buffered post view counts (see app/view_counter.py)
+VIEW_COUNT_FLUSH_INTERVAL = int(os.getenv('VIEW_COUNT_FLUSH_INTERVAL', '10'))
+VIEW_COUNT_FLUSH_THRESHOLD = int(os.getenv('VIEW_COUNT_FLUSH_THRESHOLD', '500'))
+
+# Post view event log and its hourly/daily rollups (see app/view_events.py).
+# Run `manage.py rollup_view_events` every few minutes.
+VIEW_EVENT_FLUSH_INTERVAL = int(os.getenv('VIEW_EVENT_FLUSH_INTERVAL', '10'))
+VIEW_EVENT_FLUSH_THRESHOLD = int(os.getenv('VIEW_EVENT_FLUSH_THRESHOLD', '500'))
+VIEW_EVENT_RETENTION_DAYS = 7
+VIEW_ROLLUP_HOURLY_RETENTION_DAYS = 90
+
+# Unique visitor sketches per post (see app/visitors.py)
+VISITOR_FLUSH_INTERVAL = int(os.getenv('VISITOR_FLUSH_INTERVAL', '10'))
+VISITOR_FLUSH_THRESHOLD = int(os.getenv('VISITOR_FLUSH_THRESHOLD', '500'))
+
+# Trending scores for the home/tag top posts (see app/trending.py). Run
+# `manage.py renormalize_trending` daily; after changing the half-life or
+# weights, rebuild the scores with `manage.py renormalize_trending --rebuild`.
+TRENDING_HALF_LIFE_HOURS = 48
+TRENDING_WEIGHTS = {'view': 1, 'like': 5, 'comment': 8, 'post': 20}
+TRENDING_FLUSH_INTERVAL = 10
+TRENDING_FLUSH_THRESHOLD = 200
+
+# Top-level comment threads shown per page on a post (see app/comment_tree.py)
+COMMENT_THREADS_PER_PAGE = 20
+
+# Per-view SQL metrics (see blogapp/metrics.py). Every worker writes its
+# histograms to METRICS_DIR, which must be shared by all workers of a host.
+# /metrics requires "Authorization: Bearer <METRICS_TOKEN>" and is disabled
+# while METRICS_TOKEN is empty.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_FLUSH_INTERVAL = 5
+METRICS_DUPLICATE_QUERY_WARNING = 10
+METRICS_SERVER_TIMING = True
+
+# Steam Web API client and the sync job queue (see app/steam_client.py and app/jobs.py).
+# STEAM_API_URL and STEAM_MEDIA_URL can point at local stub servers for testing.
+STEAM_API_KEY = os.getenv('STEAM_API_KEY', '')
+STEAM_API_URL = os.getenv('STEAM_API_URL', 'http://api.steampowered.com/IPlayerService/GetRecentlyPlayedGames/v0001/')
+STEAM_API_TIMEOUT = 10
+STEAM_API_POOL_SIZE = 10
+STEAM_API_CACHE_TTL = 300
+STEAM_API_RATE_LIMIT = float(os.getenv('STEAM_API_RATE_LIMIT', '1.0'))  # requests/second per process
+STEAM_API_BURST = 5
+STEAM_API_CIRCUIT_THRESHOLD = 5
+STEAM_API_CIRCUIT_RESET = 60
+STEAM_MEDIA_URL = os.getenv('STEAM_MEDIA_URL', 'https://media.steampowered.com/steamcommunity/public/images/apps/')
+STEAM_SYNC_JOB_LEASE = 300
+STEAM_SYNC_RETRY_BASE_DELAY = 30
+STEAM_SYNC_RETRY_MAX_DELAY = 3600
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -21,6 +21,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 
+from blogapp.metrics import metrics
+
 urlpatterns = [
     path('', include('portfolio.urls')),
     path('accounts/logout/', auth_views.LogoutView.as_view(
@@ -29,4 +31,5 @@ urlpatterns = [
     path('accounts/', include('django.contrib.auth.urls')),
     path('admin/', admin.site.urls),
     path('blog/', include('app.urls')),
+    path('metrics', metrics, name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
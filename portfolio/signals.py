@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from app import page_cache
+from app.reference_data import reference_cache
+
+from .models import Experience, Project, SiteSettings, Skill
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+def invalidate_site_settings(sender, **kwargs):
+    """Make every worker reload SiteSettings after it is edited in the admin"""
+    transaction.on_commit(lambda: reference_cache.invalidate('site_settings'))
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Skill)
+@receiver(post_save, sender=Experience)
+@receiver(post_delete, sender=Experience)
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_portfolio_pages(sender, **kwargs):
+    """Drop the cached anonymous portfolio pages"""
+    transaction.on_commit(lambda: page_cache.invalidate('portfolio'))
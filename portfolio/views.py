@@ -2,8 +2,11 @@ from django.shortcuts import render
 from django.views.decorators.http import require_http_methods
 from .models import ContactEmail, SiteSettings, Skill, Experience, Project
 from django.contrib import messages
+from app.page_cache import cache_anonymous_page
+from app.reference_data import reference_cache
 
 @require_http_methods(["GET", "POST"])
+@cache_anonymous_page('portfolio')
 def portfolio_home(request):
     """Render portfolio home page with dynamic content from context"""
     if request.method == 'POST' and 'email' in request.POST:
@@ -19,7 +22,7 @@ def portfolio_home(request):
         else:
             messages.error(request, '❌ Please enter a valid email.')
     
-    settings = SiteSettings.load()
+    settings = reference_cache.get('site_settings', SiteSettings.load)
     
     # Fetch skills, experience, and projects (only active items)
     skills = Skill.objects.filter(is_active=True)
@@ -82,6 +85,7 @@ def portfolio_home(request):
 
 
 @require_http_methods(["GET"])
+@cache_anonymous_page('portfolio')
 def portfolio_projects(request):
     """Render portfolio projects page with all projects"""
     
@@ -107,9 +111,10 @@ def portfolio_projects(request):
 
 
 @require_http_methods(["GET"])
+@cache_anonymous_page('portfolio')
 def portfolio_about(request):
     """Render portfolio about page"""
-    settings = SiteSettings.load()
+    settings = reference_cache.get('site_settings', SiteSettings.load)
     
     context = {
         'name': settings.name,